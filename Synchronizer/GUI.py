@@ -35,6 +35,8 @@ import win32clipboard
 import wx
 
 import action
+import store
+import throttle
 
 
 
@@ -115,14 +117,18 @@ class MyListCtrl(wx.ListCtrl):
     _ACTION = 2
     _TAILLE = 3
     
+    _REFRESH_DELAY = 200
+    '''The delay between two refreshes of rows, in ms.'''
+    
     def __init__(self, parent):
         '''
         Constructor.
         @param parent: The parent.
         '''
-        wx.ListCtrl.__init__(self, parent, style=wx.LC_REPORT)
+        wx.ListCtrl.__init__(self, parent, style=wx.LC_REPORT | wx.LC_VIRTUAL)
         
-        self.actions = []
+        self.store = store.ActionStore()
+        '''The actions, displayed as virtual rows.'''
         
         # Column names
         self.InsertColumn(col=MyListCtrl._PATH, heading='Path', width=200)
@@ -137,6 +143,11 @@ class MyListCtrl(wx.ListCtrl):
         # Events
         self.Bind(event=wx.EVT_LIST_ITEM_RIGHT_CLICK, handler=self.OnItemRightClick)
         self.Bind(event=wx.EVT_LIST_KEY_DOWN, handler=self.OnKeyDown)
+        
+        # Refresh of rows, by batches
+        self._timer = wx.Timer(self)
+        self.Bind(event=wx.EVT_TIMER, handler=self.OnTimer, source=self._timer)
+        self._timer.Start(MyListCtrl._REFRESH_DELAY)
     
     
     def _getImageIndex(self, extension=''):
@@ -159,17 +170,55 @@ class MyListCtrl(wx.ListCtrl):
     
     def Add(self, action):
         '''
-        Add new action to list.
+        Add new action to list. Can be called from any thread: the row is displayed at the next refresh.
         @param action: The action.
         '''
-        self.actions.append(action)
-        
-        num = self.GetItemCount()
-        extension = action.getExtension()
-        self.InsertStringItem(index=num, label=action.relpath, imageIndex=self._getImageIndex(extension))
-        self.SetStringItem(index=num, col=MyListCtrl._EXTENSION, label='' if extension == 'folder' else extension)
-        self.SetStringItem(index=num, col=MyListCtrl._ACTION, label=action.getName())
-        self.SetStringItem(index=num, col=MyListCtrl._TAILLE, label=octet_to_human(action.getSize()))
+        self.store.add(action)
+    
+    
+    def OnTimer(self, event):
+        '''
+        Display the changes of store since the last refresh.
+        @param event: The event.
+        '''
+        if self.store.flush():
+            self.SetItemCount(len(self.store))
+            self.Refresh()
+    
+    
+    def OnGetItemText(self, item, col):
+        '''
+        Get the text of a visible cell.
+        @param item: The line index.
+        @param col: The column index.
+        @return The text.
+        '''
+        action = self.store[item]
+        if col == MyListCtrl._PATH:
+            return action.relpath
+        elif col == MyListCtrl._EXTENSION:
+            extension = action.getExtension()
+            return '' if extension == 'folder' else extension
+        elif col == MyListCtrl._ACTION:
+            return action.getName()
+        else:
+            return octet_to_human(action.getSize())
+    
+    
+    def OnGetItemImage(self, item):
+        '''
+        Get the image of a visible line.
+        @param item: The line index.
+        @return The image index.
+        '''
+        return self._getImageIndex(self.store[item].getExtension())
+    
+    
+    def DeleteAllItems(self):
+        '''Delete all lines, and the actions of store.'''
+        self.store.clear()
+        self.SetItemCount(0)
+        self.Refresh()
     
     
     def DeleteLine(self, index):
@@ -177,16 +226,22 @@ class MyListCtrl(wx.ListCtrl):
         Delete a line.
         @param index: The line index.
         '''
-        del self.actions[index]
-        self.DeleteItem(item=index)
+        self.store.removeRows([index])
+        self.SetItemCount(len(self.store))
+        self.Refresh()
     
     
     def DeleteSelectedLines(self):
         '''Delete the selected lines.'''
+        rows = []
         index = self.GetFirstSelected()
         while index != -1:
-            self.DeleteLine(index)
-            index = self.GetFirstSelected()
+            rows.append(index)
+            self.Select(index, on=False)
+            index = self.GetNextSelected(index)
+        self.store.removeRows(rows)
+        self.SetItemCount(len(self.store))
+        self.Refresh()
     
     
     def OnKeyDown(self, event):
@@ -224,7 +279,7 @@ class MyListCtrl(wx.ListCtrl):
         mItem_supLine = wx.MenuItem(parentMenu=menu, id=wx.ID_ANY, text='Supprimer la ligne')
         self.Bind(event=wx.EVT_MENU,
                    handler=lambda(event):
-                                 self.DeleteItem(item=ligne),
+                                 self.DeleteLine(ligne),
                    source=mItem_supLine)
         menu.AppendItem(item=mItem_supLine)
         
@@ -647,26 +702,28 @@ class SynchonizerFrame(wx.Frame):
         
         self._disableActionButtons()
         
+        # The rows pending in store are displayed, and executed
+        self.lCtrl.OnTimer(None)
+        actions = list(self.lCtrl.store)
+        
         # Thread
-        self.thread_maj = threading.Thread(target=self._onExecuteThread, name='Mise à jour des fichiers')
+        self.thread_maj = threading.Thread(target=self._onExecuteThread, args=(actions,), name='Mise à jour des fichiers')
         self.thread_maj.start()
     
     
-    def _onExecuteThread(self):
-        '''Thread who execute actions.'''
+    def _onExecuteThread(self, actions):
+        '''
+        Thread who execute actions.
+        @param actions: The actions of list, read by the GUI thread.
+        '''
         
-        self.chargement.SetRange(len(self.lCtrl.actions))
-        self.chargement.SetValue(0)
+        wx.CallAfter(self.chargement.SetRange, len(actions))
+        wx.CallAfter(self.chargement.SetValue, 0)
         
-        while len(self.lCtrl.actions) >= 1:
-            if self.stop: break
-            
-            action = self.lCtrl.actions[0]
-            action.execute()
-            self.lCtrl.DeleteLine(0)
-            self.chargement.Value += 1
+        self.lCtrl.store.execute(actions, self.preferences.throttle, self.preferences.bassePriorite,
+                                 progress=lambda done: wx.CallAfter(self.chargement.SetValue, done), stopped=lambda: self.stop)
         
-        self._enableActionButtons()
+        wx.CallAfter(self._enableActionButtons)
         
         self.stop = False
         self.thread_maj = None
@@ -700,9 +757,12 @@ class Preferences(wx.Frame):
         self.confirmationSuppression = True
         self.supprimerCible = True
         self.ignorerCiblePlusRecente = True
+        self.bassePriorite = False
+        self.throttle = throttle.Throttle()
+        '''The limits of execution, changed during the execution by the frame.'''
         
         # Fenêtre
-        sizeFenetre = wx.Size(w=275, h=150)
+        sizeFenetre = wx.Size(w=275, h=215)
         wx.Frame.__init__ (self, parent, title='Préférences', size=sizeFenetre)
         self.SetSizeHints(minW=sizeFenetre.GetWidth(), minH=sizeFenetre.GetHeight(), maxW=sizeFenetre.GetWidth(), maxH=sizeFenetre.GetHeight())
         
@@ -743,6 +803,18 @@ class Preferences(wx.Frame):
         self.cBox_ignorerCiblePlusRecente.SetValue(self.ignorerCiblePlusRecente)
         self.cBox_ignorerCiblePlusRecente.Bind(wx.EVT_CHECKBOX, self.OnCheckBox_ignorerCiblePlusRecente)
         self.sizer_panel.Add(self.cBox_ignorerCiblePlusRecente, flag=wx.ALL, border=5)
+        #                     Exécution en priorité basse
+        self.cBox_bassePriorite = wx.CheckBox(self.panel_fenetre, label=' Exécuter en priorité basse')
+        self.cBox_bassePriorite.SetValue(self.bassePriorite)
+        self.cBox_bassePriorite.Bind(wx.EVT_CHECKBOX, self.OnCheckBox_bassePriorite)
+        self.sizer_panel.Add(self.cBox_bassePriorite, flag=wx.ALL, border=5)
+        #                     Débit maximal
+        self.sizer_debit = wx.BoxSizer(orient=wx.HORIZONTAL)
+        self.sizer_debit.Add(wx.StaticText(self.panel_fenetre, label=' Débit maximal (Mo/s, 0 : illimité)'), flag=wx.ALIGN_CENTER_VERTICAL)
+        self.spin_debit = wx.SpinCtrl(self.panel_fenetre, min=0, max=10000, initial=0, size=wx.Size(w=70, h=-1))
+        self.spin_debit.Bind(wx.EVT_SPINCTRL, self.OnSpin_debit)
+        self.sizer_debit.Add(self.spin_debit, flag=wx.LEFT, border=5)
+        self.sizer_panel.Add(self.sizer_debit, flag=wx.ALL, border=5)
         
         self.Bind(wx.EVT_CLOSE, lambda event: self.Hide())
     
@@ -772,6 +844,24 @@ class Preferences(wx.Frame):
         '''
         self.ignorerCiblePlusRecente = self.cBox_ignorerCiblePlusRecente.IsChecked()
         event.Skip()
+    
+    
+    def OnCheckBox_bassePriorite(self, event):
+        '''
+        @brief Clic sur la case "Exécuter en priorité basse". Appliqué à la prochaine exécution.
+        @param event: Evémenement
+        '''
+        self.bassePriorite = self.cBox_bassePriorite.IsChecked()
+        event.Skip()
+    
+    
+    def OnSpin_debit(self, event):
+        '''
+        @brief Changement du débit maximal, appliqué immédiatement (même pendant l'exécution).
+        @param event: Evémenement
+        '''
+        self.throttle.setLimits(bytesPerSecond=self.spin_debit.GetValue() * 1024 * 1024 or None)
+        event.Skip()
 
 
 
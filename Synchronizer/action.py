@@ -17,40 +17,114 @@ __version__ = '2.0'
 
 
 import logging
+import logging.config
 import os
+import shutil
+import stat
 import threading
+import time
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
+import backend as backends
+import copyengine
+import delta
+import dirfd
+import hashing
+import index as treeindex
+import tracing
+import workers
+from backend import scan
+from copyengine import delete
 
-logging.config.fileConfig('logging.conf')
+
+
+logging.config.fileConfig(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logging.conf'))
 logger = logging.getLogger('synchronyzer')  # TODO: 'action'
 
 
 
-def delete(path):
+def isdir(st):
     '''
-    Delete the file or folder.
-    @param path: Path to object.
+    Test if the stat is a folder.
+    @param st: The stat, or None if the object doesn't exist.
     '''
-    
-    if os.path.isdir(path):
-        shutil.rmtree(path)
-    else:
-        os.remove(path)
+    return st is not None and stat.S_ISDIR(st.st_mode)
+
+
+
+def isfile(st):
+    '''
+    Test if the stat is a file.
+    @param st: The stat, or None if the object doesn't exist.
+    '''
+    return st is not None and stat.S_ISREG(st.st_mode)
+
+
+
+def allocated(st):
+    '''
+    Get the bytes allocated on disk by an object: less than its size for a sparse file.
+    @param st: The stat of object.
+    @return: The number of bytes.
+    '''
+    blocks = getattr(st, 'st_blocks', None)
+    if blocks is None:  # Windows
+        return st.st_size
+    return blocks * 512
+
+
+
+def rollup(path, st=None):
+    '''
+    Get the total size, number of files and allocated size of object, stating each object of folders once.
+    @param path: The path to object.
+    @param st: The stat of object, if already known.
+    @return: The tuple (size, number of files, allocated bytes).
+    '''
+    if st is None:
+        st = os.stat(path)
+    if not isdir(st):
+        return st.st_size, 1, allocated(st)
+    size = files = blocks = 0
+    for name, childStat in scan(path).items():
+        childSize, childFiles, childBlocks = rollup(os.path.join(path, name), childStat)
+        size += childSize
+        files += childFiles
+        blocks += childBlocks
+    return size, files, blocks
 
 
 
 class Action:
     '''The abstract class of actions.'''
     
+    engine = copyengine.CopyEngine()
+    '''The engine copying files and folders. Can be changed for all actions or for one.'''
+    backend = None
+    '''The backend.Backend of target folder, measuring the removed folders. None for a folder on disk.'''
     
-    def __init__(self, relpath, srcPath, tgtPath):
+    
+    def __init__(self, relpath, srcPath, tgtPath, srcStat=None, tgtStat=None):
         self.relpath = relpath
         '''The relative path to object.'''
         self.srcPath = srcPath
         '''The source folder.'''
         self.tgtPath = tgtPath
         '''The target folder.'''
+        self.srcStat = srcStat
+        '''The stat of source object, read during the analyze. None if unknown or inexistent.'''
+        self.tgtStat = tgtStat
+        '''The stat of target object, read during the analyze. None if unknown or inexistent.'''
+        self.size = None
+        '''The total size of object, in bytes. Computed during the analyze, else at the first need.'''
+        self.files = None
+        '''The number of files of object. Computed with size.'''
+        self.allocated = None
+        '''The bytes allocated on disk by object: the data transferred, without the holes of sparse files. Computed with size.'''
     
     
     def execute(self):
@@ -66,20 +140,17 @@ class Action:
         raise NotImplementedError
     
     
-    def _getSize(self, path):
+    def _measured(self):
         '''
-        Get the size of object.
-        @param path: The path to object.
-        @return: The size.
+        Get the object whose size is measured.
+        @return: The tuple (path, stat if known).
         '''
-        if os.path.isdir(path):
-            size = 0
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    size += os.path.getsize(os.path.join(root, file))
-            return size
-        else:
-            return os.path.getsize(path)
+        return self.srcPath, self.srcStat
+    
+    
+    def measure(self):
+        '''Compute the size, number of files and allocated bytes of object, browsing it once.'''
+        self.size, self.files, self.allocated = rollup(*self._measured())
     
     
     def getSize(self):
@@ -87,15 +158,43 @@ class Action:
         Get the size of the object.
         @return: The size.
         '''
-        return self._getSize(self.srcPath)
+        if self.size is None:
+            self.measure()
+        return self.size
+    
+    
+    def getFiles(self):
+        '''
+        Get the number of files of the object.
+        @return: The number.
+        '''
+        if self.files is None:
+            self.measure()
+        return self.files
+    
+    
+    def getAllocated(self):
+        '''
+        Get the bytes allocated on disk by the object.
+        @return: The number of bytes.
+        '''
+        if self.allocated is None:
+            self.measure()
+        return self.allocated
 
 
 
 class CopyAction(Action):
     '''Add the new file.'''
     
-    def __init__(self, relpath, srcPath, tgtPath):
-        Action.__init__(self, relpath, srcPath, tgtPath)
+    def __init__(self, relpath, srcPath, tgtPath, srcStat=None, tgtStat=None):
+        Action.__init__(self, relpath, srcPath, tgtPath, srcStat, tgtStat)
+        self.links = None
+        '''For a folder, the dictionary: path to source file -> path to target file with the same content, linked instead of copied.'''
+        self.linkMethod = copyengine.REFLINK
+        '''The link of files: copyengine.REFLINK or copyengine.HARDLINK.'''
+        self.requires = []
+        '''The relative paths to the objects of other actions, who must be written before.'''
     
     
     def getName(self):
@@ -103,19 +202,23 @@ class CopyAction(Action):
     
     
     def execute(self):
-        if os.path.isdir(self.srcPath):
-            shutil.copytree(self.srcPath, self.tgtPath)
-        else:
-            shutil.copy2(self.srcPath, self.tgtPath)
+        self.engine.copy(self.srcPath, self.tgtPath, self.links, self.linkMethod)
 
 
 
 class UpdateAction(Action):
     '''Replace the old object by the latest.'''
     
+    delta = False
+    '''Update the files by delta transfer: only the changed blocks are written.'''
+    deltaThreshold = 1024 * 1024
+    '''The minimal size of files updated by delta transfer.'''
+    
     
-    def __init__(self, relpath, srcPath, tgtPath):
-        Action.__init__(self, relpath, srcPath, tgtPath)
+    def __init__(self, relpath, srcPath, tgtPath, srcStat=None, tgtStat=None):
+        Action.__init__(self, relpath, srcPath, tgtPath, srcStat, tgtStat)
+        self.deltaStats = None
+        '''The result of delta transfer, None if the file was fully copied.'''
     
     
     def getName(self):
@@ -123,11 +226,12 @@ class UpdateAction(Action):
     
     
     def execute(self):
-        delete(self.tgtPath)
-        if os.path.isdir(self.srcPath):
-            shutil.copytree(self.srcPath, self.tgtPath)
-        else:
-            shutil.copy2(self.srcPath, self.tgtPath)
+        if self.delta and os.path.isfile(self.srcPath) and os.path.isfile(self.tgtPath) and os.path.getsize(self.tgtPath) >= self.deltaThreshold:
+            self.engine.settle(self.tgtPath)
+            self.deltaStats = delta.patch(self.srcPath, self.tgtPath, throttle=self.engine.throttle)
+            self.engine.recordWrite(self.tgtPath)
+            return
+        self.engine.replace(self.srcPath, self.tgtPath)
 
 
 
@@ -135,8 +239,8 @@ class RemoveAction(Action):
     '''Remove the old saved file.'''
     
     
-    def __init__(self, relpath, srcPath, tgtPath):
-        Action.__init__(self, relpath, srcPath, tgtPath)
+    def __init__(self, relpath, srcPath, tgtPath, srcStat=None, tgtStat=None):
+        Action.__init__(self, relpath, srcPath, tgtPath, srcStat, tgtStat)
     
     
     def getName(self):
@@ -144,15 +248,63 @@ class RemoveAction(Action):
     
     
     def execute(self):
-        delete(self.tgtPath)
+        self.engine.remove(self.tgtPath)
     
     
-    def getSize(self):
-        '''
-        Get the size of tgt object.
-        @return: The size.
-        '''
-        return self._getSize(self.tgtPath)
+    def _measured(self):
+        '''The target object is measured.'''
+        return self.tgtPath, self.tgtStat
+    
+    
+    def measure(self):
+        if self.backend is not None and isdir(self.tgtStat):
+            self.size, self.files, self.allocated = self.backend.measure(self.relpath)
+        else:
+            Action.measure(self)
+
+
+
+class LinkAction(Action):
+    '''Add the new file, as a link to a copied file with the same content.'''
+    
+    
+    def __init__(self, relpath, srcPath, tgtPath, srcStat=None, tgtStat=None, original=None, originalRelpath=None, method=copyengine.REFLINK):
+        Action.__init__(self, relpath, srcPath, tgtPath, srcStat, tgtStat)
+        self.original = original
+        '''The path to the target file with the same content.'''
+        self.method = method
+        '''The link: copyengine.REFLINK or copyengine.HARDLINK.'''
+        self.requires = [originalRelpath] if originalRelpath is not None else []
+        '''The relative path to the original, who must be written before.'''
+    
+    
+    def getName(self):
+        return 'Link'
+    
+    
+    def execute(self):
+        self.engine.link(self.original, self.tgtPath, self.srcPath, self.method)
+
+
+
+class RenameAction(Action):
+    '''Move the old saved object to the path of the latest, instead of removing it and copying the latest.'''
+    
+    
+    def __init__(self, relpath, srcPath, tgtPath, srcStat=None, tgtStat=None, fromRelpath=None, fromPath=None):
+        Action.__init__(self, relpath, srcPath, tgtPath, srcStat, tgtStat)
+        self.fromRelpath = fromRelpath
+        '''The relative path to the old saved object.'''
+        self.fromPath = fromPath
+        '''The path to the old saved object, in target folder.'''
+    
+    
+    def getName(self):
+        return 'Move'
+    
+    
+    def execute(self):
+        self.engine.rename(self.fromPath, self.tgtPath)
 
 
 
@@ -160,12 +312,50 @@ class Analyzer(threading.Thread):
     '''Thread to compare two folders and generate the actions.'''
     
     
-    def __init__(self, src, tgt):
+    MTIME = 'mtime'
+    '''Compare files by modification time.'''
+    CONTENT = 'content'
+    '''Compare files by size, then by digest of content.'''
+    
+    
+    def __init__(self, src, tgt, workers=1, ordered=False, index=None, compare=MTIME, hashCache=None, hashWorkers=4, metrics=None, tracer=None, subfolder='.', backend=None, dirFd=0):
         threading.Thread.__init__(self, target=self.run, name='Folder analyze')
         
         self.src = src
         self.tgt = tgt
-        self._stop = False
+        self.subfolder = subfolder
+        '''The relative path to the sub-folder analyzed, existing on both sides. The index is only saved for a whole analyze.'''
+        self.workers = workers
+        '''The number of threads browsing folders in parallel. 1 to browse from the analyze thread.'''
+        self.ordered = ordered
+        '''Give the actions to handler sorted by path, so the result is the same at each run.'''
+        self.index = index
+        '''The path to index file of both folders. If defined, the folders unchanged since the last analyze are not listed again.'''
+        self.srcIndex = None
+        '''The index of source folder, loaded when the analyze runs.'''
+        self.tgtIndex = None
+        '''The index of target folder, loaded when the analyze runs.'''
+        self.compare = compare
+        '''The comparison of files existing on both sides: MTIME or CONTENT.'''
+        self.hashCache = hashCache
+        '''The path to the digest cache file, used by the CONTENT comparison. None to keep it in memory.'''
+        self.hashWorkers = hashWorkers
+        '''The number of threads computing digests, while folders are browsed.'''
+        self.metrics = metrics
+        '''The metrics.Registry where the analyze is recorded, None to not record it.'''
+        self.tracer = tracer
+        '''The tracing.Tracer recording a span per folder, None to not trace.'''
+        self.backend = backend
+        '''The backend.Backend of target folder, None for the folder on disk. The CONTENT comparison needs a folder on disk.'''
+        self.dirFd = dirFd
+        '''The number of folders kept open, to list and stat the objects relative to their folder (dirfd.supported()). 0 to use the full paths.'''
+        self._backends = None  # Source and target backends
+        self._start = None
+        self._hashes = None
+        self._hashPool = None
+        self._stopRequested = False
+        self._handlerLock = threading.Lock()
+        self._buffer = None
         self.handler = None
         self.after = None
     
@@ -178,14 +368,65 @@ class Analyzer(threading.Thread):
         logger.info("Analyze running...")
         logger.info("Source: " + self.src)
         logger.info("Target: " + self.tgt)
-        self._execute('.')
+        self._start = time.time()
+        local = (lambda root: dirfd.DirFdBackend(root, self.dirFd)) if self.dirFd else backends.LocalBackend
+        self._backends = local(self.src), self.backend if self.backend is not None else local(self.tgt)
+        if self.metrics is not None:
+            entries = self.metrics.counter('synchronizer_entries_scanned_total')
+            self.metrics.gauge('synchronizer_entries_scanned_per_second', function=lambda: entries.get() / max(time.time() - self._start, 1e-6))
+        if self.index is not None:
+            self.srcIndex, self.tgtIndex = treeindex.load(self.index, self.src, self.tgt)
+        if self.ordered and (self.workers > 1 or self.compare == Analyzer.CONTENT):
+            self._buffer = []
+        if self.compare == Analyzer.CONTENT:
+            self._hashes = hashing.HashCache(self.hashCache)
+            self._hashPool = workers.WorkerPool(self.hashWorkers, 'File hash')
+        
+        if self.workers > 1:
+            self._executeParallel()
+        else:
+            self._execute(self.subfolder)
+        
+        if self._hashPool is not None:
+            hashPool, self._hashPool = self._hashPool, None
+            hashPool.join()
+            hashPool.close()
+            self._hashes.save()
+            logger.info("Digests: %d files read, %d cached" % (self._hashes.misses, self._hashes.hits))
+            if hashPool.errors:
+                raise hashPool.errors[0]
+        self._flushBuffer()
+        if self.index is not None and not self._stopRequested and self.subfolder == '.':
+            treeindex.save(self.index, self.src, self.tgt, self.srcIndex, self.tgtIndex)
+            logger.info("Index: %d folders listed, %d unchanged" % (self.srcIndex.misses + self.tgtIndex.misses, self.srcIndex.hits + self.tgtIndex.hits))
+        for storage in self._backends:
+            if storage is not self.backend:  # Closed by its owner
+                storage.close()
         if self.after is not None: self.after()
         logger.info("Analyze terminated.")
     
     
     def stop(self):
         '''Stop the analyze, and terminate the thread.'''
-        self._stop = True
+        self._stopRequested = True
+    
+    
+    def iterate(self, maxsize=1000):
+        '''
+        Run the analyze, and get the actions as they are found.
+        The analyze waits while maxsize actions are not consumed.
+        @param maxsize: The number of actions found in advance.
+        @return: The ActionStream, to use with "for" or "async for".
+        '''
+        return ActionStream(self, maxsize)
+    
+    
+    def __iter__(self):
+        return self.iterate()
+    
+    
+    def __aiter__(self):
+        return self.iterate()
     
     
     def _callHandler(self, action):
@@ -193,44 +434,353 @@ class Analyzer(threading.Thread):
         Call the handler.
         @param action: The action.
         '''
-        if self.handler is not None: self.handler(action)
+        with self._handlerLock:
+            if self._buffer is not None:
+                self._buffer.append(action)  # Recorded when given to handler, at the end
+                return
+            self._record('synchronizer_actions_total', type=action.__class__.__name__)
+            if self.handler is not None:
+                self.handler(action)
     
     
+    def _record(self, name, amount=1, **labels):
+        '''
+        Increase a counter of metrics, if recorded.
+        @param name: The name of counter.
+        @param amount: The increment.
+        @param labels: The labels of value.
+        '''
+        if self.metrics is not None:
+            self.metrics.counter(name).inc(amount, **labels)
+    
     
     def _execute(self, subfolder):
         '''
         Method who browse directories recursively.
         @param subfolder: The relative path to sub-folder.
         '''
-        srcFolder = os.path.join(self.src, subfolder)
-        tgtFolder = os.path.join(self.tgt, subfolder)
-        for obj in set(os.listdir(srcFolder) + os.listdir(tgtFolder)):
-            if self._stop:
+        self._analyzeFolder(subfolder, self._execute)
+    
+    
+    def _executeParallel(self):
+        '''
+        Browse directories with a pool of threads.
+        Each pair of sub-folders is a task of the shared queue.
+        @raise EnvironmentError: The first folder who can't be analyzed, after the other folders, like the sequential analyze.
+        '''
+        pool = workers.WorkerPool(self.workers, 'Folder analyze')
+        browse = lambda relpath: pool.submit(self._analyzeFolder, relpath, browse)
+        browse(self.subfolder)
+        pool.join()
+        pool.close()
+        if pool.errors:
+            raise pool.errors[0]
+    
+    
+    def _flushBuffer(self):
+        '''In ordered mode, give the actions kept until the end of analyze to handler, sorted by path.'''
+        if self._buffer is None:
+            return
+        actions = sorted(self._buffer, key=lambda action: action.relpath.split(os.sep))
+        self._buffer = None
+        for action in actions:
+            if self._stopRequested:
                 return
-            
-            relpath = os.path.join(subfolder, obj)
-            srcPath = os.path.join(self.src, relpath)
-            tgtPath = os.path.join(self.tgt, relpath)
-            
-            if not os.path.exists(srcPath):
-                if os.path.exists(tgtPath):
-                    self._callHandler(RemoveAction(relpath, srcPath, tgtPath))
-                else: pass  # ???
-            elif os.path.isfile(srcPath):
-                if not os.path.exists(tgtPath):
-                    self._callHandler(CopyAction(relpath, srcPath, tgtPath))
-                elif os.path.isfile(tgtPath):
-                    if os.path.getmtime(tgtPath) > os.path.getmtime(srcPath) + 0.0001:
-                        self._callHandler(UpdateAction(relpath, srcPath, tgtPath))
-                elif os.path.isdir(tgtPath):
-                    self._callHandler(UpdateAction(relpath, srcPath, tgtPath))
-                else: pass
-            elif os.path.isdir(srcPath):
-                if not os.path.exists(tgtPath):
-                    self._callHandler(CopyAction(relpath, srcPath, tgtPath))
-                elif os.path.isfile(tgtPath):
-                    self._callHandler(UpdateAction(relpath, srcPath, tgtPath))
-                elif os.path.isdir(tgtPath):
-                    self._execute(relpath)
-                else: pass
+            self._callHandler(action)
+    
+    
+    def _analyzeFolder(self, subfolder, browse):
+        '''
+        Compare the content of a folder.
+        Each folder is listed once per side, and each object is stated only once.
+        @param subfolder: The relative path to sub-folder.
+        @param browse: Function called with the relative path of each sub-folder existing on both sides.
+        '''
+        with tracing.span(self.tracer, 'folder', 'analyze', directory=subfolder) as span:
+            srcStats = self._scan(self._backends[0], self.srcIndex, subfolder)
+            tgtStats = self._scan(self._backends[1], self.tgtIndex, subfolder)
+            names = set(srcStats) | set(tgtStats)
+            span.args['entries'] = len(names)
+            actions = 0
+            self._record('synchronizer_entries_scanned_total', len(names))
+            if self.ordered:
+                names = sorted(names)
+            for obj in names:
+                if self._stopRequested:
+                    return
+                
+                relpath = os.path.join(subfolder, obj)
+                srcStat = srcStats.get(obj)
+                tgtStat = tgtStats.get(obj)
+                
+                if isdir(srcStat) and isdir(tgtStat):
+                    browse(relpath)
+                else:
+                    action = self._compare(relpath, srcStat, tgtStat)
+                    if action is not None:
+                        if self.backend is not None:
+                            action.backend = self.backend
+                        action.measure()
+                        actions += 1
+                        self._callHandler(action)
+                    elif isfile(srcStat) and isfile(tgtStat) and self.compare != Analyzer.CONTENT:
+                        self._record('synchronizer_bytes_total', srcStat.st_size, operation='skipped')
+            span.args['actions'] = actions
+    
+    
+    def _scan(self, storage, index, subfolder):
+        '''
+        List the content of a folder, from the index if the folder is unchanged.
+        @param storage: The backend of source or target folder.
+        @param index: The index of folder, None if not used.
+        @param subfolder: The relative path to sub-folder.
+        @return: The dictionary: object name -> stat of object.
+        '''
+        if index is None:
+            return self._list(storage, subfolder)
+        mtime = treeindex.mtimeNs(storage.stat(subfolder))
+        self._record('synchronizer_stat_calls_total')
+        stats = index.get(subfolder, mtime)
+        if stats is None:
+            stats = self._list(storage, subfolder)
+            index.put(subfolder, mtime, stats)
+        return stats
+    
+    
+    def _list(self, storage, subfolder):
+        '''
+        List the content of a folder, with one call to backend.
+        @param storage: The backend of source or target folder.
+        @param subfolder: The relative path to sub-folder.
+        @return: The dictionary: object name -> stat of object.
+        '''
+        with tracing.span(self.tracer, 'scan', 'analyze', directory=os.path.join(storage.root, subfolder)) as span:
+            stats = storage.listdir(subfolder)
+            span.args['entries'] = len(stats)
+        self._record('synchronizer_folders_listed_total')
+        self._record('synchronizer_stat_calls_total', len(stats))
+        return stats
+    
+    
+    def compareObject(self, relpath, srcStat, tgtStat):
+        '''
+        Compare a source and target object, who are not both folders, outside of run: for the changes of a watch.
+        The digests of CONTENT comparison are computed by the calling thread.
+        @param relpath: The relative path to object.
+        @param srcStat: The stat of source object, None if it doesn't exist.
+        @param tgtStat: The stat of target object, None if it doesn't exist.
+        @return: The measured action, None if there is nothing to do.
+        '''
+        if self.compare == Analyzer.CONTENT and self._hashes is None:
+            self._hashes = hashing.HashCache(self.hashCache)
+        action = self._compare(relpath, srcStat, tgtStat)
+        if action is not None:
+            if self.backend is not None:
+                action.backend = self.backend
+            action.measure()
+        return action
+    
+    
+    def _compare(self, relpath, srcStat, tgtStat):
+        '''
+        Compare the source and target object, who are not both folders.
+        @param relpath: The relative path to object.
+        @param srcStat: The stat of source object, None if it doesn't exist.
+        @param tgtStat: The stat of target object, None if it doesn't exist.
+        @return: The action, None if there is nothing to do.
+        '''
+        srcPath = os.path.join(self.src, relpath)
+        tgtPath = os.path.join(self.tgt, relpath)
+        
+        if srcStat is None:
+            if tgtStat is not None:
+                return RemoveAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+            else: pass  # ???
+        elif isfile(srcStat):
+            if tgtStat is None:
+                return CopyAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+            elif isfile(tgtStat):
+                if self.compare == Analyzer.CONTENT:
+                    if tgtStat.st_size != srcStat.st_size:
+                        return UpdateAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+                    if self._hashPool is None:  # Outside of run
+                        return self._compareDigests(relpath, srcPath, tgtPath, srcStat, tgtStat)
+                    self._hashPool.submit(self._compareContent, relpath, srcPath, tgtPath, srcStat, tgtStat)
+                elif tgtStat.st_mtime > srcStat.st_mtime + 0.0001:
+                    return UpdateAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+            elif isdir(tgtStat):
+                return UpdateAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+            else: pass
+        elif isdir(srcStat):
+            if tgtStat is None:
+                return CopyAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+            elif isfile(tgtStat):
+                return UpdateAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
             else: pass
+        else: pass
+        return None
+    
+    
+    def _compareContent(self, relpath, srcPath, tgtPath, srcStat, tgtStat):
+        '''
+        Compare the digests of two files of same size, from a thread of hash pool.
+        @param relpath: The relative path to file.
+        @param srcPath: The path to source file.
+        @param tgtPath: The path to target file.
+        @param srcStat: The stat of source file.
+        @param tgtStat: The stat of target file.
+        '''
+        if self._stopRequested:
+            return
+        action = self._compareDigests(relpath, srcPath, tgtPath, srcStat, tgtStat)
+        if action is not None:
+            action.measure()
+            self._callHandler(action)
+    
+    
+    def _compareDigests(self, relpath, srcPath, tgtPath, srcStat, tgtStat):
+        '''
+        Compare the digests of two files of same size.
+        @return: The UpdateAction, None if the contents are the same.
+        '''
+        if self._hashes.digest(srcPath, srcStat) != self._hashes.digest(tgtPath, tgtStat):
+            return UpdateAction(relpath, srcPath, tgtPath, srcStat, tgtStat)
+        self._record('synchronizer_bytes_total', srcStat.st_size, operation='skipped')
+        return None
+
+
+
+class ActionStream:
+    '''
+    The actions of an analyze, through a bounded queue: a slow consumer throttles the analyze.
+    Iterable by "for" or "async for". Closing the stream stops the analyze.
+    '''
+    
+    _END = object()
+    
+    
+    def __init__(self, analyzer, maxsize=1000):
+        '''
+        Constructor. Start the analyze.
+        @param analyzer: The analyzer, not started.
+        @param maxsize: The number of actions found in advance.
+        '''
+        self._analyzer = analyzer
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._ended = False
+        analyzer.handler = self._put
+        self._thread = threading.Thread(target=self._run, name='Folder analyze')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    
+    def _run(self):
+        try:
+            self._analyzer.run()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(ActionStream._END, force=True)
+    
+    
+    def _put(self, item, force=False):
+        '''
+        Add an item to queue, waiting for a free place.
+        Once the analyze is stopped, the actions are dropped, and the end takes the place of an action.
+        '''
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if not self._analyzer._stopRequested:
+                    continue
+                if not force:
+                    return
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    
+    def _get(self, block=True):
+        '''
+        Get the next action.
+        @raise StopIteration: The analyze is terminated.
+        @raise queue.Empty: No action available without waiting.
+        '''
+        if self._ended:
+            raise StopIteration
+        item = self._queue.get(block)
+        if item is ActionStream._END:
+            self._ended = True
+            if self._error is not None:
+                raise self._error
+            raise StopIteration
+        return item
+    
+    
+    def __iter__(self):
+        return self
+    
+    
+    def __next__(self):
+        return self._get()
+    
+    next = __next__  # Python 2
+    
+    
+    def __aiter__(self):
+        return self
+    
+    
+    def __anext__(self):
+        '''
+        Get the next action from a coroutine.
+        An available action is returned immediately, else it's waited in the default executor of loop.
+        @return: The awaitable action.
+        '''
+        import asyncio
+        try:
+            loop = asyncio.get_running_loop()
+        except (AttributeError, RuntimeError):
+            loop = asyncio.get_event_loop()
+        try:
+            future = loop.create_future()
+            future.set_result(self._get(False))
+            return future
+        except queue.Empty:
+            return loop.run_in_executor(None, self._getAsync)
+        except StopIteration:
+            raise StopAsyncIteration
+    
+    
+    def _getAsync(self):
+        try:
+            return self._get()
+        except StopIteration:
+            raise StopAsyncIteration
+    
+    
+    def close(self):
+        '''Stop the analyze, and wait its end.'''
+        self._analyzer.stop()
+        while not self._ended:
+            try:
+                self._get(False)
+            except queue.Empty:
+                self._thread.join(0.1)
+            except StopIteration:
+                pass
+            except Exception:
+                pass
+        self._thread.join()
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *exc):
+        self.close()
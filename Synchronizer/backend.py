@@ -0,0 +1,681 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Storage of folders, used by the analyze and the execution.
+LocalBackend reads the folder on disk. RemoteBackend forwards the operations to a Server through a socket:
+a folder is listed with the stats of its objects in one round trip, and the writes are sent by batches (BackendEngine).
+A remote target is written as URL "sync://host:port", and the server is started by "cli.py serve FOLDER".
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+
+try:
+    import socketserver
+except ImportError:  # Python 2
+    import SocketServer as socketserver
+
+import copyengine
+import index as treeindex
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'backend'
+
+
+
+SCHEME = 'sync://'
+'''The prefix of remote target URL.'''
+
+_HEADER = struct.Struct('!II')  # Length of JSON message, length of data following it
+
+_scandir = getattr(os, 'scandir', None)
+
+
+
+def scan(folder):
+    '''
+    List the content of folder, with only one stat per object.
+    Symbolic links are followed, and broken links are ignored (like os.path.exists).
+    @param folder: The path to folder.
+    @return: The dictionary: object name -> stat of object.
+    '''
+    stats = {}
+    if _scandir is not None:
+        for entry in _scandir(folder):
+            try:
+                stats[entry.name] = entry.stat()
+            except OSError:
+                pass
+    else:
+        for name in os.listdir(folder):
+            try:
+                stats[name] = os.stat(os.path.join(folder, name))
+            except OSError:
+                pass
+    return stats
+
+
+
+def urlOf(path):
+    '''
+    Get the server of a remote path.
+    @param path: The path, local or starting with a URL "sync://host:port".
+    @return: The URL, None for a local path.
+    '''
+    if not path.startswith(SCHEME):
+        return None
+    return SCHEME + path[len(SCHEME):].split('/', 1)[0]
+
+
+
+def connect(url, metrics=None):
+    '''
+    Create the backend of a remote target.
+    @param url: The URL "sync://host:port".
+    @param metrics: The metrics.Registry where the round trips are recorded, None to not record them.
+    @return: The RemoteBackend.
+    '''
+    host, port = url[len(SCHEME):].split('/', 1)[0].rsplit(':', 1)
+    return RemoteBackend((host, int(port)), metrics)
+
+
+
+class BackendError(Exception):
+    '''Operation failed on the backend, or invalid message.'''
+    pass
+
+
+
+class Backend:
+    '''
+    The abstract class of backends. The paths are relative to the root of backend.
+    The writes are operations (dictionaries with the key "op") applied by batches:
+    - {"op": "mkdir", "path", "mode", "mtime"}
+    - {"op": "put", "path", "offset", "start", "length"}, and "mode" and "mtime" for the last part of file; the content is data[start:start + length]
+    - {"op": "remove", "path"}
+    - {"op": "rename", "from", "path"}
+    - {"op": "link", "original", "path", "method"}
+    '''
+    
+    
+    def listdir(self, relpath):
+        '''
+        List the content of folder, with the stat of each object.
+        @param relpath: The relative path to folder.
+        @return: The dictionary: object name -> stat of object.
+        @raise OSError: The folder doesn't exist.
+        '''
+        raise NotImplementedError
+    
+    
+    def stat(self, relpath):
+        '''
+        Get the stat of object.
+        @param relpath: The relative path to object.
+        @return: The stat.
+        @raise OSError: The object doesn't exist.
+        '''
+        raise NotImplementedError
+    
+    
+    def measure(self, relpath):
+        '''
+        Get the total size, number of files and allocated size of object.
+        @param relpath: The relative path to object.
+        @return: The tuple (size, number of files, allocated bytes).
+        '''
+        raise NotImplementedError
+    
+    
+    def apply(self, operations, data=b''):
+        '''
+        Apply write operations, in order.
+        @param operations: The list of operations.
+        @param data: The content of files put by operations.
+        @return: The list of errors, as text: None for each operation succeeded.
+        '''
+        raise NotImplementedError
+    
+    
+    def close(self):
+        pass
+
+
+
+class LocalBackend(Backend):
+    '''Folder on disk.'''
+    
+    
+    def __init__(self, root, engine=None):
+        '''
+        Constructor.
+        @param root: The path to folder.
+        @param engine: The copyengine.CopyEngine removing, renaming and linking objects.
+        '''
+        self.root = root
+        self.engine = engine if engine is not None else copyengine.CopyEngine()
+    
+    
+    def _path(self, relpath):
+        '''
+        Get the path of object, refusing the paths out of root.
+        @param relpath: The relative path.
+        @return: The path.
+        '''
+        relpath = os.path.normpath(relpath)
+        if os.path.isabs(relpath) or relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            raise BackendError('Path out of folder: ' + relpath)
+        return os.path.join(self.root, relpath)
+    
+    
+    def listdir(self, relpath):
+        return scan(self._path(relpath))
+    
+    
+    def stat(self, relpath):
+        return os.stat(self._path(relpath))
+    
+    
+    def measure(self, relpath):
+        import action  # Imports this module
+        return action.rollup(self._path(relpath))
+    
+    
+    def apply(self, operations, data=b''):
+        errors = []
+        folders = []  # (path, mtime) of created folders, whose time is changed by their content
+        for operation in operations:
+            try:
+                self._apply(operation, data, folders)
+                errors.append(None)
+            except (EnvironmentError, BackendError, KeyError) as e:
+                logger.error('Operation failed: %s %s: %s' % (operation.get('op'), operation.get('path'), e))
+                errors.append(str(e))
+        for path, mtime in reversed(folders):
+            try:
+                os.utime(path, (mtime, mtime))
+            except OSError:
+                pass
+        return errors
+    
+    
+    def _apply(self, operation, data, folders):
+        '''
+        Apply a write operation.
+        @param operation: The operation.
+        @param data: The content of files put by operations.
+        @param folders: The list of created folders, with their time.
+        '''
+        op = operation['op']
+        path = self._path(operation['path'])
+        if op == 'put':
+            start = operation.get('start', 0)
+            with open(path, 'r+b' if operation['offset'] > 0 else 'wb') as f:
+                f.seek(operation['offset'])
+                f.write(data[start:start + operation.get('length', 0)])
+            if 'mtime' in operation:
+                os.chmod(path, operation['mode'])
+                os.utime(path, (operation['mtime'], operation['mtime']))
+            self.engine.recordWrite(path)
+        elif op == 'mkdir':
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            os.chmod(path, operation['mode'])
+            folders.append((path, operation['mtime']))
+            self.engine.recordWrite(path)
+        elif op == 'remove':
+            self.engine.remove(path)
+        elif op == 'rename':
+            self.engine.rename(self._path(operation['from']), path)
+        elif op == 'link':
+            original = self._path(operation['original'])
+            self.engine.link(original, path, original, operation['method'])  # Copied from the original if not linked
+        else:
+            raise BackendError('Unknown operation: ' + op)
+
+
+
+def _encodeStat(st):
+    return list(treeindex.Record.fromStat(st))
+
+
+
+def _decodeStat(values):
+    return treeindex.Record(*values)
+
+
+
+def _send(sock, message, data=b''):
+    '''
+    Send a message.
+    @param sock: The socket.
+    @param message: The JSON object.
+    @param data: The binary data following the message.
+    '''
+    text = json.dumps(message).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(text), len(data)) + text)
+    if data:
+        sock.sendall(data)
+
+
+
+def _receive(sock):
+    '''
+    Receive a message.
+    @param sock: The socket.
+    @return: The tuple (JSON object, binary data), None if the connection is closed.
+    '''
+    header = _read(sock, _HEADER.size)
+    if header is None:
+        return None
+    textLength, dataLength = _HEADER.unpack(header)
+    text = _read(sock, textLength)
+    data = _read(sock, dataLength) if dataLength else b''
+    if text is None or data is None:
+        raise BackendError('Connection closed in message')
+    return json.loads(text.decode('utf-8')), data
+
+
+
+def _read(sock, length):
+    '''@return: The bytes read, None if the connection is closed before.'''
+    chunks = []
+    while length > 0:
+        chunk = sock.recv(min(length, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+
+class RemoteBackend(Backend):
+    '''
+    Folder served by a Server, through a socket.
+    Each call is a round trip: a folder is listed with the stats of its objects at once, and the writes are applied by batches.
+    '''
+    
+    
+    def __init__(self, address, metrics=None):
+        '''
+        Constructor.
+        @param address: The tuple (host, port) of server.
+        @param metrics: The metrics.Registry where the round trips are recorded, None to not record them.
+        '''
+        self.address = address
+        self.root = '%s%s:%d' % (SCHEME, address[0], address[1])
+        self.metrics = metrics
+        self.roundTrips = 0
+        '''The number of requests sent to server.'''
+        self._socket = None
+        self._lock = threading.Lock()
+    
+    
+    def _call(self, request, data=b''):
+        '''
+        Send a request, and wait its response.
+        @param request: The JSON object, with the key "op".
+        @param data: The binary data of request.
+        @return: The result.
+        @raise OSError: The server raised an error on a filesystem call.
+        @raise BackendError: The server failed.
+        '''
+        with self._lock:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address)
+                self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                _send(self._socket, request, data)
+                received = _receive(self._socket)
+            except:
+                self._close()  # Else the rest of a reply read partially would be read by the next call
+                raise
+            if received is None:
+                self._close()
+                raise BackendError('Connection closed by server')
+            self.roundTrips += 1
+        if self.metrics is not None:
+            self.metrics.counter('synchronizer_backend_round_trips_total').inc(op=request['op'])
+        response = received[0]
+        if 'errno' in response:
+            raise OSError(response['errno'], response['error'])
+        if 'error' in response:
+            raise BackendError(response['error'])
+        return response['result']
+    
+    
+    def listdir(self, relpath):
+        return dict((name, _decodeStat(values)) for name, values in self._call({'op': 'list', 'path': relpath}).items())
+    
+    
+    def stat(self, relpath):
+        return _decodeStat(self._call({'op': 'stat', 'path': relpath}))
+    
+    
+    def measure(self, relpath):
+        return tuple(self._call({'op': 'measure', 'path': relpath}))
+    
+    
+    def apply(self, operations, data=b''):
+        return self._call({'op': 'apply', 'operations': operations}, data)
+    
+    
+    def close(self):
+        with self._lock:
+            self._close()
+    
+    
+    def _close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    '''The connection of a client: its requests are answered in order.'''
+    
+    
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            received = _receive(self.request)
+            if received is None:
+                return
+            try:
+                response = {'result': self.server.call(*received)}
+            except EnvironmentError as e:
+                response = {'error': str(e), 'errno': e.errno}
+            except (BackendError, KeyError) as e:
+                response = {'error': str(e)}
+            _send(self.request, response)
+
+
+
+class Server(socketserver.ThreadingTCPServer):
+    '''Serve a folder to RemoteBackend clients, with a thread per connection.'''
+    
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    
+    def __init__(self, root, address=('127.0.0.1', 0), engine=None):
+        '''
+        Constructor. The socket is bound: the port is chosen by system if 0.
+        @param root: The path to served folder.
+        @param address: The tuple (host, port) listened.
+        @param engine: The copyengine.CopyEngine of writes.
+        '''
+        socketserver.ThreadingTCPServer.__init__(self, address, _Handler)
+        self.backend = LocalBackend(root, engine)
+        self.requests = 0
+        '''The number of requests answered.'''
+    
+    
+    def url(self):
+        '''@return: The URL of server, for RemoteBackend.'''
+        host, port = self.server_address[:2]
+        return '%s%s:%d' % (SCHEME, host, port)
+    
+    
+    def call(self, request, data):
+        '''
+        Answer a request.
+        @param request: The JSON object.
+        @param data: The binary data of request.
+        @return: The result, as JSON object.
+        '''
+        self.requests += 1
+        op = request['op']
+        if op == 'list':
+            return dict((name, _encodeStat(st)) for name, st in self.backend.listdir(request['path']).items())
+        elif op == 'stat':
+            return _encodeStat(self.backend.stat(request['path']))
+        elif op == 'measure':
+            return list(self.backend.measure(request['path']))
+        elif op == 'apply':
+            errors = self.backend.apply(request['operations'], data)
+            self.backend.engine.flush()
+            return errors
+        raise BackendError('Unknown request: ' + op)
+
+
+
+class _Ticket:
+    '''The operations queued by a call of engine, finished when they are all applied.'''
+    
+    
+    def __init__(self):
+        self.pending = 0
+        '''The number of operations not applied yet.'''
+        self.failed = []
+        '''The list of operations failed, with their error: (operation, error).'''
+
+
+
+class BackendEngine:
+    '''
+    Engine of actions writing to a backend, in place of copyengine.CopyEngine.
+    The operations of actions are queued, and sent by batches: an action is finished when its operations are applied,
+    so it sends the batch, with the operations queued meanwhile by the other actions, and raises the errors of its own operations.
+    The batches are sent one by one, in the order of operations, so the order of Executor is kept.
+    '''
+    
+    
+    def __init__(self, backend, root, batchSize=256, batchBytes=8 * 1024 * 1024, bufferSize=1024 * 1024, throttle=None):
+        '''
+        Constructor.
+        @param backend: The Backend of target folder.
+        @param root: The target folder given to actions (the URL of remote backend): the paths of actions are relative to it.
+        @param batchSize: The number of operations sent at once.
+        @param batchBytes: The size of file contents sent at once.
+        @param bufferSize: The size of file parts.
+        @param throttle: The throttle.Throttle limiting the bytes sent and the file operations, None for no limit.
+        '''
+        self.backend = backend
+        self.root = root
+        self.batchSize = batchSize
+        self.batchBytes = batchBytes
+        self.bufferSize = bufferSize
+        self.throttle = throttle
+        self.batches = 0
+        '''The number of batches sent.'''
+        self._operations = []  # (operation, _Ticket)
+        self._data = []
+        self._length = 0
+        self._lock = threading.Lock()  # The queue
+        self._sending = threading.Lock()  # The batch sent
+    
+    
+    def _relpath(self, path):
+        '''@return: The path relative to root of backend.'''
+        if not path.startswith(self.root):
+            raise BackendError('Path out of target folder: ' + path)
+        return os.path.normpath(path[len(self.root):].lstrip('/' + os.sep) or '.')
+    
+    
+    def copy(self, src, dst, links=None, linkMethod=copyengine.REFLINK):
+        '''
+        Copy a file or a folder, with its content.
+        @param src: The path to source object.
+        @param dst: The path to target object.
+        @param links: The dictionary: path to source file -> path to target file, linked instead of copied.
+        @param linkMethod: copyengine.REFLINK or copyengine.HARDLINK.
+        @raise BackendError: An operation failed.
+        '''
+        self._run(self._copy, src, dst, links or {}, linkMethod)
+    
+    
+    def replace(self, src, dst):
+        '''
+        Replace an object by a copy of another one.
+        @param src: The path to source object.
+        @param dst: The path to target object.
+        @raise BackendError: An operation failed.
+        '''
+        self._run(self._replace, src, dst)
+    
+    
+    def remove(self, path):
+        self._run(self._queue, {'op': 'remove', 'path': self._relpath(path)})
+    
+    
+    def rename(self, src, dst):
+        self._run(self._queue, {'op': 'rename', 'from': self._relpath(src), 'path': self._relpath(dst)})
+    
+    
+    def link(self, original, dst, src, method=copyengine.REFLINK):
+        '''Link a file to a file with the same content, written before. The server copies the original if the link fails.'''
+        self._run(self._queue, {'op': 'link', 'original': self._relpath(original), 'path': self._relpath(dst), 'method': method})
+    
+    
+    def recordWrite(self, path):
+        pass
+    
+    
+    def settle(self, *paths):
+        pass
+    
+    
+    def flush(self):
+        '''Send the queued operations. Their errors are raised by their actions.'''
+        with self._sending:
+            self._send()
+    
+    
+    def _run(self, queue, *args):
+        '''
+        Queue the operations of an action, and wait they are applied.
+        @param queue: The function queuing the operations, called with a _Ticket and the arguments.
+        @param args: The arguments.
+        @raise BackendError: An operation failed.
+        '''
+        if self.throttle is not None:
+            self.throttle.operation()
+        ticket = _Ticket()
+        try:
+            queue(ticket, *args)
+        finally:
+            with self._sending:
+                if ticket.pending > 0:
+                    self._send()
+        if ticket.failed:
+            operation, error = ticket.failed[0]
+            raise BackendError('%d operations failed, first: %s %s: %s' % (len(ticket.failed), operation['op'], operation['path'], error))
+    
+    
+    def _replace(self, ticket, src, dst):
+        '''Queue the operations replacing an object.'''
+        self._queue(ticket, {'op': 'remove', 'path': self._relpath(dst)})
+        self._copy(ticket, src, dst, {}, copyengine.REFLINK)
+    
+    
+    def _copy(self, ticket, src, dst, links, linkMethod):
+        '''Queue the operations copying a file or a folder.'''
+        st = os.stat(src)
+        if not stat.S_ISDIR(st.st_mode):
+            self._put(ticket, src, self._relpath(dst), st)
+            return
+        for root, folders, names in os.walk(src, followlinks=True):
+            relpath = os.path.join(self._relpath(dst), os.path.relpath(root, src))
+            st = os.stat(root)
+            self._queue(ticket, {'op': 'mkdir', 'path': os.path.normpath(relpath), 'mode': stat.S_IMODE(st.st_mode), 'mtime': st.st_mtime})
+            folders.sort()
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                target = os.path.normpath(os.path.join(relpath, name))
+                if path in links:
+                    self._queue(ticket, {'op': 'link', 'original': self._relpath(links[path]), 'path': target, 'method': linkMethod})
+                else:
+                    self._put(ticket, path, target, os.stat(path))
+    
+    
+    def _put(self, ticket, src, relpath, st):
+        '''
+        Queue the operations writing a file, by parts.
+        @param ticket: The _Ticket of action.
+        @param src: The path to source file.
+        @param relpath: The relative path to target file.
+        @param st: The stat of source file.
+        '''
+        with open(src, 'rb') as f:
+            offset = 0
+            while True:
+                data = f.read(self.bufferSize)
+                if self.throttle is not None:
+                    self.throttle.transfer(len(data))
+                operation = {'op': 'put', 'path': relpath, 'offset': offset}
+                offset += len(data)
+                last = len(data) < self.bufferSize
+                if last:
+                    operation['mode'] = stat.S_IMODE(st.st_mode)
+                    operation['mtime'] = st.st_mtime
+                self._queue(ticket, operation, data)
+                if last:
+                    return
+    
+    
+    def _queue(self, ticket, operation, data=b''):
+        '''
+        Add an operation to batch, sent when it's full.
+        @param ticket: The _Ticket of action.
+        @param operation: The operation.
+        @param data: The content of file part.
+        '''
+        with self._lock:
+            if data:
+                operation['start'] = self._length
+                operation['length'] = len(data)
+                self._data.append(data)
+                self._length += len(data)
+            self._operations.append((operation, ticket))
+            ticket.pending += 1
+            full = len(self._operations) >= self.batchSize or self._length >= self.batchBytes
+        if full:
+            with self._sending:
+                self._send()
+    
+    
+    def _send(self):
+        '''Send the batch, and give its errors to the tickets of operations. Called with the lock of sending, so the batches are applied in order.'''
+        with self._lock:
+            if not self._operations:
+                return
+            queued = self._operations
+            data = b''.join(self._data)
+            self._operations = []
+            self._data = []
+            self._length = 0
+            self.batches += 1
+        operations = [operation for operation, _ in queued]
+        try:
+            errors = self.backend.apply(operations, data)
+        except (EnvironmentError, BackendError) as e:
+            logger.error('Batch of %d operations failed: %s' % (len(operations), e))
+            errors = [str(e)] * len(operations)
+        with self._lock:
+            for (operation, ticket), error in zip(queued, errors):
+                ticket.pending -= 1
+                if error is not None:
+                    ticket.failed.append((operation, error))
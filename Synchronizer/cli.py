@@ -0,0 +1,516 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Command line of Synchronizer, without GUI.
+The actions are written to stdout as JSON Lines, one object per action, as soon as they are found or executed.
+The last line is the summary.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import action
+import backend as backends
+import copyengine
+import dedup
+import dirfd
+import executor
+import hashing
+import metrics
+import moves
+import ordering
+import throttle
+import tracing
+import watcher
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'cli'
+
+
+
+_ACTIONS = dict((cls.__name__, cls) for cls in (action.CopyAction, action.UpdateAction, action.RemoveAction, action.RenameAction, action.LinkAction))
+
+
+
+def actionToJson(a):
+    '''
+    Convert an action to JSON object.
+    @param a: The action.
+    @return: The dictionary.
+    '''
+    obj = {'type': a.__class__.__name__,
+           'action': a.getName(),
+           'relpath': a.relpath,
+           'src': a.srcPath,
+           'tgt': a.tgtPath,
+           'size': a.size,
+           'files': a.files,
+           'allocated': a.allocated}
+    if isinstance(a, action.RenameAction):
+        obj['fromRelpath'] = a.fromRelpath
+        obj['from'] = a.fromPath
+    elif isinstance(a, action.LinkAction):
+        obj['original'] = a.original
+        obj['method'] = a.method
+    if getattr(a, 'links', None):
+        obj['links'] = a.links
+        obj['linkMethod'] = a.linkMethod
+    if getattr(a, 'requires', None):
+        obj['requires'] = a.requires
+    return obj
+
+
+
+def actionFromJson(obj):
+    '''
+    Create an action from JSON object.
+    @param obj: The dictionary.
+    @return: The action.
+    '''
+    a = _ACTIONS[obj['type']](obj['relpath'], obj['src'], obj['tgt'])
+    if isinstance(a, action.RenameAction):
+        a.fromRelpath = obj['fromRelpath']
+        a.fromPath = obj['from']
+    elif isinstance(a, action.LinkAction):
+        a.original = obj['original']
+        a.method = obj['method']
+    if 'links' in obj:
+        a.links = obj['links']
+        a.linkMethod = obj['linkMethod']
+    if 'requires' in obj:
+        a.requires = obj['requires']
+    a.size = obj.get('size')
+    a.files = obj.get('files')
+    a.allocated = obj.get('allocated')
+    return a
+
+
+
+class Output:
+    '''JSON Lines writer, shared by threads, with the counters of summary.'''
+    
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.start = time.time()
+        self.actions = 0
+        self.byType = {}
+        self.bytes = 0
+        self.allocated = 0
+        self.files = 0
+        self.errors = 0
+        self.saved = None
+        '''The bytes not copied by deduplication, None if not deduplicated.'''
+        self._lock = threading.Lock()
+    
+    
+    def write(self, obj):
+        '''
+        Write an object on a line.
+        @param obj: The dictionary.
+        '''
+        line = json.dumps(obj, sort_keys=True)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+    
+    
+    def writeAction(self, a, error=None, executed=False):
+        '''
+        Write an action, and count it in summary.
+        @param a: The action.
+        @param error: The exception of execution, None if succeeded.
+        @param executed: The action was executed: its status is written.
+        '''
+        obj = actionToJson(a)
+        if executed:
+            obj['status'] = 'ok' if error is None else 'error'
+            if error is not None:
+                obj['error'] = str(error)
+        with self._lock:
+            self.actions += 1
+            self.byType[obj['action']] = self.byType.get(obj['action'], 0) + 1
+            self.bytes += a.size or 0
+            self.allocated += a.allocated or 0
+            self.files += a.files or 0
+            if error is not None:
+                self.errors += 1
+        self.write(obj)
+    
+    
+    def writeSummary(self):
+        '''Write the last line.'''
+        summary = {'actions': self.actions,
+                   'byType': self.byType,
+                   'bytes': self.bytes,
+                   'allocated': self.allocated,
+                   'files': self.files,
+                   'errors': self.errors,
+                   'elapsed': round(time.time() - self.start, 3)}
+        if self.saved is not None:
+            summary['saved'] = self.saved
+        self.write({'summary': summary})
+
+
+
+def _analyzer(args):
+    return action.Analyzer(args.src, args.tgt,
+                           workers=args.workers,
+                           ordered=args.ordered,
+                           index=args.index,
+                           compare=args.compare,
+                           hashCache=args.hash_cache,
+                           metrics=args.registry,
+                           tracer=args.tracer,
+                           backend=args.backend,
+                           dirFd=args.dir_fd)
+
+
+
+def _executor(args):
+    '''
+    Create the executor, and the function who submits an action configured by command line.
+    @return: The tuple (executor, submit function).
+    '''
+    options = dict(staged=args.staged,
+                   durability=copyengine.Durability(args.fsync_every) if args.fsync_every else None,
+                   throttle=args.throttle,
+                   chunkThreshold=int(args.chunk_threshold or 0) or None,
+                   chunkWorkers=args.chunk_workers)
+    engine = dirfd.DirFdEngine(args.dir_fd, **options) if getattr(args, 'dir_fd', 0) else copyengine.CopyEngine(**options)
+    execution = executor.Executor(workers=args.jobs, keepResults=False, metrics=args.registry, tracer=args.tracer, lowPriority=args.low_priority)
+    remotes = {}  # URL of server -> BackendEngine
+    def submit(a):
+        url = backends.urlOf(a.tgtPath)
+        if url is None:
+            a.engine = engine
+        else:
+            if url not in remotes:
+                remotes[url] = backends.BackendEngine(backends.connect(url, args.registry), url, throttle=args.throttle)
+            a.engine = remotes[url]
+            a.backend = remotes[url].backend
+        if isinstance(a, action.UpdateAction):
+            a.delta = args.delta
+        execution.submit(a)
+    return execution, submit
+
+
+
+def _analyze(args, output, give):
+    '''
+    Analyze the folders, giving each action found to a function.
+    With move detection, deduplication or locality ordering, the actions they change are given at the end of analyze.
+    '''
+    analyzer = _analyzer(args)
+    kept = []
+    if args.dedup or args.locality:
+        analyzer.handler = kept.append
+    elif args.detect_moves:
+        analyzer.handler = lambda a: kept.append(a) if isinstance(a, (action.RemoveAction, action.CopyAction)) else give(a)
+    else:
+        analyzer.handler = give
+    try:
+        analyzer.run()
+    except KeyboardInterrupt:
+        analyzer.stop()
+        raise
+    if kept:
+        if args.detect_moves or args.dedup:
+            hashes = hashing.HashCache(args.hash_cache)
+            if args.detect_moves:
+                kept = moves.detect(kept, analyzer.srcIndex, hashes, compare=args.compare, hashCache=args.hash_cache)
+            if args.dedup:
+                kept, output.saved = dedup.plan(kept, hashes, args.dedup)
+            hashes.save()
+        if args.locality:
+            kept = ordering.order(kept, args.locality)
+        for a in kept:
+            give(a)
+
+
+
+def analyze(args, output):
+    '''Analyze the folders, and write the actions found.'''
+    _analyze(args, output, output.writeAction)
+
+
+
+def execute(args, output):
+    '''Execute the actions read from plan file (or stdin), and write their result.'''
+    execution, submit = _executor(args)
+    execution.handler = lambda a, error: output.writeAction(a, error, executed=True)
+    plan = sys.stdin if args.plan == '-' else open(args.plan)
+    try:
+        for line in plan:
+            if not line.strip():
+                continue
+            obj = json.loads(line)
+            if 'summary' not in obj:
+                submit(actionFromJson(obj))
+        execution.close()
+    except KeyboardInterrupt:
+        execution.stop()
+        execution.close()
+        raise
+    finally:
+        if plan is not sys.stdin:
+            plan.close()
+
+
+
+def sync(args, output):
+    '''Analyze the folders, executing each action as soon as it is found, and write their result.'''
+    execution, submit = _executor(args)
+    execution.handler = lambda a, error: output.writeAction(a, error, executed=True)
+    try:
+        _analyze(args, output, submit)
+        execution.close()
+    except KeyboardInterrupt:
+        execution.stop()
+        execution.close()
+        raise
+
+
+
+def watch(args, output):
+    '''Synchronize the folders continuously, from the changes of source folder, and write the result of actions.'''
+    execution, submit = _executor(args)
+    execution.handler = lambda a, error: output.writeAction(a, error, executed=True)
+    watch = watcher.Watcher(args.src, args.tgt, execution, delay=args.delay, reconcile=args.reconcile or None,
+                            workers=args.workers, ordered=args.ordered, index=args.index, compare=args.compare, hashCache=args.hash_cache,
+                            metrics=args.registry, tracer=args.tracer)
+    watch.handler = submit
+    watch.daemon = True
+    watch.start()
+    try:
+        while watch.is_alive():
+            watch.join(1)
+    except KeyboardInterrupt:
+        watch.stop()
+        watch.join()
+        execution.close()
+        raise
+    execution.close()
+
+
+
+def serve(args, output):
+    '''Serve a target folder to the synchronizations with URL "sync://host:port", until interrupted.'''
+    server = backends.Server(args.folder, (args.bind, args.port))
+    output.write({'url': server.url()})
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+
+def rate(text):
+    '''
+    Parse a rate of command line.
+    @param text: The number, with an optional suffix K, M or G (powers of 1024).
+    @return: The number per second, None for 0 (no limit).
+    '''
+    text = text.strip().upper()
+    factor = 1
+    if text and text[-1] in 'KMG':
+        factor = 1024 ** ('KMG'.index(text[-1]) + 1)
+        text = text[:-1]
+    try:
+        value = float(text) * factor
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid rate: ' + text)
+    if value < 0:
+        raise argparse.ArgumentTypeError('negative rate: ' + text)
+    return value or None
+
+
+
+def parser():
+    '''
+    Create the parser of command line.
+    @return: The parser.
+    '''
+    p = argparse.ArgumentParser(description='Synchronize two folders.')
+    p.add_argument('-v', '--verbose', action='store_true', help='write the logs (on stderr)')
+    p.add_argument('--metrics', help='write the metrics to JSON file')
+    p.add_argument('--metrics-prom', help='write the metrics to Prometheus textfile')
+    p.add_argument('--metrics-interval', type=float, default=0, help='rewrite the metrics files every N seconds during the run')
+    p.add_argument('--trace', help='write the spans of folders and actions to Chrome trace file')
+    p.add_argument('--profile', help='write the cProfile statistics of run to file')
+    p.add_argument('--trace-memory', help='write the top allocation sites of run (tracemalloc) to file')
+    p.set_defaults(registry=None, tracer=None, backend=None, throttle=None)  # The metrics.Registry, tracing.Tracer, RemoteBackend of target and throttle.Throttle, created by main
+    commands = p.add_subparsers(dest='command')
+    commands.required = True
+    
+    analyzeArgs = argparse.ArgumentParser(add_help=False)
+    analyzeArgs.add_argument('src', help='source folder')
+    analyzeArgs.add_argument('tgt', help='target folder, or URL sync://host:port of a server')
+    analyzeArgs.add_argument('--workers', type=int, default=1, help='threads browsing folders')
+    analyzeArgs.add_argument('--ordered', action='store_true', help='write actions sorted by path')
+    analyzeArgs.add_argument('--index', help='index file, to skip unchanged folders')
+    analyzeArgs.add_argument('--compare', choices=(action.Analyzer.MTIME, action.Analyzer.CONTENT), default=action.Analyzer.MTIME, help='comparison of files')
+    analyzeArgs.add_argument('--hash-cache', help='digest cache file, for content comparison, move detection and deduplication')
+    analyzeArgs.add_argument('--dedup', choices=(copyengine.REFLINK, copyengine.HARDLINK), help='link the copied files with the same content, instead of copying them')
+    analyzeArgs.add_argument('--detect-moves', action='store_true', help='move the target objects moved in source, instead of copying them again')
+    analyzeArgs.add_argument('--locality', nargs='?', const=ordering.FIEMAP, choices=(ordering.FIEMAP, ordering.INODE),
+                             help='sort the copies by location of files on source disk (rotating disks, best with -j 1)')
+    
+    executeArgs = argparse.ArgumentParser(add_help=False)
+    executeArgs.add_argument('-j', '--jobs', type=int, default=4, help='actions executed at the same time')
+    executeArgs.add_argument('--staged', action='store_true', help='write into temporary files renamed when complete')
+    executeArgs.add_argument('--fsync-every', type=int, default=0, help='synchronize written objects to disk by batches of N')
+    executeArgs.add_argument('--delta', action='store_true', help='update files by delta transfer')
+    executeArgs.add_argument('--bwlimit', type=rate, help='bytes copied per second (suffix K, M or G)')
+    executeArgs.add_argument('--ops-limit', type=rate, help='file operations per second')
+    executeArgs.add_argument('--limits', help='JSON file {"bwlimit": ..., "opsLimit": ...} reread during the run, to change the limits')
+    executeArgs.add_argument('--chunk-threshold', type=rate, default=256 * 1024 * 1024, help='size from which a file is copied by ranges in parallel (suffix K, M or G, 0: never)')
+    executeArgs.add_argument('--chunk-workers', type=int, default=4, help='threads copying the ranges of a file')
+    executeArgs.add_argument('--low-priority', action='store_true', help='execute at idle I/O priority and low CPU priority')
+    
+    folderArgs = argparse.ArgumentParser(add_help=False)
+    folderArgs.add_argument('--dir-fd', type=int, nargs='?', const=256, default=0, metavar='N',
+                            help='keep N folders open, and access the objects relative to their folder instead of by full path (deep trees)')
+    
+    commands.add_parser('analyze', parents=[analyzeArgs, folderArgs], help='write the actions to execute')
+    executeParser = commands.add_parser('execute', parents=[executeArgs, folderArgs], help='execute the actions written by analyze')
+    executeParser.add_argument('plan', nargs='?', default='-', help='file of actions (default: stdin)')
+    commands.add_parser('sync', parents=[analyzeArgs, executeArgs, folderArgs], help='analyze and execute')
+    watchParser = commands.add_parser('watch', parents=[analyzeArgs, executeArgs], help='synchronize continuously the changes of source (Linux)')
+    watchParser.add_argument('--delay', type=float, default=1.0, help='seconds without change before the changed paths are synchronized')
+    watchParser.add_argument('--reconcile', type=float, default=3600, help='seconds between two full analyzes (0: only at start)')
+    serveParser = commands.add_parser('serve', help='serve a target folder to remote synchronizations')
+    serveParser.add_argument('folder', help='served folder')
+    serveParser.add_argument('--bind', default='127.0.0.1', help='listened address')
+    serveParser.add_argument('--port', type=int, default=0, help='listened port (default: chosen by system, written on first line)')
+    return p
+
+
+
+def _writeMetrics(args):
+    '''Write the metrics files requested by command line.'''
+    if args.metrics:
+        args.registry.writeJson(args.metrics)
+    if args.metrics_prom:
+        args.registry.writePrometheus(args.metrics_prom)
+
+
+
+def _readLimits(args, done):
+    '''Apply the limits of file, each time it's modified, until done is set.'''
+    mtime = None
+    while True:
+        try:
+            current = os.stat(args.limits).st_mtime
+        except OSError:
+            current = None  # Not created yet: the limits of command line are kept
+        if current is not None and current != mtime:
+            mtime = current
+            try:
+                with open(args.limits) as f:
+                    limits = json.load(f)
+                args.throttle.setLimits(rate(str(limits.get('bwlimit') or 0)), rate(str(limits.get('opsLimit') or 0)))
+                logger.info('Limits: %s' % limits)
+            except (EnvironmentError, ValueError, AttributeError, argparse.ArgumentTypeError):
+                logger.exception('Limits not read')
+        if done.wait(1.0):
+            return
+
+
+
+def _reportMetrics(args, done):
+    '''Rewrite the metrics files periodically, until done is set.'''
+    while not done.wait(args.metrics_interval):
+        try:
+            _writeMetrics(args)
+        except EnvironmentError:
+            logger.exception('Metrics not written')
+
+
+
+def _run(args, output, profilers):
+    '''Run the command, inside the profilers.'''
+    if not profilers:
+        return {'analyze': analyze, 'execute': execute, 'sync': sync, 'watch': watch, 'serve': serve}[args.command](args, output)
+    with profilers[0]:
+        return _run(args, output, profilers[1:])
+
+
+
+def main(argv=None):
+    p = parser()
+    args = p.parse_args(argv)
+    # stdout is used by JSON Lines
+    for handler in logger.handlers + logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.stream = sys.stderr
+    logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    if args.command == 'watch' and not watcher.available():
+        p.error('watch needs inotify (Linux)')
+    url = backends.urlOf(getattr(args, 'tgt', ''))
+    if url is not None and (args.command == 'watch' or args.compare == action.Analyzer.CONTENT or args.detect_moves):
+        p.error('a remote target needs a local folder for watch, --compare content and --detect-moves')
+    if getattr(args, 'dir_fd', 0) and not dirfd.supported():
+        p.error('--dir-fd needs the dir_fd functions (POSIX, Python 3.7 or newer)')
+    
+    args.registry = metrics.Registry() if args.metrics or args.metrics_prom else None
+    if url is not None:
+        args.backend = backends.connect(url, args.registry)
+    args.tracer = tracing.Tracer() if args.trace else None
+    profilers = []
+    if args.profile:
+        profilers.append(tracing.Profile(args.profile))
+    if args.trace_memory:
+        if tracing.tracemalloc is None:
+            p.error('--trace-memory needs tracemalloc (Python 3.4 or newer)')
+        profilers.append(tracing.MemoryTrace(args.trace_memory))
+    done = threading.Event()
+    if hasattr(args, 'bwlimit') and (args.bwlimit or args.ops_limit or args.limits):
+        args.throttle = throttle.Throttle(args.bwlimit, args.ops_limit)
+        if args.limits:
+            limiter = threading.Thread(target=_readLimits, args=(args, done), name='Limits read')
+            limiter.daemon = True
+            limiter.start()
+    if args.registry is not None and args.metrics_interval > 0:
+        reporter = threading.Thread(target=_reportMetrics, args=(args, done), name='Metrics report')
+        reporter.daemon = True
+        reporter.start()
+    
+    output = Output(sys.stdout)
+    try:
+        _run(args, output, profilers)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        done.set()
+        output.writeSummary()
+        if args.registry is not None:
+            _writeMetrics(args)
+        if args.tracer is not None:
+            args.tracer.write(args.trace)
+    return 1 if output.errors else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
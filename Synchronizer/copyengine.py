@@ -0,0 +1,838 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Copy of files, with the fastest method supported by the filesystems.
+On Linux, the methods are tried in order: reflink (the blocks are shared), sparse copy (only the data of files with holes),
+parallel copy (the ranges of big files copied by several threads), copy_file_range and sendfile (the data stay in kernel),
+and finally a buffered copy.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import ctypes
+import ctypes.util
+import errno
+import itertools
+import logging
+import os
+import shutil
+import stat
+import sys
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'copyengine'
+
+
+
+FICLONE = 0x40049409
+'''The ioctl sharing the blocks of a file with another one (btrfs, XFS).'''
+
+REFLINK = 'reflink'
+HARDLINK = 'hardlink'
+SPARSE = 'sparse'
+PARALLEL = 'parallel'
+COPY_FILE_RANGE = 'copy_file_range'
+SENDFILE = 'sendfile'
+BUFFERED = 'buffered'
+
+_UNSUPPORTED = set(getattr(errno, name) for name in ('EXDEV', 'EOPNOTSUPP', 'ENOTSUP', 'ENOSYS') if hasattr(errno, name))
+'''The errors meaning the method can't be used between these filesystems: it isn't tried again for these devices.'''
+
+_FALLBACK = _UNSUPPORTED | set(getattr(errno, name) for name in ('EINVAL', 'ENOTTY', 'EBADF') if hasattr(errno, name))
+'''The errors meaning the method can't be used for this file (a special file, some flags of descriptor): the next one is tried.'''
+
+_UNLINKABLE = _FALLBACK | set(getattr(errno, name) for name in ('EPERM', 'EMLINK') if hasattr(errno, name))
+'''The errors meaning a file can't be linked to another one.'''
+
+
+
+try:
+    _fallocate = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True).fallocate64 if sys.platform.startswith('linux') else None
+except (OSError, AttributeError):  # Not glibc
+    _fallocate = None
+if _fallocate is not None:
+    _fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+
+
+
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+_SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+_SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+_stagedNumbers = itertools.count()
+
+
+
+def delete(path):
+    '''
+    Delete the file or folder.
+    @param path: Path to object.
+    '''
+    
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+
+def _stagedPath(path):
+    '''
+    Get an unused path, next to the object, to write temporary objects.
+    @param path: The path to object.
+    @return: The temporary path.
+    '''
+    folder, name = os.path.split(path)
+    return os.path.join(folder, '.%s.%d.%d.sync' % (name, os.getpid(), next(_stagedNumbers)))
+
+
+
+def _fsync(path):
+    '''Write to disk the content of file or folder.'''
+    if os.name == 'nt' and os.path.isdir(path):
+        return  # Folders can't be opened
+    fd = os.open(path, os.O_RDONLY | _O_BINARY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+
+class Durability:
+    '''
+    Write to disk the copied objects by batches, instead of one fsync per file.
+    At each flush, the files are synchronized, then the folders whose entries changed; then the staged objects are renamed over their target,
+    and the parent folders of targets are synchronized. So a renamed object is never incomplete after a crash.
+    The outcome of a rename is given to the function claiming its target (the Executor, for the action who wrote it):
+    a flush done during another action doesn't raise it.
+    '''
+    
+    
+    def __init__(self, every=1000):
+        '''
+        Constructor.
+        @param every: The number of objects after which the batch is flushed.
+        '''
+        self.every = every
+        self.files = 0
+        '''The number of files synchronized.'''
+        self.folders = 0
+        '''The number of folders synchronized.'''
+        self.commits = 0
+        '''The number of staged objects renamed over their target.'''
+        self._files = []
+        self._folders = set()
+        self._commits = []  # (function renaming the staged object, target path)
+        self._running = set()  # Target paths whose commit is taken by a flush
+        self._claims = {}  # Target path -> function called with the error of rename
+        self._failed = {}  # Target path -> error of rename not claimed yet
+        self._lock = threading.Lock()
+    
+    
+    def recordFile(self, path):
+        '''
+        Record a written file, whose data are synchronized.
+        @param path: The path to file.
+        '''
+        with self._lock:
+            self._files.append(path)
+            full = self._full()
+        if full:
+            self.flush()
+    
+    
+    def recordFolder(self, path):
+        '''
+        Record a folder whose entries changed.
+        @param path: The path to folder.
+        '''
+        with self._lock:
+            self._folders.add(os.path.abspath(path))
+            full = self._full()
+        if full:
+            self.flush()
+    
+    
+    def recordWrite(self, path):
+        '''
+        Record a new or replaced object, written outside of engine: the object, and its parent folder.
+        The content of a folder is recorded by its own writes.
+        @param path: The path to object.
+        '''
+        with self._lock:
+            if os.path.isdir(path):
+                self._folders.add(os.path.abspath(path))
+            else:
+                self._files.append(path)
+            self._folders.add(os.path.dirname(os.path.abspath(path)))
+            full = self._full()
+        if full:
+            self.flush()
+    
+    
+    def recordRemove(self, path):
+        '''
+        Record a removed object: its parent folder.
+        @param path: The path to object.
+        '''
+        self.recordFolder(os.path.dirname(os.path.abspath(path)))
+    
+    
+    def recordCommit(self, commit, path):
+        '''
+        Record a staged object, renamed over its target when the batch is synchronized.
+        @param commit: The function renaming the staged object, whose writes are already recorded.
+        @param path: The path to target.
+        '''
+        with self._lock:
+            self._commits.append((commit, os.path.abspath(path)))
+            full = self._full()
+        if full:
+            self.flush()
+    
+    
+    def claim(self, path, done):
+        '''
+        Take the outcome of the staged object renamed over a path.
+        @param path: The path to target.
+        @param done: The function called with the error of rename (None if renamed), now or by the flush renaming it.
+        @return: True if done is called, False if no staged object is waiting, or failed, for this path.
+        '''
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._failed:
+                error = self._failed.pop(path)
+            elif path in self._running or any(target == path for _, target in self._commits):
+                self._claims[path] = done
+                return True
+            else:
+                return False
+        done(error)
+        return True
+    
+    
+    def takeFailed(self):
+        '''
+        Take the errors of renames not claimed.
+        @return: The list of errors.
+        '''
+        with self._lock:
+            failed, self._failed = self._failed, {}
+        return list(failed.values())
+    
+    
+    def pending(self, path):
+        '''
+        Test if a staged object is not renamed yet over a path, over one of its parents, or under it.
+        @param path: The path to object.
+        '''
+        path = os.path.abspath(path)
+        with self._lock:
+            for _, target in self._commits:
+                if target == path or path.startswith(target + os.sep) or target.startswith(path + os.sep):
+                    return True
+        return False
+    
+    
+    def flush(self):
+        '''
+        Synchronize the recorded files and folders, rename the staged objects, then synchronize the parent folders of renamed objects.
+        The errors of renames are given to their claims, or kept for takeFailed.
+        '''
+        with self._lock:
+            files, self._files = set(self._files), []
+            folders, self._folders = self._folders, set()
+            commits, self._commits = self._commits, []
+            self._running.update(path for _, path in commits)
+        outcomes = []
+        try:
+            for path in files:
+                self._sync(path)
+            for path in sorted(folders, reverse=True):
+                self._sync(path)
+            parents = set()
+            for commit, path in commits:
+                try:
+                    commit()
+                    outcomes.append((path, None))
+                except EnvironmentError as e:
+                    logger.error('Staged object not renamed: %s: %s' % (path, e))
+                    outcomes.append((path, e))
+                parents.add(os.path.dirname(path))
+            for path in sorted(parents, reverse=True):
+                self._sync(path)
+            with self._lock:
+                self.files += len(files)
+                self.folders += len(folders) + len(parents)
+                self.commits += len(commits)
+        finally:
+            claimed = []
+            with self._lock:
+                self._commits[:0] = commits[len(outcomes):]  # Not tried after a failed synchronization: renamed by the next flush
+                self._running.difference_update(path for _, path in commits)
+                for path, error in outcomes:
+                    done = self._claims.pop(path, None)
+                    if done is not None:
+                        claimed.append((done, error))
+                    elif error is not None:
+                        self._failed[path] = error
+            for done, error in claimed:
+                done(error)
+    
+    
+    def _sync(self, path):
+        '''Synchronize an object, if it still exists.'''
+        try:
+            _fsync(path)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    
+    
+    def _full(self):
+        return len(self._files) + len(self._folders) + len(self._commits) >= self.every
+
+
+
+class CopyEngine:
+    '''
+    Copy files and folders.
+    For each pair of filesystems (source device, target device), the methods who failed are not tried again.
+    '''
+    
+    
+    def __init__(self, methods=(REFLINK, SPARSE, PARALLEL, COPY_FILE_RANGE, SENDFILE, BUFFERED), preallocate=True, bufferSize=1024 * 1024, staged=False, durability=None, throttle=None,
+                 chunkThreshold=256 * 1024 * 1024, chunkSize=64 * 1024 * 1024, chunkWorkers=4):
+        '''
+        Constructor.
+        @param methods: The methods to try, in order.
+        @param preallocate: Reserve the size of target file before writing it.
+        @param bufferSize: The size of blocks, for the buffered copy.
+        @param staged: Write the objects into a temporary sibling, renamed over the target when complete.
+        @param durability: The Durability who synchronizes the written objects, None to let the system do it.
+        @param throttle: The throttle.Throttle limiting the bytes copied and the file operations, None for no limit.
+        @param chunkThreshold: The size from which a file is copied by ranges in parallel, None to never split files.
+        @param chunkSize: The size of ranges.
+        @param chunkWorkers: The threads copying the ranges of a file.
+        '''
+        self.methods = methods
+        self.preallocate = preallocate
+        self.bufferSize = bufferSize
+        self.staged = staged
+        self.durability = durability
+        self.throttle = throttle
+        self.chunkThreshold = chunkThreshold
+        self.chunkSize = chunkSize
+        self.chunkWorkers = chunkWorkers
+        self.counts = {}
+        '''Dictionary: method -> number of files copied by this method.'''
+        self._unsupported = set()
+        self._lock = threading.Lock()
+    
+    
+    def copy(self, src, dst, links=None, linkMethod=REFLINK):
+        '''
+        Copy a file or a folder.
+        @param src: The path to source object.
+        @param dst: The path to new object.
+        @param links: For a folder, the dictionary: path to source file -> path to the target file with the same content, to link instead of copying.
+        @param linkMethod: HARDLINK or REFLINK.
+        '''
+        if self.staged:
+            stagedPath = _stagedPath(dst)
+            if links:  # The originals copied by this call are in the staged folder
+                prefix = dst + os.sep
+                links = dict((path, stagedPath + original[len(dst):] if original.startswith(prefix) else original) for path, original in links.items())
+            self._copy(src, stagedPath, links, linkMethod)
+            self._stage(stagedPath, dst, False)
+        else:
+            self._copy(src, dst, links, linkMethod)
+            self._recordFolder(os.path.dirname(os.path.abspath(dst)))
+    
+    
+    def link(self, original, dst, src, method=REFLINK):
+        '''
+        Create a file with the content of a target file, without copying the data.
+        If the filesystem can't link the files, the source file is copied.
+        A hard link shares the permissions and times of original file; a reflink gets the ones of source file.
+        @param original: The path to target file with the same content.
+        @param dst: The path to new file.
+        @param src: The path to source file.
+        @param method: HARDLINK or REFLINK.
+        @return: True if linked, False if copied.
+        '''
+        self._operation()
+        self.settle(original, dst)
+        try:
+            if method == HARDLINK:
+                os.link(original, dst)
+            else:
+                self._clone(original, dst)
+                shutil.copystat(src, dst)
+        except (IOError, OSError) as e:
+            if e.errno not in _UNLINKABLE:
+                raise
+            logger.debug("Link %s unsupported for %s: %s" % (method, dst, e))
+            if os.path.lexists(dst):
+                os.remove(dst)
+            self.copyFile(src, dst)
+            linked = False
+        else:
+            with self._lock:
+                self.counts[method] = self.counts.get(method, 0) + 1
+            linked = True
+        self._recordFile(dst)
+        self._recordFolder(os.path.dirname(os.path.abspath(dst)))
+        return linked
+    
+    
+    def replace(self, src, dst):
+        '''
+        Replace an object by the copy of another.
+        In staged mode, the old object is kept until the new one is complete: a file replacing a file is renamed over it atomically.
+        @param src: The path to source object.
+        @param dst: The path to object to replace.
+        '''
+        if not self.staged:
+            delete(dst)
+            self._copy(src, dst)
+            self._recordFolder(os.path.dirname(os.path.abspath(dst)))
+        else:
+            stagedPath = _stagedPath(dst)
+            self._copy(src, stagedPath)
+            self._stage(stagedPath, dst, True)
+    
+    
+    def remove(self, path):
+        '''
+        Delete a file or a folder.
+        @param path: The path to object.
+        '''
+        self._operation()
+        self.settle(path)
+        delete(path)
+        if self.durability is not None:
+            self.durability.recordRemove(path)
+    
+    
+    def rename(self, src, dst):
+        '''
+        Move an object of target.
+        @param src: The path to object.
+        @param dst: The new path to object, who must not exist.
+        '''
+        self._operation()
+        self.settle(src, dst)
+        os.rename(src, dst)
+        if self.durability is not None:
+            self.durability.recordRemove(src)
+            self.durability.recordRemove(dst)  # Its parent folder
+    
+    
+    def recordWrite(self, path):
+        '''
+        Record an object written outside of engine, to be synchronized with the next batch.
+        @param path: The path to object.
+        '''
+        if self.durability is not None:
+            self.durability.recordWrite(path)
+    
+    
+    def settle(self, *paths):
+        '''
+        Rename the staged objects not renamed yet over these paths (or their parents, or their content), before the paths are used.
+        @param paths: The paths to objects.
+        '''
+        if self.durability is not None and any(self.durability.pending(path) for path in paths):
+            self.durability.flush()
+    
+    
+    def flush(self):
+        '''
+        Synchronize the objects written since the last batch, and rename the staged objects over their target.
+        @raise EnvironmentError: A staged object was not renamed, and its error wasn't claimed (Durability.claim).
+        '''
+        if self.durability is not None:
+            self.durability.flush()
+            failed = self.durability.takeFailed()
+            if failed:
+                raise failed[0]
+    
+    
+    def _stage(self, stagedPath, dst, replace):
+        '''
+        Rename a complete staged object over its target: at once without durability, else once its writes are synchronized by the batch.
+        @param stagedPath: The path to staged object.
+        @param dst: The path to target.
+        @param replace: The target exists, and is replaced.
+        '''
+        if self.durability is None:
+            self._commit(stagedPath, dst, replace)
+        else:
+            self.durability.recordCommit(lambda: self._commit(stagedPath, dst, replace), dst)
+    
+    
+    def _commit(self, stagedPath, dst, replace):
+        '''Rename a staged object over its target, and delete it if the rename failed.'''
+        try:
+            if not replace or not os.path.lexists(dst):
+                os.rename(stagedPath, dst)
+            elif hasattr(os, 'replace') and os.path.isfile(stagedPath) and os.path.isfile(dst):
+                os.replace(stagedPath, dst)
+            else:
+                oldPath = _stagedPath(dst)
+                os.rename(dst, oldPath)
+                os.rename(stagedPath, dst)
+                delete(oldPath)
+        except:
+            if os.path.lexists(stagedPath):
+                delete(stagedPath)
+            raise
+    
+    
+    def _recordFile(self, path):
+        '''Record a file written by the engine.'''
+        if self.durability is not None:
+            self.durability.recordFile(path)
+    
+    
+    def _recordFolder(self, path):
+        '''Record a folder whose entries were changed by the engine.'''
+        if self.durability is not None:
+            self.durability.recordFolder(path)
+    
+    
+    def _copy(self, src, dst, links=None, linkMethod=REFLINK):
+        '''Copy a file or a folder, to a path who doesn't exist.'''
+        if not os.path.isdir(src):
+            self.copyFile(src, dst)
+            return
+        deferred = []
+        self.copyTree(src, dst, links, deferred)
+        # The original files are copied, wherever they are in the tree
+        for original, dstPath, srcPath in deferred:
+            self.link(original, dstPath, srcPath, linkMethod)
+        for folder in set(os.path.dirname(dstPath) for _, dstPath, _ in deferred):
+            shutil.copystat(os.path.join(src, os.path.relpath(folder, dst)), folder)
+    
+    
+    def copyTree(self, src, dst, links=None, deferred=None):
+        '''
+        Copy a folder recursively, like shutil.copytree (the symbolic links are followed).
+        @param src: The path to source folder.
+        @param dst: The path to new folder, who must not exist.
+        @param links: The dictionary: path to source file -> path to target file to link instead of copying.
+        @param deferred: The list where the links are added as tuples (original, target path, source path), to create after the copy.
+        '''
+        self._operation()
+        os.makedirs(dst)
+        for name in os.listdir(src):
+            srcPath = os.path.join(src, name)
+            dstPath = os.path.join(dst, name)
+            if stat.S_ISDIR(os.stat(srcPath).st_mode):
+                self.copyTree(srcPath, dstPath, links, deferred)
+            elif links and srcPath in links and deferred is not None:
+                deferred.append((links[srcPath], dstPath, srcPath))
+            else:
+                self.copyFile(srcPath, dstPath)
+        shutil.copystat(src, dst)
+        self._recordFolder(dst)
+    
+    
+    def _clone(self, src, dst):
+        '''Create a file sharing the blocks of another one.'''
+        if fcntl is None or not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOTSUP, 'Reflink unsupported')
+        srcFd = os.open(src, os.O_RDONLY | _O_BINARY)
+        try:
+            dstFd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY, 0o666)
+            try:
+                fcntl.ioctl(dstFd, FICLONE, srcFd)
+            finally:
+                os.close(dstFd)
+        finally:
+            os.close(srcFd)
+    
+    
+    def copyFile(self, src, dst):
+        '''
+        Copy a file, with its permissions and times, like shutil.copy2.
+        @param src: The path to source file.
+        @param dst: The path to target file.
+        '''
+        self._operation()
+        srcFd = os.open(src, os.O_RDONLY | _O_BINARY)
+        try:
+            size = os.fstat(srcFd).st_size
+            dstFd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | _O_BINARY, 0o666)
+            try:
+                self.copyFd(srcFd, dstFd, size)
+            finally:
+                os.close(dstFd)
+        finally:
+            os.close(srcFd)
+        shutil.copystat(src, dst)
+        self._recordFile(dst)
+    
+    
+    def copyFd(self, srcFd, dstFd, size):
+        '''
+        Copy the content of an opened file into an empty one.
+        @param srcFd: The descriptor of source file, at position 0.
+        @param dstFd: The descriptor of target file, empty.
+        @param size: The size of source file.
+        @return: The method used.
+        '''
+        devices = (os.fstat(srcFd).st_dev, os.fstat(dstFd).st_dev)
+        for method in self.methods:
+            if (method, devices) in self._unsupported:
+                continue
+            try:
+                if getattr(self, '_' + method)(srcFd, dstFd, size, devices):
+                    with self._lock:
+                        self.counts[method] = self.counts.get(method, 0) + 1
+                    return method
+            except (IOError, OSError) as e:
+                if e.errno not in _FALLBACK or method == BUFFERED:
+                    raise
+                if e.errno in _UNSUPPORTED:
+                    logger.debug("Copy method %s unsupported for devices %s: %s" % (method, devices, e))
+                    with self._lock:
+                        self._unsupported.add((method, devices))
+                else:
+                    logger.debug("Copy method %s failed for this file: %s" % (method, e))
+                # Restart from beginning
+                os.lseek(srcFd, 0, os.SEEK_SET)
+                os.lseek(dstFd, 0, os.SEEK_SET)
+                os.ftruncate(dstFd, 0)
+        raise IOError('No copy method available')
+    
+    
+    def _allocate(self, dstFd, size):
+        '''
+        Reserve the blocks of target file, only if its filesystem does it natively.
+        On Linux, posix_fallocate of glibc writes every block on the other filesystems, which doubles the writes of copy:
+        fallocate is called instead, failing without writing.
+        '''
+        if not self.preallocate or size <= 0:
+            return
+        if sys.platform.startswith('linux'):
+            if _fallocate is not None and _fallocate(dstFd, 0, 0, size) != 0:
+                code = ctypes.get_errno()
+                if code not in _FALLBACK:
+                    raise OSError(code, os.strerror(code))
+        elif hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(dstFd, 0, size)
+            except OSError as e:
+                if e.errno not in _FALLBACK:
+                    raise
+    
+    
+    def _operation(self):
+        '''Wait the limit of file operations.'''
+        if self.throttle is not None:
+            self.throttle.operation()
+    
+    
+    def _transfer(self, amount):
+        '''Wait the limit of bytes, after a part of file is copied.'''
+        if self.throttle is not None and self.throttle.bytes.rate is not None:
+            self.throttle.transfer(amount)
+    
+    
+    def _chunk(self, remaining):
+        '''@return: The bytes to copy at once in kernel: the whole file, or a buffer if the bytes are limited.'''
+        if self.throttle is not None and self.throttle.bytes.rate is not None:
+            return self.bufferSize
+        return max(remaining, self.bufferSize)
+    
+    
+    def _finish(self, dstFd, copied, size):
+        '''Truncate the target file if the source was smaller than expected, or the preallocation bigger.'''
+        if copied != size:
+            os.ftruncate(dstFd, copied)
+    
+    
+    def _reflink(self, srcFd, dstFd, size, devices):
+        if fcntl is None or not sys.platform.startswith('linux') or devices[0] != devices[1]:
+            return False
+        fcntl.ioctl(dstFd, FICLONE, srcFd)
+        return True
+    
+    
+    def _sparse(self, srcFd, dstFd, size, devices):
+        '''Copy the data extents of a file with holes (found by SEEK_DATA and SEEK_HOLE), and the zero blocks as holes.'''
+        st = os.fstat(srcFd)
+        if not sys.platform.startswith('linux') or getattr(st, 'st_blocks', None) is None or st.st_blocks * 512 >= size:
+            return False  # Not sparse
+        block = getattr(st, 'st_blksize', None) or 4096
+        end = 0
+        while True:
+            try:
+                start = os.lseek(srcFd, end, _SEEK_DATA)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                break  # Hole until the end of file
+            end = os.lseek(srcFd, start, _SEEK_HOLE)
+            os.lseek(srcFd, start, os.SEEK_SET)
+            offset = start
+            while offset < end:
+                data = os.read(srcFd, min(self.bufferSize, end - offset))
+                if not data:
+                    break
+                for i in range(0, len(data), block):
+                    chunk = data[i:i + block]
+                    if chunk.count(b'\0') != len(chunk):  # A zero block stays a hole
+                        os.lseek(dstFd, offset + i, os.SEEK_SET)
+                        while chunk:
+                            chunk = chunk[os.write(dstFd, chunk):]
+                offset += len(data)
+                self._transfer(len(data))
+        os.ftruncate(dstFd, max(size, end))
+        return True
+    
+    
+    def _parallel(self, srcFd, dstFd, size, devices):
+        '''
+        Copy a big file by ranges, each one by a thread at its offset, into the preallocated target.
+        If the source is smaller than expected, the target is truncated at the first range ended early; if it is bigger, the end is copied after the ranges.
+        '''
+        if not self.chunkThreshold or size < self.chunkThreshold or self.chunkWorkers < 2 or not hasattr(os, 'pread'):
+            return False
+        self._allocate(dstFd, size)
+        ranges = [(offset, min(self.chunkSize, size - offset)) for offset in range(0, size, self.chunkSize)]
+        ranges.reverse()  # Popped from the beginning of file
+        ends = []  # The offsets where the source ended
+        errors = []
+        lock = threading.Lock()
+        def work():
+            while True:
+                with lock:
+                    if errors or not ranges:
+                        return
+                    offset, length = ranges.pop()
+                try:
+                    copied = self._copyRange(srcFd, dstFd, offset, length, devices)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    return
+                if copied < length:
+                    with lock:
+                        ends.append(offset + copied)
+        threads = [threading.Thread(target=work, name='range-%d' % i) for i in range(min(self.chunkWorkers, len(ranges)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        copied = min(ends) if ends else size + self._copyRange(srcFd, dstFd, size, None, devices)
+        self._finish(dstFd, copied, size)
+        return True
+    
+    
+    def _copyRange(self, srcFd, dstFd, offset, length, devices):
+        '''
+        Copy a range of file at the same offset, by copy_file_range or by positional reads and writes.
+        @param offset: The offset of range.
+        @param length: The size of range, None until the end of source.
+        @return: The bytes copied, less than the size of range if the source ended.
+        '''
+        copied = 0
+        ranged = hasattr(os, 'copy_file_range')
+        while length is None or copied < length:
+            position = offset + copied
+            amount = self.bufferSize if length is None else min(self._chunk(length - copied), length - copied)
+            if ranged and (COPY_FILE_RANGE, devices) not in self._unsupported:
+                try:
+                    n = os.copy_file_range(srcFd, dstFd, amount, position, position)
+                except OSError as e:
+                    if e.errno not in _FALLBACK:
+                        raise
+                    ranged = False
+                    if e.errno in _UNSUPPORTED:
+                        logger.debug("Copy method %s unsupported for devices %s: %s" % (COPY_FILE_RANGE, devices, e))
+                        with self._lock:
+                            self._unsupported.add((COPY_FILE_RANGE, devices))
+                    continue
+            else:
+                data = memoryview(os.pread(srcFd, min(amount, self.bufferSize), position))
+                n = len(data)
+                written = 0
+                while written < n:
+                    written += os.pwrite(dstFd, data[written:], position + written)
+            if n == 0:
+                break
+            copied += n
+            self._transfer(n)
+        return copied
+    
+    
+    def _copy_file_range(self, srcFd, dstFd, size, devices):
+        if not hasattr(os, 'copy_file_range'):
+            return False
+        self._allocate(dstFd, size)
+        copied = 0
+        while True:
+            n = os.copy_file_range(srcFd, dstFd, self._chunk(size - copied))
+            if n == 0:
+                break
+            copied += n
+            self._transfer(n)
+        self._finish(dstFd, copied, size)
+        return True
+    
+    
+    def _sendfile(self, srcFd, dstFd, size, devices):
+        if not hasattr(os, 'sendfile') or not sys.platform.startswith('linux'):
+            return False
+        self._allocate(dstFd, size)
+        copied = 0
+        while True:
+            n = os.sendfile(dstFd, srcFd, copied, self._chunk(size - copied))
+            if n == 0:
+                break
+            copied += n
+            self._transfer(n)
+        self._finish(dstFd, copied, size)
+        return True
+    
+    
+    def _buffered(self, srcFd, dstFd, size, devices):
+        self._allocate(dstFd, size)
+        copied = 0
+        while True:
+            data = os.read(srcFd, self.bufferSize)
+            if not data:
+                break
+            before = copied
+            while data:
+                n = os.write(dstFd, data)
+                data = data[n:]
+                copied += n
+            self._transfer(copied - before)
+        self._finish(dstFd, copied, size)
+        return True
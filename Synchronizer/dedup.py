@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Deduplication of copied files, after the analyze.
+The files to copy are grouped by size, then by digest: only the first file of a group is copied,
+the others are created as links to it in target (reflinks, or hard links).
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import logging
+import os
+
+import action
+import copyengine
+import executor
+import hashing
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'dedup'
+
+
+
+MIN_SIZE = 4096
+'''The minimal size of files linked: a smaller file uses a block anyway.'''
+
+
+
+def _files(a):
+    '''
+    Get the files written by an action.
+    @param a: The CopyAction or UpdateAction.
+    @return: The list of tuples (relative path, source path, target path, source stat).
+    '''
+    if action.isfile(a.srcStat):
+        return [(a.relpath, a.srcPath, a.tgtPath, a.srcStat)]
+    if not action.isdir(a.srcStat) or a.__class__ is not action.CopyAction:
+        return []
+    files = []
+    for root, folders, names in os.walk(a.srcPath, followlinks=True):
+        folders.sort()
+        for name in sorted(names):
+            srcPath = os.path.join(root, name)
+            sub = os.path.relpath(srcPath, a.srcPath)
+            try:
+                st = os.stat(srcPath)
+            except OSError:
+                continue
+            files.append((os.path.join(a.relpath, sub), srcPath, os.path.join(a.tgtPath, sub), st))
+    return files
+
+
+
+def plan(actions, hashes=None, method=copyengine.REFLINK, minSize=MIN_SIZE):
+    '''
+    Link the copied files with the same content.
+    The first file of each group, in order of execution, is copied; the others wait for it.
+    A new file becomes a LinkAction; a file of a copied folder is linked by the CopyAction of folder.
+    A hard link shares the permissions and times of the first file: only the files with the same modification time are hard linked,
+    else the next analyze would update the link.
+    @param actions: The actions of analyze.
+    @param hashes: The hashing.HashCache of digests, None for a cache in memory.
+    @param method: copyengine.REFLINK or copyengine.HARDLINK.
+    @param minSize: The minimal size of files linked.
+    @return: The tuple (list of actions in order of execution, number of bytes not copied).
+    '''
+    if hashes is None:
+        hashes = hashing.HashCache()
+    actions = sorted(actions, key=executor.sortKey)
+    bySize = {}  # Size -> files: (action, relpath, source path, target path, stat)
+    for a in actions:
+        if isinstance(a, (action.CopyAction, action.UpdateAction)):
+            for relpath, srcPath, tgtPath, st in _files(a):
+                if st.st_size >= minSize:
+                    bySize.setdefault(st.st_size, []).append((a, relpath, srcPath, tgtPath, st))
+    
+    replaced = {}  # CopyAction of file -> LinkAction
+    saved = 0
+    for size, files in bySize.items():
+        if len(files) < 2:
+            continue
+        originals = {}  # Digest -> first file
+        for entry in files:
+            a, relpath, srcPath, tgtPath, st = entry
+            key = hashes.digest(srcPath, st)
+            if method == copyengine.HARDLINK:
+                key = (key, st.st_mtime)
+            original = originals.setdefault(key, entry)
+            if original is entry:
+                continue
+            if action.isdir(a.srcStat):  # Linked after the copy of folder
+                a.links = a.links or {}
+                a.links[srcPath] = original[3]
+                a.linkMethod = method
+                if a is not original[0]:
+                    a.requires.append(original[1])
+                a.size = (a.size or 0) - size
+                a.allocated = (a.allocated or 0) - action.allocated(st)
+            elif a.__class__ is action.CopyAction:
+                link = action.LinkAction(a.relpath, a.srcPath, a.tgtPath, a.srcStat, a.tgtStat, original[3], original[1], method)
+                link.size, link.files, link.allocated = a.size, a.files, a.allocated
+                replaced[a] = link
+            else:
+                continue  # An updated file replaces the old one
+            saved += size
+    logger.info('Deduplication: %d bytes not copied' % saved)
+    return [replaced.get(a, a) for a in actions], saved
@@ -0,0 +1,347 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Delta transfer of files, in the spirit of rsync.
+The target file is cut into blocks, whose signatures are searched in the source with a rolling checksum:
+the blocks found are kept from the old target, and only the other bytes are read from source and written.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import copyengine
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'delta'
+
+
+
+BLOCK_SIZE = 64 * 1024
+'''The default size of blocks.'''
+
+CHUNK_SIZE = 4 * 1024 * 1024
+'''The size of source reads.'''
+
+_MOD = 65521
+
+
+
+class DeltaStats:
+    '''The result of a delta transfer.'''
+    
+    
+    def __init__(self):
+        self.reused = 0
+        '''The number of bytes found in the old target.'''
+        self.literal = 0
+        '''The number of bytes not found in the old target, read from source.'''
+        self.written = 0
+        '''The number of bytes written to target: the literal bytes, and the blocks reused at another offset.'''
+        self.blocks = 0
+        '''The number of target blocks reused.'''
+
+
+
+def weakChecksum(data):
+    '''
+    Get the rolling checksum of data (Adler-32).
+    @param data: The bytes.
+    @return: The checksum.
+    '''
+    return zlib.adler32(bytes(data)) & 0xffffffff
+
+
+
+def roll(checksum, outByte, inByte, blockSize):
+    '''
+    Move the window of a checksum by one byte.
+    @param checksum: The checksum of window.
+    @param outByte: The first byte of window, who leaves it.
+    @param inByte: The byte following the window, who enters it.
+    @param blockSize: The size of window.
+    @return: The checksum of the new window.
+    '''
+    a = ((checksum & 0xffff) - outByte + inByte) % _MOD
+    b = ((checksum >> 16) - blockSize * outByte + a - 1) % _MOD
+    return (b << 16) | a
+
+
+
+def strongChecksum(data):
+    '''
+    Get the strong checksum of data, used to confirm a weak match.
+    @param data: The bytes.
+    @return: The digest.
+    '''
+    return hashlib.md5(bytes(data)).digest()
+
+
+
+def signatures(f, blockSize=BLOCK_SIZE):
+    '''
+    Compute the signatures of the blocks of a file.
+    @param f: The file, opened in binary mode.
+    @param blockSize: The size of blocks.
+    @return: The dictionary: weak checksum -> list of (strong checksum, block index, block length).
+    '''
+    result = {}
+    index = 0
+    while True:
+        block = f.read(blockSize)
+        if not block:
+            break
+        result.setdefault(weakChecksum(block), []).append((strongChecksum(block), index, len(block)))
+        index += 1
+    return result
+
+
+
+class _Output:
+    '''The new file, written by positioned writes over the content of old target.'''
+    
+    
+    def __init__(self, out, tgt, sigs, blockSize, inPlace, throttle, stats):
+        self.out = out
+        self.tgt = tgt
+        self.sigs = sigs
+        self.blockSize = blockSize
+        self.inPlace = inPlace
+        self.throttle = throttle
+        self.stats = stats
+        self.offset = 0
+        '''The offset of the next bytes of new file.'''
+    
+    
+    def match(self, checksum, window, offset):
+        '''
+        Search the window in the signatures: the block at the offset of window first, who is not written again.
+        In place, only the blocks not overwritten yet (after the window) are reused.
+        @param checksum: The weak checksum of window.
+        @param window: The bytes.
+        @param offset: The offset of window in new file.
+        @return: The tuple (block index, block length), or None.
+        '''
+        candidates = self.sigs.get(checksum)
+        if candidates is None:
+            return None
+        strong = strongChecksum(window)
+        found = None
+        for candidate in candidates:
+            if candidate[0] == strong and candidate[2] == len(window):
+                start = candidate[1] * self.blockSize
+                if start == offset:
+                    return candidate[1], candidate[2]
+                if found is None and (not self.inPlace or start > offset):
+                    found = candidate[1], candidate[2]
+        return found
+    
+    
+    def literal(self, data):
+        '''Write bytes read from source.'''
+        self._write(data)
+        self.stats.literal += len(data)
+    
+    
+    def block(self, index, length):
+        '''Reuse a block of old target, copied if it was at another offset.'''
+        if index * self.blockSize != self.offset:
+            self.tgt.seek(index * self.blockSize)
+            self._write(self.tgt.read(length))
+        else:
+            self.offset += length
+        self.stats.reused += length
+        self.stats.blocks += 1
+    
+    
+    def close(self):
+        '''Cut the old bytes after the new content.'''
+        self.out.truncate(self.offset)
+    
+    
+    def _write(self, data):
+        if not data:
+            return
+        self.out.seek(self.offset)
+        fd = self.out.fileno()
+        size = len(data)
+        while data:
+            n = os.write(fd, data)
+            data = data[n:]
+        self.offset += size
+        self.stats.written += size
+        if self.throttle is not None:
+            self.throttle.transfer(size)
+
+
+
+def delta(src, tgt, out, sigs, blockSize=BLOCK_SIZE, inPlace=False, throttle=None):
+    '''
+    Write the source over the content of old target, reusing its blocks: only the literal bytes and the blocks found at another offset are written.
+    @param src: The source file, opened in binary mode.
+    @param tgt: The old target file, opened in binary mode without buffer.
+    @param out: The new file, opened for update in binary mode without buffer, with the content of old target.
+    @param sigs: The signatures of target.
+    @param blockSize: The size of target blocks.
+    @param inPlace: The new file is the old target: a block is reused only before it is overwritten.
+    @param throttle: The throttle.Throttle limiting the bytes written, None for no limit.
+    @return: The DeltaStats.
+    '''
+    stats = DeltaStats()
+    output = _Output(out, tgt, sigs, blockSize, inPlace, throttle, stats)
+    buf = bytearray()
+    pos = 0  # Start of window in buf
+    literal = 0  # Start of bytes not matched, before the window
+    checksum = None
+    eof = False
+    
+    while True:
+        # Read next bytes, keeping only the window
+        if not eof and len(buf) < pos + blockSize + 1:
+            output.literal(buf[literal:pos])
+            del buf[:pos]
+            pos = literal = 0
+            chunk = src.read(CHUNK_SIZE)
+            if chunk:
+                buf += chunk
+            else:
+                eof = True
+            continue
+        
+        # Tail shorter than a block: only the last block of target can match
+        if len(buf) - pos < blockSize:
+            window = buf[pos:]
+            found = output.match(weakChecksum(window), window, output.offset + pos - literal) if window else None
+            if found is not None:
+                output.literal(buf[literal:pos])
+                output.block(*found)
+            else:
+                output.literal(buf[literal:])
+            output.close()
+            return stats
+        
+        if checksum is None:
+            checksum = weakChecksum(buf[pos:pos + blockSize])
+        found = output.match(checksum, buf[pos:pos + blockSize], output.offset + pos - literal) if checksum in sigs else None
+        if found is not None:
+            output.literal(buf[literal:pos])
+            output.block(*found)
+            pos += blockSize
+            literal = pos
+            checksum = None
+        elif pos + blockSize < len(buf):
+            # Roll the window until its checksum is a signature, or until the end of buffer (roll, inlined)
+            a = checksum & 0xffff
+            b = checksum >> 16
+            end = len(buf) - blockSize
+            while pos < end:
+                outByte = buf[pos]
+                a = (a - outByte + buf[pos + blockSize]) % _MOD
+                b = (b - blockSize * outByte + a - 1) % _MOD
+                pos += 1
+                if ((b << 16) | a) in sigs:
+                    break
+            checksum = (b << 16) | a
+        else:
+            # Last full window without match: its bytes are literal
+            pos = len(buf)
+
+
+
+def _clone(srcFd, dstFd):
+    '''
+    Share the blocks of a file with a new file (reflink), on filesystems with copy-on-write.
+    @return: True if cloned.
+    '''
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        fcntl.ioctl(dstFd, copyengine.FICLONE, srcFd)
+    except EnvironmentError:
+        return False
+    return True
+
+
+
+def _markInterrupted(srcPath, tgtPath):
+    '''Set the modification time of a target partially written after the one of source, so the analyze updates it again.'''
+    try:
+        st = os.stat(tgtPath)
+        os.utime(tgtPath, (st.st_atime, max(time.time(), os.stat(srcPath).st_mtime + 1)))
+    except EnvironmentError as e:
+        logger.warning('Time of interrupted patch unchanged: %s: %s' % (tgtPath, e))
+
+
+
+def patch(srcPath, tgtPath, blockSize=BLOCK_SIZE, throttle=None):
+    '''
+    Update the target file with the content of source, writing only the changed ranges.
+    The target is cloned (reflink) into a temporary file of the target folder, who receives the writes and replaces the target when complete.
+    On filesystems without clone, the target is written in place, like rsync --inplace: the blocks are only reused forward.
+    Each write sets the modification time of target to the current time, and the source time is copied only at the end:
+    an interrupted patch leaves the target newer than source, so it's updated again by the next analyze (Analyzer.MTIME).
+    If the source time is in the future, the target time is set after it when the patch fails.
+    @param srcPath: The path to source file.
+    @param tgtPath: The path to target file.
+    @param blockSize: The size of blocks.
+    @param throttle: The throttle.Throttle limiting the bytes written, None for no limit.
+    @return: The DeltaStats.
+    '''
+    if throttle is not None:
+        throttle.operation()
+    folder, name = os.path.split(tgtPath)
+    with open(tgtPath, 'rb', 0) as tgt:
+        sigs = signatures(tgt, blockSize)
+        fd, stagedPath = tempfile.mkstemp(prefix='.' + name + '.', suffix='.delta', dir=folder)
+        try:
+            cloned = _clone(tgt.fileno(), fd)
+        finally:
+            os.close(fd)
+        if not cloned:
+            os.remove(stagedPath)
+        try:
+            with open(stagedPath if cloned else tgtPath, 'r+b', 0) as out:
+                with open(srcPath, 'rb') as src:
+                    stats = delta(src, tgt, out, sigs, blockSize, not cloned, throttle)
+            if not cloned:
+                shutil.copystat(srcPath, tgtPath)
+            else:
+                shutil.copystat(srcPath, stagedPath)
+                if hasattr(os, 'replace'):
+                    os.replace(stagedPath, tgtPath)
+                else:
+                    os.remove(tgtPath)  # Windows
+                    os.rename(stagedPath, tgtPath)
+        except:
+            if cloned and os.path.exists(stagedPath):
+                os.remove(stagedPath)
+            elif not cloned:
+                _markInterrupted(srcPath, tgtPath)
+            raise
+    logger.debug("Delta of %s: %d bytes reused, %d bytes written%s" % (tgtPath, stats.reused, stats.written, '' if cloned else ' in place'))
+    return stats
@@ -0,0 +1,420 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Access to deep trees by descriptors of folders, instead of full paths.
+A full path is resolved by the kernel component by component at each call; here the folders are kept open in a bounded cache,
+each one opened relative to its parent, and the objects are listed, stated, opened, created and removed relative to their folder
+(the dir_fd parameters of os functions, on POSIX systems with Python 3.7 or newer).
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import collections
+import errno
+import logging
+import os
+import shutil
+import stat
+import threading
+
+import backend as backends
+import copyengine
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'dirfd'
+
+
+
+_O_DIRECTORY = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0)
+_XATTR_IGNORED = set(getattr(errno, name) for name in ('EPERM', 'ENOTSUP', 'ENODATA', 'EINVAL') if hasattr(errno, name))
+
+
+
+def supported():
+    '''@return: True if the system can list, stat and open objects relative to an opened folder.'''
+    fdFunctions = getattr(os, 'supports_fd', set())
+    dirFdFunctions = getattr(os, 'supports_dir_fd', set())
+    return hasattr(os, 'scandir') and os.scandir in fdFunctions and all(f in dirFdFunctions for f in (os.open, os.stat, os.mkdir, os.unlink, os.rename))
+
+
+
+def scanAt(fd):
+    '''
+    List the content of an opened folder, like backend.scan.
+    @param fd: The descriptor of folder.
+    @return: The dictionary: object name -> stat of object.
+    '''
+    stats = {}
+    for entry in os.scandir(fd):  # Each stat is relative to the folder
+        try:
+            stats[entry.name] = entry.stat()
+        except OSError:
+            pass
+    return stats
+
+
+
+def copyStat(srcFd, dstFd, st=None):
+    '''
+    Copy the extended attributes, times and permissions of an opened object, like shutil.copystat.
+    @param srcFd: The descriptor of source object.
+    @param dstFd: The descriptor of target object.
+    @param st: The stat of source object, if known.
+    '''
+    if st is None:
+        st = os.fstat(srcFd)
+    if hasattr(os, 'listxattr'):
+        try:
+            names = os.listxattr(srcFd)
+        except OSError as e:
+            if e.errno not in _XATTR_IGNORED:
+                raise
+            names = []
+        for name in names:
+            try:
+                os.setxattr(dstFd, name, os.getxattr(srcFd, name))
+            except OSError as e:
+                if e.errno not in _XATTR_IGNORED:
+                    raise
+    os.utime(dstFd, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.chmod(dstFd, stat.S_IMODE(st.st_mode))
+
+
+
+class FolderCache:
+    '''
+    The descriptors of folders, opened relative to their parent, and closed by least recent use.
+    A descriptor in use is not closed: the cache can exceed its size while the folders of a deep path are used together.
+    '''
+    
+    
+    def __init__(self, size=256):
+        '''
+        Constructor.
+        @param size: The maximal number of folders kept open when not used.
+        '''
+        self.size = size
+        self.opened = 0
+        '''The number of folders opened.'''
+        self.hits = 0
+        '''The number of folders found open.'''
+        self._fds = collections.OrderedDict()  # Absolute path -> [descriptor, users, forgotten], by least recent use
+        self._lock = threading.Lock()
+    
+    
+    def open(self, path):
+        '''
+        Use the descriptor of a folder, opened if not in cache.
+        @param path: The path to folder.
+        @return: The context manager giving the descriptor.
+        '''
+        return _Use(self, os.path.abspath(path))
+    
+    
+    def forget(self, path):
+        '''
+        Close the descriptors of a folder and of its sub-folders, before it is removed, renamed or replaced.
+        @param path: The path to object.
+        '''
+        path = os.path.abspath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            for key in [key for key in self._fds if key == path or key.startswith(prefix)]:
+                entry = self._fds.pop(key)
+                entry[2] = True
+                if entry[1] == 0:
+                    os.close(entry[0])
+    
+    
+    def close(self):
+        '''Close the descriptors not in use.'''
+        with self._lock:
+            for entry in self._fds.values():
+                entry[2] = True
+                if entry[1] == 0:
+                    os.close(entry[0])
+            self._fds.clear()
+    
+    
+    def __len__(self):
+        return len(self._fds)
+    
+    
+    def _acquire(self, path):
+        '''
+        Get the entry of a folder, used until _release.
+        The parent is usually in cache: it is used under the same lock, without recursion.
+        @param path: The absolute path to folder.
+        @return: The entry [descriptor, users, forgotten].
+        '''
+        parent, name = os.path.split(path)
+        with self._lock:
+            entry = self._use(path)
+            if entry is not None:
+                return entry
+            parentEntry = self._use(parent) if name else None
+        if not name:  # Root of filesystem
+            fd = os.open(path, _O_DIRECTORY)
+        else:
+            if parentEntry is None:
+                parentEntry = self._acquire(parent)
+            try:
+                fd = os.open(name, _O_DIRECTORY, dir_fd=parentEntry[0])
+            except:
+                self._release(parentEntry)
+                raise
+        with self._lock:
+            if parentEntry is not None:
+                self._unuse(parentEntry)
+            self.opened += 1
+            entry = self._fds.get(path)
+            if entry is None:
+                entry = self._fds[path] = [fd, 0, False]
+            else:  # Opened by another thread at the same time
+                os.close(fd)
+            entry[1] += 1
+            if len(self._fds) > self.size:
+                self._evict()
+        return entry
+    
+    
+    def _release(self, entry):
+        with self._lock:
+            self._unuse(entry)
+            if len(self._fds) > self.size:
+                self._evict()
+    
+    
+    def _use(self, path):
+        '''Use a folder in cache, as the most recent. Called with the lock. @return: The entry, None if not in cache.'''
+        entry = self._fds.pop(path, None)
+        if entry is not None:
+            self._fds[path] = entry
+            entry[1] += 1
+            self.hits += 1
+        return entry
+    
+    
+    def _unuse(self, entry):
+        '''End a use of folder, closed if it was forgotten. Called with the lock.'''
+        entry[1] -= 1
+        if entry[1] == 0 and entry[2]:
+            os.close(entry[0])
+    
+    
+    def _evict(self):
+        '''Close the least recent folders not in use, above the size. Called with the lock.'''
+        excess = len(self._fds) - self.size
+        closed = []
+        for key, entry in self._fds.items():  # The least recent first
+            if entry[1] == 0:
+                closed.append(key)
+                if len(closed) == excess:
+                    break
+        for key in closed:
+            os.close(self._fds.pop(key)[0])
+
+
+
+class _Use:
+    '''The use of a folder of cache, by "with".'''
+    
+    
+    def __init__(self, cache, path):
+        self.cache = cache
+        self.path = path
+        self.entry = None
+    
+    
+    def __enter__(self):
+        self.entry = self.cache._acquire(self.path)
+        return self.entry[0]
+    
+    
+    def __exit__(self, *exc):
+        self.cache._release(self.entry)
+
+
+
+class DirFdBackend(backends.LocalBackend):
+    '''Folder on disk, listed and stated relative to the descriptors of folders.'''
+    
+    
+    def __init__(self, root, cacheSize=256, engine=None):
+        '''
+        Constructor.
+        @param root: The path to folder.
+        @param cacheSize: The number of folders kept open.
+        @param engine: The copyengine.CopyEngine removing, renaming and linking objects.
+        '''
+        backends.LocalBackend.__init__(self, root, engine)
+        self.folders = FolderCache(cacheSize)
+    
+    
+    def listdir(self, relpath):
+        with self.folders.open(self._path(relpath)) as fd:
+            return scanAt(fd)
+    
+    
+    def stat(self, relpath):
+        parent, name = os.path.split(os.path.abspath(self._path(relpath)))
+        with self.folders.open(parent) as fd:
+            return os.stat(name, dir_fd=fd)
+    
+    
+    def measure(self, relpath):
+        import action  # Imports this module
+        return self._rollup(self._path(relpath), self.stat(relpath), action)
+    
+    
+    def _rollup(self, path, st, action):
+        '''Like action.rollup, listing each folder by its descriptor.'''
+        if not action.isdir(st):
+            return st.st_size, 1, action.allocated(st)
+        size = files = blocks = 0
+        with self.folders.open(path) as fd:
+            stats = scanAt(fd)
+        for name, childStat in stats.items():
+            childSize, childFiles, childBlocks = self._rollup(os.path.join(path, name), childStat, action)
+            size += childSize
+            files += childFiles
+            blocks += childBlocks
+        return size, files, blocks
+    
+    
+    def close(self):
+        self.folders.close()
+
+
+
+class DirFdEngine(copyengine.CopyEngine):
+    '''
+    Copy engine creating, opening and removing the objects relative to the descriptors of their folder.
+    The folders removed, renamed or replaced by the engine are forgotten by its cache; the target must not be changed by other programs during the execution.
+    '''
+    
+    
+    def __init__(self, cacheSize=256, **options):
+        '''
+        Constructor.
+        @param cacheSize: The number of folders kept open.
+        @param options: The options of copyengine.CopyEngine.
+        '''
+        copyengine.CopyEngine.__init__(self, **options)
+        self.folders = FolderCache(cacheSize)
+    
+    
+    def copy(self, src, dst, links=None, linkMethod=copyengine.REFLINK):
+        self.folders.forget(dst)
+        copyengine.CopyEngine.copy(self, src, dst, links, linkMethod)
+    
+    
+    def replace(self, src, dst):
+        self.folders.forget(dst)
+        copyengine.CopyEngine.replace(self, src, dst)
+    
+    
+    def _commit(self, stagedPath, dst, replace):
+        self.folders.forget(stagedPath)
+        self.folders.forget(dst)
+        copyengine.CopyEngine._commit(self, stagedPath, dst, replace)
+    
+    
+    def remove(self, path):
+        self._operation()
+        self.settle(path)
+        self.folders.forget(path)
+        parent, name = os.path.split(os.path.abspath(path))
+        with self.folders.open(parent) as fd:
+            if stat.S_ISDIR(os.stat(name, dir_fd=fd).st_mode):
+                shutil.rmtree(path)  # Browsed by descriptors on these systems
+            else:
+                os.unlink(name, dir_fd=fd)
+        if self.durability is not None:
+            self.durability.recordRemove(path)
+    
+    
+    def rename(self, src, dst):
+        self._operation()
+        self.settle(src, dst)
+        self.folders.forget(src)
+        self.folders.forget(dst)
+        srcParent, srcName = os.path.split(os.path.abspath(src))
+        dstParent, dstName = os.path.split(os.path.abspath(dst))
+        with self.folders.open(srcParent) as srcFd:
+            with self.folders.open(dstParent) as dstFd:
+                os.rename(srcName, dstName, src_dir_fd=srcFd, dst_dir_fd=dstFd)
+        if self.durability is not None:
+            self.durability.recordRemove(src)
+            self.durability.recordRemove(dst)
+    
+    
+    def copyTree(self, src, dst, links=None, deferred=None):
+        self._operation()
+        parent, name = os.path.split(os.path.abspath(dst))
+        try:
+            with self.folders.open(parent) as fd:
+                os.mkdir(name, 0o777, dir_fd=fd)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            os.makedirs(dst)
+        with self.folders.open(src) as srcFd:
+            with self.folders.open(dst) as dstFd:
+                for entry in list(os.scandir(srcFd)):
+                    srcPath = os.path.join(src, entry.name)
+                    dstPath = os.path.join(dst, entry.name)
+                    if entry.is_dir():
+                        self.copyTree(srcPath, dstPath, links, deferred)
+                    elif links and srcPath in links and deferred is not None:
+                        deferred.append((links[srcPath], dstPath, srcPath))
+                    else:
+                        self._operation()
+                        self._copyFileAt(srcFd, entry.name, dstFd, entry.name)
+                        self._recordFile(dstPath)
+                copyStat(srcFd, dstFd)
+        self._recordFolder(dst)
+    
+    
+    def copyFile(self, src, dst):
+        self._operation()
+        srcParent, srcName = os.path.split(os.path.abspath(src))
+        dstParent, dstName = os.path.split(os.path.abspath(dst))
+        with self.folders.open(srcParent) as srcFolder:
+            with self.folders.open(dstParent) as dstFolder:
+                self._copyFileAt(srcFolder, srcName, dstFolder, dstName)
+        self._recordFile(dst)
+    
+    
+    def _copyFileAt(self, srcFolder, srcName, dstFolder, dstName):
+        '''
+        Copy a file, with its permissions and times, relative to the descriptors of folders.
+        @param srcFolder: The descriptor of source folder.
+        @param srcName: The name of source file.
+        @param dstFolder: The descriptor of target folder.
+        @param dstName: The name of target file.
+        '''
+        srcFd = os.open(srcName, os.O_RDONLY, dir_fd=srcFolder)
+        try:
+            st = os.fstat(srcFd)
+            dstFd = os.open(dstName, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666, dir_fd=dstFolder)
+            try:
+                self.copyFd(srcFd, dstFd, st.st_size)
+                copyStat(srcFd, dstFd, st)
+            finally:
+                os.close(dstFd)
+        finally:
+            os.close(srcFd)
@@ -0,0 +1,338 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''Parallel execution of actions, respecting the order between actions on the same paths.'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import collections
+import logging
+import os
+import threading
+import time
+
+import action as actions
+import throttle
+import tracing
+import workers as workerpool
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'executor'
+
+
+
+Result = collections.namedtuple('Result', 'action error duration')
+'''The result of an action: the exception raised (None if succeeded), and the duration of execution in seconds.'''
+
+
+
+class ExecutionError(Exception):
+    '''Action not executed, because the execution was stopped or an action it depends on failed.'''
+    pass
+
+
+
+def components(relpath):
+    '''
+    Split a relative path.
+    @param relpath: The relative path.
+    @return: The tuple of names.
+    '''
+    return tuple(name for name in os.path.normpath(relpath).split(os.sep) if name not in ('', '.'))
+
+
+
+def _rank(action):
+    '''Order of actions on the same path: the old object is removed before the new is copied.'''
+    if isinstance(action, actions.RemoveAction):
+        return 0
+    elif isinstance(action, actions.CopyAction):
+        return 2
+    return 1
+
+
+
+def sortKey(action):
+    '''
+    Get the key sorting actions in the order of Executor.run.
+    @param action: The action.
+    @return: The key.
+    '''
+    return components(action.relpath), _rank(action)
+
+
+
+class _Node:
+    '''An action in the dependency graph.'''
+    
+    
+    def __init__(self, action, paths):
+        self.action = action
+        self.paths = paths
+        self.waiting = 0
+        '''The number of unfinished actions to wait.'''
+        self.dependents = []
+        '''The nodes waiting this one.'''
+        self.failed = None
+        '''The error, if an action it depends on failed.'''
+
+
+
+class Executor:
+    '''
+    Execute actions on a pool of threads.
+    An action waits for the unfinished actions submitted before it on the same path, on a parent folder, or on a child object.
+    So the actions can be submitted during the analyze: the graph is built incrementally.
+    '''
+    
+    
+    def __init__(self, workers=4, keepResults=True, metrics=None, tracer=None, lowPriority=False):
+        '''
+        Constructor.
+        @param workers: The number of actions executed at the same time.
+        @param keepResults: Keep the Result of finished actions. False when they are only streamed to handler.
+        @param metrics: The metrics.Registry where the execution is recorded, None to not record it.
+        @param tracer: The tracing.Tracer recording a span per action, None to not trace.
+        @param lowPriority: Execute the actions at idle I/O priority and low CPU priority (throttle.lowerPriority).
+        '''
+        self.workers = workers
+        self.keepResults = keepResults
+        self.metrics = metrics
+        self.tracer = tracer
+        self.lowPriority = lowPriority
+        self.handler = None
+        '''
+        Function called when an action is finished. It take the action and the error (None if succeeded) in parameter.
+        An action writing a staged object is finished when the object is renamed over its target, by the flush of batch (copyengine.Durability).
+        '''
+        self.results = []
+        '''The Result of finished actions, if kept.'''
+        self._pool = None
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._handlerLock = threading.Lock()
+        self._unfinished = 0
+        self._byPath = {}  # Path -> unfinished nodes on this path, in submission order
+        self._under = {}  # Path -> unfinished nodes on a child path
+        self._engines = set()
+        self._stopRequested = False
+    
+    
+    def run(self, actionList, sort=True):
+        '''
+        Execute the actions and wait their end.
+        On the same path, the removes are executed before updates and copies.
+        @param actionList: The actions.
+        @param sort: Sort the actions by path. False to keep an order who already respects it (ordering.order).
+        @return: The Result of all actions.
+        '''
+        for action in sorted(actionList, key=sortKey) if sort else actionList:
+            self.submit(action)
+        self.close()
+        return self.results
+    
+    
+    def submit(self, action):
+        '''
+        Add an action to execute, after the actions submitted before it on the same paths.
+        @param action: The action.
+        '''
+        node = _Node(action, self._paths(action))
+        with self._lock:
+            if self._pool is None:
+                self._pool = workerpool.WorkerPool(self.workers, 'Action execute', throttle.lowerPriority if self.lowPriority else None)
+            dependencies = set()
+            for path in node.paths:
+                for i in range(len(path) + 1):
+                    nodes = self._byPath.get(path[:i])
+                    if nodes:
+                        dependencies.add(nodes[-1])
+                dependencies.update(self._under.get(path, ()))
+            for dependency in dependencies:
+                dependency.dependents.append(node)
+                node.waiting += 1
+            for path in node.paths:
+                self._byPath.setdefault(path, []).append(node)
+                for i in range(len(path)):
+                    self._under.setdefault(path[:i], set()).add(node)
+            self._unfinished += 1
+            ready = node.waiting == 0
+        if ready:
+            self._pool.submit(self._execute, node)
+    
+    
+    def join(self):
+        '''
+        Wait the end of submitted actions, and synchronize the batch of written objects: the staged objects are renamed over their target,
+        and their actions reported.
+        @return: The Result of finished actions.
+        '''
+        with self._lock:
+            while self._unfinished > 0:
+                self._finished.wait()
+            engines = list(self._engines)
+        for engine in engines:
+            engine.flush()
+        return self.results
+    
+    
+    def close(self):
+        '''Wait the end of submitted actions, synchronize the last batch of written objects, and terminate the threads.'''
+        self.join()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+    
+    
+    def stop(self):
+        '''Stop the execution: the actions not started are finished with an ExecutionError.'''
+        self._stopRequested = True
+    
+    
+    def _paths(self, action):
+        '''
+        Get the paths used by an action: its path, the old path of a move, and the paths of objects it requires.
+        @param action: The action.
+        @return: The list of paths, as tuples of names.
+        '''
+        paths = [components(action.relpath)]
+        fromRelpath = getattr(action, 'fromRelpath', None)
+        if fromRelpath is not None:
+            paths.append(components(fromRelpath))
+        for relpath in getattr(action, 'requires', ()):
+            path = components(relpath)
+            if path not in paths:
+                paths.append(path)
+        return paths
+    
+    
+    def _execute(self, node):
+        '''
+        Execute an action, from a thread of pool.
+        @param node: The node of action.
+        '''
+        error = node.failed
+        if error is None and self._stopRequested:
+            error = ExecutionError('Stopped')
+        start = time.time()
+        if error is None:
+            engine = getattr(node.action, 'engine', None)
+            if engine is not None:
+                with self._lock:
+                    self._engines.add(engine)
+            try:
+                with tracing.span(self.tracer, node.action.__class__.__name__, 'execute', relpath=node.action.relpath, bytes=node.action.size):
+                    node.action.execute()
+            except Exception as e:
+                logger.exception('Action failed: ' + node.action.relpath)
+                error = e
+        duration = time.time() - start
+        if error is not None or not self._claim(node.action, duration):
+            self._report(node.action, error, duration)
+        self._finish(node, error)
+    
+    
+    def _claim(self, action, duration):
+        '''
+        Defer the report of an action until its staged object is renamed over its target.
+        @param action: The action, succeeded.
+        @param duration: The duration of execution.
+        @return: True if the action is reported by the flush renaming its object.
+        '''
+        durability = getattr(getattr(action, 'engine', None), 'durability', None)
+        tgtPath = getattr(action, 'tgtPath', None)
+        if durability is None or tgtPath is None:
+            return False
+        return durability.claim(tgtPath, lambda error: self._report(action, error, duration))
+    
+    
+    def _report(self, action, error, duration):
+        '''
+        Record the result of an action, and give it to handler.
+        @param action: The action.
+        @param error: The exception, None if succeeded.
+        @param duration: The duration of execution.
+        '''
+        if self.metrics is not None:
+            self._record(action, error, duration)
+        if self.keepResults:
+            with self._lock:
+                self.results.append(Result(action, error, duration))
+        if self.handler is not None:
+            with self._handlerLock:
+                try:
+                    self.handler(action, error)
+                except Exception:
+                    logger.exception('Handler failed: ' + action.relpath)
+    
+    
+    def _record(self, action, error, duration):
+        '''
+        Record an executed action in metrics.
+        @param action: The action.
+        @param error: The exception, None if succeeded.
+        @param duration: The duration of execution.
+        '''
+        name = action.__class__.__name__
+        self.metrics.counter('synchronizer_actions_executed_total').inc(type=name, status='ok' if error is None else 'error')
+        if error is not None:
+            return
+        self.metrics.histogram('synchronizer_action_seconds').observe(duration, type=name)
+        if isinstance(action, actions.RemoveAction):
+            self.metrics.counter('synchronizer_bytes_total').inc(action.size or 0, operation='deleted')
+        elif isinstance(action, actions.RenameAction):
+            self.metrics.counter('synchronizer_bytes_total').inc(action.size or 0, operation='moved')
+        elif isinstance(action, actions.LinkAction):
+            self.metrics.counter('synchronizer_bytes_total').inc(action.size or 0, operation='linked')
+        elif getattr(action, 'deltaStats', None) is not None:
+            self.metrics.counter('synchronizer_bytes_total').inc(action.deltaStats.written, operation='copied')
+            self.metrics.counter('synchronizer_bytes_total').inc(action.deltaStats.reused, operation='skipped')
+        else:
+            self.metrics.counter('synchronizer_bytes_total').inc(action.size or 0, operation='copied')
+    
+    
+    def _finish(self, node, error):
+        '''
+        Update the graph after the end of an action, and execute the actions who don't wait anymore.
+        @param node: The node of action.
+        @param error: The exception, None if succeeded.
+        '''
+        ready = []
+        with self._lock:
+            for path in node.paths:
+                nodes = self._byPath[path]
+                nodes.remove(node)
+                if not nodes:
+                    del self._byPath[path]
+                for i in range(len(path)):
+                    under = self._under.get(path[:i])  # Already removed for the common parents of another path
+                    if under is None:
+                        continue
+                    under.discard(node)
+                    if not under:
+                        del self._under[path[:i]]
+            for dependent in node.dependents:
+                if error is not None and dependent.failed is None:
+                    dependent.failed = ExecutionError('Dependency failed: ' + node.action.relpath)
+                dependent.waiting -= 1
+                if dependent.waiting == 0:
+                    ready.append(dependent)
+        
+        for dependent in ready:
+            self._pool.submit(self._execute, dependent)
+        
+        with self._lock:
+            self._unfinished -= 1
+            self._finished.notify_all()
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''Digest of file contents, with a persistent cache.'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import hashlib
+import logging
+import os
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from index import mtimeNs
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'hashing'
+
+
+
+CHUNK_SIZE = 1024 * 1024
+'''The size of read blocks.'''
+
+
+
+def hashFile(path, algorithm='sha1'):
+    '''
+    Compute the digest of file content, reading it by chunks.
+    @param path: The path to file.
+    @param algorithm: The name of hashlib algorithm.
+    @return: The digest.
+    '''
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+
+class HashCache:
+    '''
+    The digests of files, keyed by (device, inode, size, mtime in ns).
+    A file is read again only if one of them changed.
+    '''
+    
+    
+    def __init__(self, path=None, algorithm='sha1'):
+        '''
+        Constructor.
+        @param path: The path to cache file, None to keep the cache in memory.
+        @param algorithm: The name of hashlib algorithm.
+        '''
+        self.path = path
+        self.algorithm = algorithm
+        self.hits = 0
+        '''The number of digests found in cache.'''
+        self.misses = 0
+        '''The number of files read.'''
+        self._digests = {}
+        self._used = set()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    data = pickle.load(f)
+                if data['algorithm'] == algorithm:
+                    self._digests = data['digests']
+            except Exception:
+                logger.exception("Invalid hash cache: " + path)
+    
+    
+    def _key(self, path, st):
+        if st.st_ino:
+            return (st.st_dev, st.st_ino, st.st_size, mtimeNs(st))
+        else:  # No inode (Windows)
+            return (os.path.abspath(path), st.st_size, mtimeNs(st))
+    
+    
+    def digest(self, path, st=None):
+        '''
+        Get the digest of file content.
+        @param path: The path to file.
+        @param st: The stat of file, if already known.
+        @return: The digest.
+        '''
+        if st is None:
+            st = os.stat(path)
+        key = self._key(path, st)
+        with self._lock:
+            self._used.add(key)
+            digest = self._digests.get(key)
+            if digest is not None:
+                self.hits += 1
+                return digest
+        digest = hashFile(path, self.algorithm)
+        with self._lock:
+            self.misses += 1
+            self._digests[key] = digest
+        return digest
+    
+    
+    def save(self):
+        '''Write the cache file, without the digests of files not seen since the loading.'''
+        if self.path is None:
+            return
+        with self._lock:
+            digests = dict((key, self._digests[key]) for key in self._used)
+        tmpPath = self.path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            pickle.dump({'algorithm': self.algorithm, 'digests': digests}, f, 2)
+        if hasattr(os, 'replace'):
+            os.replace(tmpPath, self.path)
+        else:
+            if os.path.exists(self.path):
+                os.remove(self.path)  # Windows
+            os.rename(tmpPath, self.path)
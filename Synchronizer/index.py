@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''Persistent index of folder trees, to avoid listing unchanged folders.'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import collections
+import logging
+import os
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'index'
+
+
+
+_VERSION = 2
+
+
+
+def mtimeNs(st):
+    '''
+    Get the modification time of stat, in nanoseconds.
+    @param st: The stat.
+    @return: The time.
+    '''
+    if hasattr(st, 'st_mtime_ns'):
+        return st.st_mtime_ns
+    return int(st.st_mtime * 10 ** 9)
+
+
+
+class Record(collections.namedtuple('Record', 'st_mode st_size st_mtime_ns st_ino st_dev st_blocks')):
+    '''The indexed part of a stat. It can be used in place of stat result.'''
+    
+    __slots__ = ()
+    
+    
+    @property
+    def st_mtime(self):
+        return self.st_mtime_ns / 10.0 ** 9
+    
+    
+    @staticmethod
+    def fromStat(st):
+        '''
+        Convert a stat result.
+        @param st: The stat.
+        @return: The record.
+        '''
+        if isinstance(st, Record):
+            return st
+        return Record(st.st_mode, st.st_size, mtimeNs(st), st.st_ino, st.st_dev, getattr(st, 'st_blocks', None))
+
+
+
+Record.__new__.__defaults__ = (None,)  # st_blocks, unknown on Windows
+
+
+
+class TreeIndex:
+    '''
+    The content of each folder of a tree, with the modification time of the folder when it was listed.
+    The modification time of a folder only changes when an object is added, removed or renamed in it:
+    the edition of an existing file, without changing its folder, is not seen.
+    '''
+    
+    RACY_DELAY = 2
+    '''Folders modified less than this delay (in seconds) before their listing are not indexed, because they could be modified again without changing their modification time.'''
+    
+    
+    def __init__(self, folders=None):
+        self.folders = folders if folders is not None else {}
+        '''Dictionary: relative path of folder -> (modification time of folder in ns, dictionary: object name -> Record).'''
+        self.hits = 0
+        '''The number of folders found in index.'''
+        self.misses = 0
+        '''The number of folders listed.'''
+        self.previous = {}
+        '''Dictionary: relative path of folder -> dictionary: object name -> Record, the indexed content of folders listed again.'''
+        self._visited = set()
+    
+    
+    def get(self, subfolder, mtime):
+        '''
+        Get the content of folder, if it's unchanged since the last listing.
+        @param subfolder: The relative path to folder.
+        @param mtime: The current modification time of folder, in ns.
+        @return: The dictionary: object name -> Record, or None if the folder must be listed.
+        '''
+        self._visited.add(subfolder)
+        indexed = self.folders.get(subfolder)
+        if indexed is not None and indexed[0] == mtime:
+            self.hits += 1
+            return indexed[1]
+        self.misses += 1
+        return None
+    
+    
+    def put(self, subfolder, mtime, stats):
+        '''
+        Save the content of listed folder.
+        @param subfolder: The relative path to folder.
+        @param mtime: The modification time of folder when listed, in ns.
+        @param stats: The dictionary: object name -> stat.
+        '''
+        self._visited.add(subfolder)
+        if subfolder in self.folders and subfolder not in self.previous:
+            self.previous[subfolder] = self.folders[subfolder][1]
+        if time.time() - mtime / 10.0 ** 9 < TreeIndex.RACY_DELAY:
+            self.folders.pop(subfolder, None)
+            return
+        self.folders[subfolder] = (mtime, dict((name, Record.fromStat(st)) for name, st in stats.items()))
+    
+    
+    def record(self, relpath):
+        '''
+        Get the indexed stat of an object, as it was before the analyze.
+        @param relpath: The relative path to object.
+        @return: The Record, None if not indexed.
+        '''
+        subfolder, name = os.path.split(relpath)
+        records = self.previous.get(subfolder)
+        if records is None:
+            indexed = self.folders.get(subfolder)
+            records = indexed[1] if indexed is not None else {}
+        return records.get(name)
+    
+    
+    def prune(self):
+        '''Forget the folders who were not browsed since the creation of index.'''
+        for subfolder in list(self.folders):
+            if subfolder not in self._visited:
+                del self.folders[subfolder]
+
+
+
+def load(path, src, tgt):
+    '''
+    Load the index of source and target folders.
+    @param path: The path to index file.
+    @param src: The source folder.
+    @param tgt: The target folder.
+    @return: The tuple (source index, target index). Empty indexes if file doesn't exist or is for other folders.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data['version'] == _VERSION and data['src'] == os.path.abspath(src) and data['tgt'] == os.path.abspath(tgt):
+            return TreeIndex(data['srcFolders']), TreeIndex(data['tgtFolders'])
+        logger.info("Index ignored: " + path)
+    except (IOError, OSError):
+        pass
+    except Exception:
+        logger.exception("Invalid index: " + path)
+    return TreeIndex(), TreeIndex()
+
+
+
+def save(path, src, tgt, srcIndex, tgtIndex):
+    '''
+    Save the index of source and target folders.
+    The folders not browsed during the analyze are forgotten.
+    @param path: The path to index file.
+    @param src: The source folder.
+    @param tgt: The target folder.
+    @param srcIndex: The source index.
+    @param tgtIndex: The target index.
+    '''
+    srcIndex.prune()
+    tgtIndex.prune()
+    data = {'version': _VERSION,
+            'src': os.path.abspath(src),
+            'tgt': os.path.abspath(tgt),
+            'srcFolders': srcIndex.folders,
+            'tgtFolders': tgtIndex.folders}
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        pickle.dump(data, f, 2)
+    if hasattr(os, 'replace'):
+        os.replace(tmpPath, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)  # Windows
+        os.rename(tmpPath, path)
@@ -0,0 +1,315 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Metrics of analyze and execution: counters, gauges and histograms.
+They can be read during the run, and written as JSON or as Prometheus textfile.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import bisect
+import json
+import os
+import threading
+import time
+
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+'''The default upper bounds of histogram buckets, in seconds.'''
+
+HELP = {'synchronizer_entries_scanned_total': 'Objects compared by analyze.',
+        'synchronizer_entries_scanned_per_second': 'Objects compared by analyze per second, since the start.',
+        'synchronizer_folders_listed_total': 'Folders listed (not read from index).',
+        'synchronizer_stat_calls_total': 'Calls to stat by analyze.',
+        'synchronizer_actions_total': 'Actions found by analyze, by type.',
+        'synchronizer_bytes_total': 'Bytes copied, deleted, moved, linked to a copied file, or skipped because unchanged.',
+        'synchronizer_actions_executed_total': 'Actions executed, by type and status.',
+        'synchronizer_action_seconds': 'Duration of action execution, by type.',
+        'synchronizer_backend_round_trips_total': 'Requests sent to the server of remote target, by operation.'}
+'''The description of metrics recorded by Analyzer, Executor and RemoteBackend.'''
+
+
+
+def _labelsKey(labels):
+    return tuple(sorted(labels.items()))
+
+
+
+def _formatLabels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join('%s="%s"' % (name, escape(value)) for name, value in pairs) + '}'
+
+
+
+def _formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+
+class _Metric:
+    '''A metric, with a value per set of labels.'''
+    
+    TYPE = None
+    
+    
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+
+class Counter(_Metric):
+    '''Value who only increases.'''
+    
+    TYPE = 'counter'
+    
+    
+    def inc(self, amount=1, **labels):
+        '''
+        Increase the value.
+        @param amount: The increment.
+        @param labels: The labels of value.
+        '''
+        key = _labelsKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    
+    def get(self, **labels):
+        '''@return: The value for labels.'''
+        return self._values.get(_labelsKey(labels), 0)
+    
+    
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+    
+    
+    def _snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value} for key, value in sorted(self._values.items())]
+
+
+
+class Gauge(Counter):
+    '''Value who can be set, or computed by a function when read.'''
+    
+    TYPE = 'gauge'
+    
+    
+    def __init__(self, name, help, function=None):
+        Counter.__init__(self, name, help)
+        self.function = function
+        '''The function computing the value without labels, None if set.'''
+    
+    
+    def set(self, value, **labels):
+        '''
+        Set the value.
+        @param value: The value.
+        @param labels: The labels of value.
+        '''
+        with self._lock:
+            self._values[_labelsKey(labels)] = value
+    
+    
+    def get(self, **labels):
+        if self.function is not None and not labels:
+            return self.function()
+        return Counter.get(self, **labels)
+    
+    
+    def _samples(self):
+        if self.function is not None:
+            return [(self.name, (), self.function())]
+        return Counter._samples(self)
+    
+    
+    def _snapshot(self):
+        if self.function is not None:
+            return [{'labels': {}, 'value': self.function()}]
+        return Counter._snapshot(self)
+
+
+
+class Histogram(_Metric):
+    '''Distribution of observed values, by buckets.'''
+    
+    TYPE = 'histogram'
+    
+    
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        _Metric.__init__(self, name, help)
+        self.buckets = tuple(buckets)
+    
+    
+    def observe(self, value, **labels):
+        '''
+        Add a value.
+        @param value: The value.
+        @param labels: The labels of value.
+        '''
+        key = _labelsKey(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+    
+    
+    def count(self, **labels):
+        '''@return: The number of values observed for labels.'''
+        counts = self._values.get(_labelsKey(labels))
+        return counts[2] if counts is not None else 0
+    
+    
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (buckets, total, count) in sorted(self._values.items()):
+                cumulated = 0
+                for bound, n in zip(self.buckets + (float('inf'),), buckets):
+                    cumulated += n
+                    samples.append((self.name + '_bucket', key + (('le', _formatValue(float(bound))),), cumulated))
+                samples.append((self.name + '_sum', key, total))
+                samples.append((self.name + '_count', key, count))
+        return samples
+    
+    
+    def _snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], buckets)), 'sum': total, 'count': count}
+                    for key, (buckets, total, count) in sorted(self._values.items())]
+
+
+
+class Registry:
+    '''The metrics of a run.'''
+    
+    
+    def __init__(self):
+        self.start = time.time()
+        '''The creation time.'''
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    
+    def _get(self, cls, name, help, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help if help is not None else HELP.get(name, ''), *args)
+            return metric
+    
+    
+    def counter(self, name, help=None):
+        '''
+        Get or create a counter.
+        @param name: The name of metric.
+        @param help: The description, default from HELP.
+        @return: The Counter.
+        '''
+        return self._get(Counter, name, help)
+    
+    
+    def gauge(self, name, help=None, function=None):
+        '''
+        Get or create a gauge.
+        @param name: The name of metric.
+        @param help: The description, default from HELP.
+        @param function: The function computing the value when read, None if set.
+        @return: The Gauge.
+        '''
+        return self._get(Gauge, name, help, function)
+    
+    
+    def histogram(self, name, help=None, buckets=LATENCY_BUCKETS):
+        '''
+        Get or create a histogram.
+        @param name: The name of metric.
+        @param help: The description, default from HELP.
+        @param buckets: The upper bounds of buckets.
+        @return: The Histogram.
+        '''
+        return self._get(Histogram, name, help, buckets)
+    
+    
+    def snapshot(self):
+        '''
+        Read the metrics.
+        @return: The dictionary: name -> {type, help, values}.
+        '''
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return dict((metric.name, {'type': metric.TYPE, 'help': metric.help, 'values': metric._snapshot()}) for metric in metrics)
+    
+    
+    def toJson(self):
+        '''@return: The JSON text of metrics.'''
+        return json.dumps({'start': self.start, 'time': time.time(), 'metrics': self.snapshot()}, indent=2, sort_keys=True)
+    
+    
+    def toPrometheus(self):
+        '''@return: The metrics, in Prometheus text format.'''
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.TYPE))
+            for name, key, value in metric._samples():
+                lines.append('%s%s %s' % (name, _formatLabels(key), _formatValue(value)))
+        return '\n'.join(lines) + '\n'
+    
+    
+    def writeJson(self, path):
+        '''
+        Write the metrics as JSON file.
+        @param path: The path to file.
+        '''
+        _write(path, self.toJson() + '\n')
+    
+    
+    def writePrometheus(self, path):
+        '''
+        Write the metrics as Prometheus textfile (for the textfile collector of node exporter).
+        @param path: The path to file.
+        '''
+        _write(path, self.toPrometheus())
+
+
+
+def _write(path, text):
+    '''Write a file atomically, so a collector never reads it partially.'''
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'w') as f:
+        f.write(text)
+    if hasattr(os, 'replace'):
+        os.replace(tmpPath, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)  # Windows
+        os.rename(tmpPath, path)
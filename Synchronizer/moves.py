@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Detection of objects moved in source folder, after the analyze.
+A moved object gives a RemoveAction of its old path and a CopyAction of its new path:
+the pair is replaced by a RenameAction, who moves the target object instead of copying it again.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import logging
+import os
+
+import action
+import hashing
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'moves'
+
+
+
+MIN_SIZE = 64 * 1024
+'''The minimal size of files paired by digest: smaller files are copied again, it costs less than reading both files.'''
+
+
+
+def detect(actions, srcIndex=None, hashes=None, minSize=MIN_SIZE, compare=action.Analyzer.MTIME, hashCache=None):
+    '''
+    Replace the pairs (RemoveAction, CopyAction) of a moved object by a RenameAction.
+    The objects are paired by inode, when the source index knows the inode of old path (files and folders).
+    Otherwise, files are paired by size and digest, and folders on disk by listing: same relative paths, sizes and modification times of files.
+    Without index, a moved folder whose files changed is removed and copied again.
+    The content of a moved folder is compared, and its actions follow the RenameAction.
+    @param actions: The actions of analyze.
+    @param srcIndex: The index of source folder used by the analyze, None if not indexed.
+    @param hashes: The hashing.HashCache of digests, None for a cache in memory.
+    @param minSize: The minimal size of files paired by digest.
+    @param compare: The comparison of files in moved folders: action.Analyzer.MTIME or action.Analyzer.CONTENT.
+    @param hashCache: The path to the file of digests of the analyze of moved folders, None to not keep them.
+    @return: The list of actions.
+    '''
+    removes = [a for a in actions if isinstance(a, action.RemoveAction)]
+    copies = [a for a in actions if a.__class__ is action.CopyAction]
+    pairs = {}  # CopyAction -> RemoveAction
+    if srcIndex is not None:
+        pairs.update(_byInode(removes, copies, srcIndex))
+    paired = set(pairs.values())
+    pairs.update(_byDigest([a for a in removes if a not in paired], [a for a in copies if a not in pairs],
+                           hashes if hashes is not None else hashing.HashCache(), minSize))
+    paired = set(pairs.values())
+    pairs.update(_byListing([a for a in removes if a not in paired], [a for a in copies if a not in pairs]))
+    if not pairs:
+        return list(actions)
+    paired = set(pairs.values())
+    result = []
+    for a in actions:
+        if a in paired:
+            continue
+        old = pairs.get(a)
+        if old is None:
+            result.append(a)
+            continue
+        rename = action.RenameAction(a.relpath, a.srcPath, a.tgtPath, a.srcStat, old.tgtStat, old.relpath, old.tgtPath)
+        rename.size, rename.files, rename.allocated = old.size, old.files, old.allocated  # The moved data
+        result.append(rename)
+        if action.isdir(a.srcStat):
+            result.extend(_compareMoved(a, old, compare, hashCache))
+    logger.info('Moves: %d objects, %d bytes not copied' % (len(pairs), sum(a.size or 0 for a in paired)))
+    return result
+
+
+
+def _byInode(removes, copies, srcIndex):
+    '''
+    Pair the new objects with the old objects who had the same inode in source.
+    @return: The dictionary: CopyAction -> RemoveAction.
+    '''
+    old = {}
+    for a in removes:
+        record = srcIndex.record(a.relpath)
+        if record is not None and record.st_ino:
+            old[(record.st_dev, record.st_ino)] = (a, record)
+    pairs = {}
+    for a in copies:
+        st = a.srcStat
+        if st is None or not st.st_ino:
+            continue
+        found = old.pop((st.st_dev, st.st_ino), None)
+        if found is None:
+            continue
+        remove, record = found
+        if action.isdir(st) and action.isdir(record) and action.isdir(remove.tgtStat):
+            pairs[a] = remove
+        elif action.isfile(st) and action.isfile(record) and action.isfile(remove.tgtStat) \
+                and (st.st_size, _mtime(st)) == (record.st_size, _mtime(record)) == (remove.tgtStat.st_size, _mtime(remove.tgtStat)):
+            pairs[a] = remove  # A new file can have the inode of a removed file
+    return pairs
+
+
+
+def _byDigest(removes, copies, hashes, minSize):
+    '''
+    Pair the new files with the old saved files of same size and digest.
+    @return: The dictionary: CopyAction -> RemoveAction.
+    '''
+    bySize = {}
+    for a in removes:
+        if action.isfile(a.tgtStat) and a.tgtStat.st_size >= minSize:
+            bySize.setdefault(a.tgtStat.st_size, []).append(a)
+    pairs = {}
+    old = {}  # (size, digest) -> RemoveActions
+    hashed = set()
+    for a in copies:
+        if not action.isfile(a.srcStat) or a.srcStat.st_size not in bySize:
+            continue
+        size = a.srcStat.st_size
+        if size not in hashed:
+            hashed.add(size)
+            for remove in bySize[size]:
+                old.setdefault((size, hashes.digest(remove.tgtPath, remove.tgtStat)), []).append(remove)
+        candidates = old.get((size, hashes.digest(a.srcPath, a.srcStat)))
+        if candidates:
+            pairs[a] = candidates.pop()
+    return pairs
+
+
+
+def _byListing(removes, copies):
+    '''
+    Pair the new folders with the old saved folders of same listing: the relative paths, sizes and modification times of their files.
+    The folders are listed only if their total size and number of files are the same.
+    @return: The dictionary: CopyAction -> RemoveAction.
+    '''
+    byMeasure = {}
+    for a in removes:
+        if action.isdir(a.tgtStat) and a.backend is None and a.files:
+            byMeasure.setdefault((a.size, a.files), []).append(a)
+    pairs = {}
+    old = {}  # Listing -> RemoveActions
+    listed = set()
+    for a in copies:
+        if not action.isdir(a.srcStat) or (a.size, a.files) not in byMeasure:
+            continue
+        measure = (a.size, a.files)
+        if measure not in listed:
+            listed.add(measure)
+            for remove in byMeasure[measure]:
+                old.setdefault(_listing(remove.tgtPath), []).append(remove)
+        candidates = old.get(_listing(a.srcPath))
+        if candidates:
+            pairs[a] = candidates.pop()
+    return pairs
+
+
+
+def _listing(folder):
+    '''@return: The frozenset of the files of a folder: (relative path, size, modification time in ms).'''
+    return frozenset(_files(folder, ''))
+
+
+
+def _files(folder, sub):
+    '''Generate the files of a sub-folder: (relative path, size, modification time in ms).'''
+    for name, st in action.scan(os.path.join(folder, sub)).items():
+        relpath = os.path.join(sub, name)
+        if action.isdir(st):
+            for found in _files(folder, relpath):
+                yield found
+        else:
+            yield relpath, st.st_size, _mtime(st)
+
+
+
+def _compareMoved(copy, remove, compare, hashCache):
+    '''
+    Compare the content of a moved folder with the old saved folder.
+    @param copy: The CopyAction of new path.
+    @param remove: The RemoveAction of old path.
+    @param compare: The comparison of files.
+    @param hashCache: The path to the file of digests, None to not keep them.
+    @return: The actions on the new path, to execute after the move.
+    '''
+    found = []
+    analyzer = action.Analyzer(copy.srcPath, remove.tgtPath, compare=compare, hashCache=hashCache)
+    analyzer.handler = found.append
+    analyzer.run()
+    tgt = copy.tgtPath
+    result = []
+    for a in found:
+        sub = os.path.relpath(a.relpath, '.')
+        moved = a.__class__(os.path.join(copy.relpath, sub), a.srcPath, os.path.join(tgt, sub), a.srcStat, a.tgtStat)
+        moved.size, moved.files, moved.allocated = a.size, a.files, a.allocated
+        result.append(moved)
+    return result
+
+
+
+def _mtime(st):
+    return int(round(st.st_mtime * 1000))
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Ordering of actions by physical locality, for rotating disks.
+The files read by copies and updates are sorted by their location on source disk (first extent given by FIEMAP, on Linux),
+or by inode number if the filesystem doesn't give the extents: the disk head moves forward instead of seeking between scattered files.
+They are grouped by directory of target, in order of their first file: the files of a folder are allocated near each other,
+on source as on target, so the writes don't seek between folders either.
+The writes without reads (removes, moves) are grouped by directory of target, before the copies.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import array
+import errno
+import logging
+import os
+import struct
+import sys
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import action
+import executor
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'ordering'
+
+
+
+FIEMAP = 'fiemap'
+'''Sort by the physical offset of first extent.'''
+INODE = 'inode'
+'''Sort by inode number: the inodes allocated near are often near on disk.'''
+
+FS_IOC_FIEMAP = 0xC020660B
+'''The ioctl giving the extents of a file (Linux).'''
+_FIEMAP = struct.Struct('=QQIIII')  # struct fiemap: start, length, flags, mapped extents, extent count, reserved
+_EXTENT = struct.Struct('=QQQ')  # struct fiemap_extent: logical, physical, length, and 32 bytes reserved
+_EXTENT_SIZE = 56
+
+
+
+def firstExtent(path):
+    '''
+    Get the location of a file on disk.
+    @param path: The path to file.
+    @return: The physical offset of first extent in bytes, 0 for a file without extent (empty or inline).
+    @raise OSError: FIEMAP is not supported.
+    '''
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOTSUP, 'FIEMAP unsupported')
+    request = array.array('B', _FIEMAP.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + b'\0' * _EXTENT_SIZE)  # Mutable buffer on Python 2 and 3
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request, True)
+    finally:
+        os.close(fd)
+    if _FIEMAP.unpack_from(request)[3] == 0:
+        return 0
+    return _EXTENT.unpack_from(request, _FIEMAP.size)[1]
+
+
+
+def _firstFile(path):
+    '''@return: The path to first file of folder, in order of copy, None if it has no file.'''
+    for root, folders, names in os.walk(path, followlinks=True):
+        folders.sort()
+        if names:
+            return os.path.join(root, min(names))
+    return None
+
+
+
+class Locator:
+    '''
+    Give the location key of source objects.
+    FIEMAP is used until a file doesn't support it: then all files are located by inode, so the keys stay comparable.
+    '''
+    
+    
+    def __init__(self, method=FIEMAP):
+        '''
+        Constructor.
+        @param method: FIEMAP or INODE.
+        '''
+        self.method = method
+    
+    
+    def key(self, path, st=None):
+        '''
+        Get the location key of an object: a folder is located by its first file.
+        @param path: The path to object.
+        @param st: The stat of object, if known.
+        @return: The tuple (device, location), None if the object can't be read.
+        '''
+        try:
+            if st is None or action.isdir(st):
+                if st is None:
+                    st = os.stat(path)
+                if action.isdir(st):
+                    first = _firstFile(path)
+                    if first is not None:
+                        path, st = first, os.stat(first)
+            if self.method == FIEMAP:
+                try:
+                    return st.st_dev, firstExtent(path)
+                except (IOError, OSError) as e:
+                    if e.errno in (errno.ENOENT, errno.EACCES):
+                        raise
+                    logger.info('FIEMAP unsupported (%s): files located by inode' % e)
+                    self.method = INODE
+            return st.st_dev, st.st_ino
+        except (IOError, OSError):
+            return None
+
+
+
+def order(actions, method=FIEMAP):
+    '''
+    Sort the actions by physical locality.
+    The order keeps the dependencies of Executor: the removes and moves are first (by path), then the copies and updates
+    (by directory of target, then by location of source), and the actions writing links to other files are last (by path).
+    @param actions: The actions.
+    @param method: FIEMAP or INODE.
+    @return: The list of actions, to submit in this order.
+    '''
+    writes = []
+    reads = []
+    links = []
+    for a in actions:
+        if isinstance(a, (action.RemoveAction, action.RenameAction)):
+            writes.append(a)
+        elif isinstance(a, action.LinkAction) or getattr(a, 'requires', None):
+            links.append(a)
+        else:
+            reads.append(a)
+    
+    locator = Locator(method)
+    keys = [locator.key(a.srcPath, a.srcStat) for a in reads]
+    if locator.method != method:  # A file without FIEMAP: all files are located by inode
+        keys = [locator.key(a.srcPath, a.srcStat) for a in reads]
+    located = sorted(((key is None, key or (), executor.sortKey(a), a) for key, a in zip(keys, reads)), key=lambda entry: entry[:3])
+    folders = []
+    groups = {}  # Folder of target -> its reads, by location
+    for _, _, _, a in located:
+        folder = os.path.dirname(os.path.normpath(a.tgtPath))
+        if folder not in groups:
+            folders.append(folder)
+            groups[folder] = []
+        groups[folder].append(a)
+    reads = [a for folder in folders for a in groups[folder]]
+    logger.info('Ordering: %d reads located by %s' % (len(reads), locator.method))
+    return sorted(writes, key=executor.sortKey) + reads + sorted(links, key=executor.sortKey)
+
+
+
+def seekDistance(paths):
+    '''
+    Get the distance travelled on disk to read files in order, from their first extent.
+    @param paths: The paths to files, in order of reading.
+    @return: The sum of distances between consecutive files, in bytes. None if FIEMAP is unsupported.
+    '''
+    distance = 0
+    previous = None
+    for path in paths:
+        try:
+            offset = firstExtent(path)
+        except (IOError, OSError):
+            return None
+        if previous is not None:
+            distance += abs(offset - previous)
+        previous = offset + os.path.getsize(path)
+    return distance
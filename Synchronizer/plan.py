@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Compact storage of a big list of actions.
+The actions are stored by columns: the folders are interned, the names are packed in one buffer,
+and the numbers are kept in arrays. The Action objects are created only when accessed.
+The few attributes of moves and links (their other path, the links of a copied folder) are kept aside, by index of action.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import array
+import os
+import sys
+
+import action as actions
+from index import mtimeNs
+
+
+
+try:
+    array.array('q')
+    _INT64 = 'q'
+except ValueError:  # Python 2
+    _INT64 = 'd'
+
+_KINDS = (actions.CopyAction, actions.UpdateAction, actions.RemoveAction, actions.RenameAction, actions.LinkAction)
+
+_EXTRAS = ('fromRelpath', 'fromPath', 'original', 'method', 'links', 'requires')
+'''The attributes of moves and links, kept when set.'''
+
+
+
+if bytes is str:  # Python 2
+    _encode = _decode = lambda name: name
+else:
+    _encode = lambda name: name.encode('utf-8', 'surrogateescape')
+    _decode = lambda data: data.decode('utf-8', 'surrogateescape')
+
+
+
+class CompactPlan:
+    '''
+    The actions of an analyze, stored by columns.
+    All actions have the same source and target folders.
+    '''
+    
+    
+    def __init__(self, src, tgt):
+        '''
+        Constructor.
+        @param src: The source folder.
+        @param tgt: The target folder.
+        '''
+        self.src = src
+        self.tgt = tgt
+        self._folders = []  # Interned relative paths of folders
+        self._folderIds = {}
+        self._folder = array.array('i')  # Index in _folders
+        self._names = bytearray()  # Names, end to end
+        self._nameEnds = array.array(_INT64)  # End of each name in _names
+        self._kind = array.array('b')  # Index in _KINDS
+        self._size = array.array(_INT64)  # -1 if unknown
+        self._files = array.array(_INT64)  # -1 if unknown
+        self._allocated = array.array(_INT64)  # -1 if unknown
+        self._extras = {}  # Index -> dictionary: attribute -> value, for the actions with attributes of _EXTRAS
+        self._mtime = array.array(_INT64)  # mtime in ns of the object measured by the action, -1 if unknown
+    
+    
+    def __len__(self):
+        return len(self._kind)
+    
+    
+    def append(self, action):
+        '''
+        Add an action. Can be used as handler of Analyzer.
+        @param action: The action, of source and target folders of plan.
+        @raise ValueError: The type of action can't be stored.
+        '''
+        if action.__class__ not in _KINDS:
+            raise ValueError('Action not storable in plan: ' + action.__class__.__name__)
+        extras = dict((name, getattr(action, name)) for name in _EXTRAS if getattr(action, name, None))
+        if extras.get('links'):
+            extras['linkMethod'] = action.linkMethod
+        folder, name = os.path.split(action.relpath)
+        folderId = self._folderIds.get(folder)
+        if folderId is None:
+            folderId = self._folderIds[folder] = len(self._folders)
+            self._folders.append(folder)
+        st = action._measured()[1]
+        
+        self._folder.append(folderId)
+        self._names += _encode(name)
+        self._nameEnds.append(len(self._names))
+        self._kind.append(_KINDS.index(action.__class__))
+        self._size.append(action.size if action.size is not None else -1)
+        self._files.append(action.files if action.files is not None else -1)
+        self._allocated.append(action.allocated if action.allocated is not None else -1)
+        if extras:
+            self._extras[len(self._kind) - 1] = extras
+        self._mtime.append(mtimeNs(st) if st is not None else -1)
+    
+    
+    def relpath(self, i):
+        '''
+        Get the relative path of an action, without creating it.
+        @param i: The index of action.
+        @return: The relative path.
+        '''
+        start = int(self._nameEnds[i - 1]) if i > 0 else 0
+        name = _decode(bytes(self._names[start:int(self._nameEnds[i])]))
+        return os.path.join(self._folders[self._folder[i]], name)
+    
+    
+    def size(self, i):
+        '''
+        Get the size of an action, without creating it.
+        @param i: The index of action.
+        @return: The size, None if unknown.
+        '''
+        return int(self._size[i]) if self._size[i] >= 0 else None
+    
+    
+    def mtime(self, i):
+        '''
+        Get the modification time (in ns) of the object measured by an action.
+        @param i: The index of action.
+        @return: The time, None if unknown.
+        '''
+        return int(self._mtime[i]) if self._mtime[i] >= 0 else None
+    
+    
+    def __getitem__(self, i):
+        '''
+        Create an action.
+        @param i: The index of action.
+        @return: The action.
+        '''
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        relpath = self.relpath(i)
+        action = _KINDS[self._kind[i]](relpath, os.path.join(self.src, relpath), os.path.join(self.tgt, relpath))
+        action.size = self.size(i)
+        action.files = int(self._files[i]) if self._files[i] >= 0 else None
+        action.allocated = int(self._allocated[i]) if self._allocated[i] >= 0 else None
+        for name, value in self._extras.get(i, {}).items():
+            setattr(action, name, value)
+        return action
+    
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    
+    def totalSize(self):
+        '''
+        Get the total size of known action sizes, without creating actions.
+        @return: The size.
+        '''
+        return int(sum(size for size in self._size if size > 0))
+    
+    
+    def nbytes(self):
+        '''
+        Get the approximate memory used by the plan.
+        @return: The number of bytes.
+        '''
+        columns = (self._folder, self._nameEnds, self._kind, self._size, self._files, self._allocated, self._mtime)
+        return (sum(column.itemsize * len(column) for column in columns)
+                + len(self._names)
+                + sys.getsizeof(self._extras) + sum(sys.getsizeof(extras) for extras in self._extras.values())
+                + sum(sys.getsizeof(folder) for folder in self._folders)
+                + sys.getsizeof(self._folderIds))
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Model of the list of actions, independent of GUI.
+The actions are added from the threads of analyze and execution, and read by the GUI thread by batches.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import threading
+
+import action
+import throttle
+
+
+
+class ActionStore:
+    '''
+    The actions displayed by a virtual list.
+    The changes made by other threads (add, discard) are pending until flush(), called by the GUI thread:
+    so the rows don't change between two refreshes, and each refresh applies a whole batch.
+    '''
+    
+    
+    def __init__(self):
+        self._items = []
+        self._head = 0  # Index of first row in _items, the previous items were popped
+        self._pending = []
+        self._discarded = set()
+        self._lock = threading.Lock()
+    
+    
+    def __len__(self):
+        return len(self._items) - self._head
+    
+    
+    def __getitem__(self, row):
+        '''
+        Get the action of a row, in O(1).
+        @param row: The row index.
+        @return: The action.
+        '''
+        if row < 0 or row >= len(self):
+            raise IndexError(row)
+        return self._items[self._head + row]
+    
+    
+    def __iter__(self):
+        for i in range(self._head, len(self._items)):
+            yield self._items[i]
+    
+    
+    def add(self, action):
+        '''
+        Add an action, from any thread. It's visible after the next flush.
+        @param action: The action.
+        '''
+        with self._lock:
+            self._pending.append(action)
+    
+    
+    def discard(self, action):
+        '''
+        Remove an action, from any thread, in O(1). It's removed from rows at the next flush.
+        @param action: The action.
+        '''
+        with self._lock:
+            self._discarded.add(id(action))
+    
+    
+    def flush(self):
+        '''
+        Apply the pending changes. Called by the GUI thread before the refresh of list.
+        @return: True if the rows changed.
+        '''
+        with self._lock:
+            pending, self._pending = self._pending, []
+            discarded, self._discarded = self._discarded, set()
+        if not pending and not discarded:
+            return False
+        self._items.extend(pending)
+        if discarded:
+            # Remove the executed actions from the head in O(1) each, then the others in one pass
+            while self._head < len(self._items) and id(self._items[self._head]) in discarded:
+                discarded.discard(id(self._items[self._head]))
+                self._items[self._head] = None
+                self._head += 1
+            if discarded:
+                self._items = [action for action in self._items[self._head:] if id(action) not in discarded]
+                self._head = 0
+        self._compact()
+        return True
+    
+    
+    def popFront(self):
+        '''
+        Remove the first row, in O(1). Called by the GUI thread.
+        @return: The action.
+        '''
+        action = self[0]
+        self._items[self._head] = None
+        self._head += 1
+        self._compact()
+        return action
+    
+    
+    def removeRows(self, rows):
+        '''
+        Remove rows, in one pass. Called by the GUI thread.
+        @param rows: The row indexes.
+        '''
+        rows = set(rows)
+        self._items = [action for row, action in enumerate(self) if row not in rows]
+        self._head = 0
+    
+    
+    def clear(self):
+        '''Remove all rows and the pending actions.'''
+        with self._lock:
+            self._pending = []
+            self._discarded = set()
+        self._items = []
+        self._head = 0
+    
+    
+    def execute(self, actions, limits=None, lowPriority=False, progress=None, stopped=None):
+        '''
+        Execute actions one by one in the calling thread (execution of GUI), discarding each one executed.
+        @param actions: The actions, in order.
+        @param limits: The Throttle of copy engine, None to keep it.
+        @param lowPriority: Lower the priority of calling thread before (throttle.lowerPriority).
+        @param progress: The function called with the number of actions executed, after each one.
+        @param stopped: The function returning True when the execution must stop.
+        @return: The number of actions executed.
+        '''
+        if limits is not None:
+            action.Action.engine.throttle = limits
+        if lowPriority:
+            throttle.lowerPriority()
+        done = 0
+        for a in actions:
+            if stopped is not None and stopped():
+                break
+            a.execute()
+            self.discard(a)
+            done += 1
+            if progress is not None:
+                progress(done)
+        return done
+    
+    
+    def _compact(self):
+        '''Free the places of popped items, when they are the half of list.'''
+        if self._head > 1024 and self._head * 2 > len(self._items):
+            del self._items[:self._head]
+            self._head = 0
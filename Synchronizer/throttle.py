@@ -0,0 +1,236 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Limits of execution, so a synchronization doesn't slow down the other services of host.
+The bytes copied and the file operations are limited by token buckets, whose rates can be changed during the execution;
+the threads of execution can run at idle I/O priority and low CPU priority.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'throttle'
+
+
+
+IOPRIO_CLASS_IDLE = 3
+'''The I/O scheduling class served when the disk is idle (Linux).'''
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+_PRIO_PROCESS = 0
+_THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+_IOPRIO_SET = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'arm64': 30, 'armv7l': 314, 'ppc64le': 273, 'ppc64': 273}
+'''Dictionary: machine -> number of syscall ioprio_set, on Linux: neither the libc nor the os module expose it.'''
+
+
+
+class TokenBucket:
+    '''
+    Limit the rate of a quantity: the tokens are refilled at constant rate, up to the burst.
+    A quantity bigger than the burst is allowed when the bucket is full, and the next ones wait the refill of debt.
+    '''
+    
+    
+    def __init__(self, rate=None, burst=None):
+        '''
+        Constructor.
+        @param rate: The tokens per second, None for no limit.
+        @param burst: The maximal tokens accumulated, by default one second of rate.
+        '''
+        self.rate = None
+        self.burst = None
+        self.waited = 0.0
+        '''The total seconds waited by take.'''
+        self._tokens = 0.0
+        self._last = time.time()
+        self._changed = threading.Condition(threading.Lock())
+        self.setRate(rate, burst)
+    
+    
+    def setRate(self, rate, burst=None):
+        '''
+        Change the limit, even while threads are waiting.
+        @param rate: The tokens per second, None for no limit.
+        @param burst: The maximal tokens accumulated, by default one second of rate.
+        '''
+        with self._changed:
+            self._refill(time.time())
+            unlimited = self.rate is None
+            self.rate = rate or None
+            self.burst = burst or rate or None
+            if self.burst is not None:
+                self._tokens = self.burst if unlimited else min(self._tokens, self.burst)  # A new limit starts full
+            self._changed.notify_all()
+    
+    
+    def take(self, amount=1):
+        '''
+        Wait until the tokens are available, and consume them.
+        @param amount: The number of tokens.
+        @return: The seconds waited.
+        '''
+        if self.rate is None:  # Without the lock: no limit is the common case
+            return 0.0
+        start = time.time()
+        with self._changed:
+            while self.rate is not None:
+                now = time.time()
+                self._refill(now)
+                needed = min(amount, self.burst)
+                if self._tokens >= needed:
+                    self._tokens -= amount  # Can become a debt
+                    break
+                self._changed.wait((needed - self._tokens) / self.rate)
+            waited = time.time() - start
+            self.waited += waited
+        return waited
+    
+    
+    def _refill(self, now):
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+
+class Throttle:
+    '''The limits of bytes copied per second, and of file operations (files written, links, removes, renames) per second.'''
+    
+    
+    def __init__(self, bytesPerSecond=None, operationsPerSecond=None):
+        '''
+        Constructor.
+        @param bytesPerSecond: The bytes copied per second, None for no limit.
+        @param operationsPerSecond: The file operations per second, None for no limit.
+        '''
+        self.bytes = TokenBucket(bytesPerSecond)
+        self.operations = TokenBucket(operationsPerSecond)
+    
+    
+    def setLimits(self, bytesPerSecond=None, operationsPerSecond=None):
+        '''
+        Change the limits, even during the execution.
+        @param bytesPerSecond: The bytes copied per second, None for no limit.
+        @param operationsPerSecond: The file operations per second, None for no limit.
+        '''
+        self.bytes.setRate(bytesPerSecond)
+        self.operations.setRate(operationsPerSecond)
+    
+    
+    def transfer(self, amount):
+        '''
+        Wait before copying bytes.
+        @param amount: The number of bytes.
+        '''
+        self.bytes.take(amount)
+    
+    
+    def operation(self):
+        '''Wait before a file operation.'''
+        self.operations.take(1)
+    
+    
+    def waited(self):
+        '''@return: The total seconds waited by the limits.'''
+        return self.bytes.waited + self.operations.waited
+
+
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True) if sys.platform.startswith('linux') else None
+except OSError:
+    _libc = None
+
+_niced = []  # The niceness of process was increased, on systems without thread priority
+
+
+
+def _threadId():
+    '''@return: The id of calling thread in kernel, None if unavailable.'''
+    if hasattr(threading, 'get_native_id'):
+        return threading.get_native_id()
+    gettid = getattr(_libc, 'gettid', None)  # glibc 2.30
+    return gettid() if gettid is not None else None
+
+
+
+def _setNiceness(tid, niceness):
+    '''
+    Add the niceness to the CPU priority of a thread (Linux).
+    @raise OSError: The priority can't be changed.
+    '''
+    if hasattr(os, 'setpriority'):
+        os.setpriority(os.PRIO_PROCESS, tid, min(os.getpriority(os.PRIO_PROCESS, tid) + niceness, 19))
+        return
+    if _libc is None:
+        raise OSError('libc unavailable')
+    ctypes.set_errno(0)
+    current = _libc.getpriority(_PRIO_PROCESS, tid)
+    if _libc.setpriority(_PRIO_PROCESS, tid, min(current + niceness, 19)) != 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+
+
+
+def lowerPriority(idleIo=True, niceness=10):
+    '''
+    Lower the priority of calling thread.
+    On Linux, the I/O priority and the niceness are set for the thread only; on Windows, the thread enters in background mode
+    (low I/O and CPU priority); elsewhere, the niceness of process is increased.
+    @param idleIo: Use the idle I/O scheduling class.
+    @param niceness: The niceness added to CPU priority.
+    @return: True if the priority was lowered, False if not supported.
+    '''
+    if sys.platform.startswith('linux'):
+        tid = _threadId()
+        if tid is None:
+            logger.warning('Priority unchanged: thread id unavailable')
+            return False
+        lowered = True
+        if idleIo:
+            number = _IOPRIO_SET.get(platform.machine().lower())
+            if _libc is None or number is None:
+                logger.warning('I/O priority unchanged: unsupported machine %s' % platform.machine())
+                lowered = False
+            elif _libc.syscall(number, _IOPRIO_WHO_PROCESS, tid, IOPRIO_CLASS_IDLE << _IOPRIO_CLASS_SHIFT) != 0:
+                logger.warning('I/O priority unchanged: %s' % os.strerror(ctypes.get_errno()))
+                lowered = False
+        if niceness:
+            try:
+                _setNiceness(tid, niceness)
+            except OSError as e:
+                logger.warning('CPU priority unchanged: %s' % e)
+                lowered = False
+        return lowered
+    elif sys.platform == 'win32':
+        kernel32 = ctypes.windll.kernel32
+        return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), _THREAD_MODE_BACKGROUND_BEGIN))
+    elif niceness and hasattr(os, 'nice'):
+        if not _niced:  # Once for all threads
+            _niced.append(niceness)
+            os.nice(niceness)
+        return True
+    return False
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Opt-in instrumentation of a run.
+The spans (folder analyzed, action executed...) are exported in the Chrome trace event format,
+readable by chrome://tracing or Perfetto. The whole run can also be profiled by cProfile or tracemalloc.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'tracing'
+
+
+
+class Span:
+    '''A timed operation of a thread. The args can be completed until its end.'''
+    
+    
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        '''The values shown with the span: directory, bytes...'''
+        self.start = None
+    
+    
+    def __enter__(self):
+        self.start = time.time()
+        return self
+    
+    
+    def __exit__(self, excType, exc, tb):
+        end = time.time()
+        if excType is not None:
+            self.args['error'] = repr(exc)
+        self.tracer._add(self, end)
+
+
+
+class _NoSpan:
+    '''The span when tracing is disabled: it records nothing.'''
+    
+    
+    @property
+    def args(self):
+        return {}
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *exc):
+        pass
+
+
+
+_NO_SPAN = _NoSpan()
+
+
+
+class Tracer:
+    '''The spans of a run, by thread.'''
+    
+    
+    def __init__(self):
+        self.start = time.time()
+        '''The origin of timestamps.'''
+        self.events = []
+        '''The trace events of finished spans.'''
+        self._threads = {}  # Thread id -> name
+        self._lock = threading.Lock()
+    
+    
+    def span(self, name, category, **args):
+        '''
+        Create a span, to use with "with".
+        @param name: The name of operation.
+        @param category: The category of operation: "analyze", "execute"...
+        @param args: The values shown with the span.
+        @return: The Span.
+        '''
+        return Span(self, name, category, args)
+    
+    
+    def _add(self, span, end):
+        '''
+        Record a finished span.
+        @param span: The span.
+        @param end: The end time.
+        '''
+        thread = threading.current_thread()
+        tid = thread.ident
+        event = {'name': span.name,
+                 'cat': span.category,
+                 'ph': 'X',
+                 'ts': int((span.start - self.start) * 1e6),
+                 'dur': int((end - span.start) * 1e6),
+                 'pid': os.getpid(),
+                 'tid': tid,
+                 'args': span.args}
+        with self._lock:
+            self.events.append(event)
+            self._threads[tid] = thread.name
+    
+    
+    def toJson(self):
+        '''@return: The dictionary in Chrome trace event format.'''
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}}
+                    for tid, name in sorted(threads.items())]
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+    
+    
+    def write(self, path):
+        '''
+        Write the trace file.
+        @param path: The path to file.
+        '''
+        with open(path, 'w') as f:
+            json.dump(self.toJson(), f)
+
+
+
+def span(tracer, name, category, **args):
+    '''
+    Create a span of a tracer, who can be None.
+    @param tracer: The Tracer, None if tracing is disabled.
+    @param name: The name of operation.
+    @param category: The category of operation.
+    @param args: The values shown with the span.
+    @return: The span, to use with "with".
+    '''
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, category, **args)
+
+
+
+class Profile:
+    '''Profile the run of all threads by cProfile, and write the statistics (readable by pstats) at the end.'''
+    
+    
+    def __init__(self, path):
+        '''
+        Constructor.
+        @param path: The path to statistics file.
+        '''
+        self.path = path
+        self._profiles = []
+        self._lock = threading.Lock()
+    
+    
+    def _threadProfile(self, frame, event, arg):
+        '''Start a profiler in each thread started during the run, at its first call.'''
+        profile = cProfile.Profile()
+        try:
+            profile.enable()  # Replaces this function for the thread
+        except ValueError:  # Python 3.12+: one profiler at once
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._profiles.append(profile)
+    
+    
+    def __enter__(self):
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        threading.setprofile(self._threadProfile)
+        profile.enable()
+        return self
+    
+    
+    def __exit__(self, *exc):
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = None
+        for profile in profiles:
+            profile.disable()
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:  # Nothing profiled
+                pass
+        if stats is not None:
+            stats.dump_stats(self.path)
+            logger.info('Profile written: ' + self.path)
+
+
+
+class MemoryTrace:
+    '''Trace the allocations of run by tracemalloc, and write the top allocation sites at the end.'''
+    
+    
+    def __init__(self, path, limit=50):
+        '''
+        Constructor.
+        @param path: The path to report file.
+        @param limit: The number of allocation sites written.
+        '''
+        if tracemalloc is None:
+            raise RuntimeError('tracemalloc is not available (Python 3.4 or newer)')
+        self.path = path
+        self.limit = limit
+    
+    
+    def __enter__(self):
+        tracemalloc.start()
+        return self
+    
+    
+    def __exit__(self, *exc):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(self.path, 'w') as f:
+            f.write('Current: %d bytes, peak: %d bytes\n' % (current, peak))
+            for stat in snapshot.statistics('lineno')[:self.limit]:
+                f.write(str(stat) + '\n')
+        logger.info('Memory trace written: ' + self.path)
@@ -0,0 +1,319 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Continuous synchronization, driven by the inotify events of source folder (Linux).
+The events are coalesced by path, and each changed path is compared alone: the tree is not browsed again.
+A full analyze is done at start, periodically, and when events were lost.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+import action
+from executor import components
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'watcher'
+
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCHED = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+'''The events of source folders.'''
+_CREATED = IN_CREATE | IN_MOVED_TO
+_EVENT = struct.Struct('iIII')  # struct inotify_event, followed by the name
+
+
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    _libc.inotify_init1
+except (OSError, AttributeError):  # Not Linux
+    _libc = None
+
+
+
+def available():
+    '''@return: True if inotify can be used.'''
+    return _libc is not None
+
+
+
+def _check(result):
+    if result < 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+    return result
+
+
+
+class Watcher(threading.Thread):
+    '''
+    Watch the source folder, and give the actions of changed paths to the handler (by default, submitted to the executor).
+    The actions in progress are waited before the paths are compared, so an action is not given twice.
+    '''
+    
+    
+    def __init__(self, src, tgt, executor=None, delay=1.0, maxDelay=10.0, reconcile=3600.0, **analyzerOptions):
+        '''
+        Constructor.
+        @param src: The source folder.
+        @param tgt: The target folder.
+        @param executor: The Executor of actions, None if they are not executed.
+        @param delay: The seconds without event before the changed paths are compared.
+        @param maxDelay: The maximal seconds before the changed paths are compared, if events continue.
+        @param reconcile: The seconds between two full analyzes, None for only the first one.
+        @param analyzerOptions: The options of full Analyzer (workers, index, compare...).
+        '''
+        threading.Thread.__init__(self, target=self.run, name='Folder watch')
+        self.src = src
+        self.tgt = tgt
+        self.executor = executor
+        self.delay = delay
+        self.maxDelay = maxDelay
+        self.reconcile = reconcile
+        self.analyzerOptions = analyzerOptions
+        self.handler = None
+        '''Function called when an action is found. It take the action in parameter.'''
+        self.reconciliations = 0
+        '''The number of full analyzes done.'''
+        self._fd = None
+        self._watches = {}  # Watch descriptor -> relative path of folder
+        self._folders = {}  # Relative path of folder -> watch descriptor
+        self._dirty = {}  # Relative path -> mask of events
+        self._firstEvent = None
+        self._lastEvent = None
+        self._overflow = False
+        self._analyzer = None
+        self._comparer = action.Analyzer(src, tgt, **analyzerOptions)  # Compares the changed objects like the analyzes
+        self._stopRequested = False
+    
+    
+    def run(self):
+        '''Watch the source folder, until stopped.'''
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._fd = _check(_libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        try:
+            self._fullAnalyze()
+            nextReconcile = time.time() + self.reconcile if self.reconcile else None
+            while not self._stopRequested:
+                self._read(0.2)
+                now = time.time()
+                if self._overflow or (nextReconcile is not None and now >= nextReconcile):
+                    if self._overflow:
+                        logger.warning('Events lost: full analyze')
+                    self._fullAnalyze()
+                    nextReconcile = time.time() + self.reconcile if self.reconcile else None
+                elif self._dirty and (now - self._lastEvent >= self.delay or now - self._firstEvent >= self.maxDelay):
+                    self._flush()
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._watches.clear()
+            self._folders.clear()
+    
+    
+    def stop(self):
+        '''Stop the watch, and terminate the thread.'''
+        self._stopRequested = True
+        if self._analyzer is not None:
+            self._analyzer.stop()
+    
+    
+    def _watch(self, relpath):
+        '''
+        Watch a source folder and its sub-folders.
+        @param relpath: The relative path to folder.
+        '''
+        for folder, subfolders, _ in os.walk(os.path.join(self.src, relpath)):
+            sub = os.path.relpath(folder, self.src)
+            sub = os.path.join('.', sub) if sub != '.' else sub
+            try:
+                wd = _check(_libc.inotify_add_watch(self._fd, os.fsencode(folder) if hasattr(os, 'fsencode') else folder, WATCHED | IN_ONLYDIR | IN_DONT_FOLLOW))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    logger.error('Too many watches (fs.inotify.max_user_watches): changes of %s found by full analyze only' % sub)
+                    subfolders[:] = []
+                elif e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                continue
+            self._watches[wd] = sub
+            self._folders[sub] = wd
+    
+    
+    def _unwatch(self, relpath):
+        '''
+        Stop watching a folder moved out, and its sub-folders.
+        @param relpath: The old relative path to folder.
+        '''
+        prefix = relpath + os.sep
+        for sub in [sub for sub in self._folders if sub == relpath or sub.startswith(prefix)]:
+            wd = self._folders.pop(sub)
+            self._watches.pop(wd, None)
+            _libc.inotify_rm_watch(self._fd, wd)
+    
+    
+    def _read(self, timeout):
+        '''
+        Read the waiting events.
+        @param timeout: The seconds to wait an event.
+        '''
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return
+            raise
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            self._event(wd, mask, name.decode('utf-8', 'surrogateescape') if bytes is not str else name)
+    
+    
+    def _event(self, wd, mask, name):
+        '''
+        Record an event.
+        @param wd: The watch descriptor.
+        @param mask: The mask of event.
+        @param name: The name of object in folder, empty for the folder itself.
+        '''
+        if mask & IN_Q_OVERFLOW:
+            self._overflow = True
+            return
+        folder = self._watches.get(wd)
+        if mask & IN_IGNORED:
+            if folder is not None and self._folders.get(folder) == wd:
+                del self._folders[folder]
+            self._watches.pop(wd, None)
+            return
+        if folder is None:
+            return
+        relpath = os.path.join(folder, name) if name else folder
+        if mask & IN_ISDIR:
+            if mask & _CREATED:
+                self._watch(relpath)
+            elif mask & IN_MOVED_FROM:
+                self._unwatch(relpath)
+        self._dirty[relpath] = self._dirty.get(relpath, 0) | mask
+        now = time.time()
+        if self._firstEvent is None:
+            self._firstEvent = now
+        self._lastEvent = now
+    
+    
+    def _submit(self, a):
+        '''
+        Give an action to the handler, or to the executor.
+        @param a: The action.
+        '''
+        if self.handler is not None:
+            self.handler(a)
+        elif self.executor is not None:
+            self.executor.submit(a)
+    
+    
+    def _fullAnalyze(self):
+        '''Analyze the whole folders, after the actions in progress.'''
+        self._dirty = {}
+        self._firstEvent = self._lastEvent = None
+        self._overflow = False
+        self._watch('.')
+        if self.executor is not None:
+            self.executor.join()
+        self._analyzer = action.Analyzer(self.src, self.tgt, **self.analyzerOptions)
+        self._analyzer.handler = self._submit
+        self._analyzer.run()
+        self._analyzer = None
+        self.reconciliations += 1
+    
+    
+    def _flush(self):
+        '''Compare the changed paths, after the actions in progress. A path inside a replaced folder is skipped.'''
+        dirty = self._dirty
+        self._dirty = {}
+        self._firstEvent = self._lastEvent = None
+        if self.executor is not None:
+            self.executor.join()
+        done = set()  # Folders whose content is compared
+        for relpath in sorted(dirty, key=components):
+            path = components(relpath)
+            if any(path[:i] in done for i in range(len(path))):
+                continue
+            if self._compare(relpath, dirty[relpath]):
+                done.add(path)
+    
+    
+    def _compare(self, relpath, mask):
+        '''
+        Compare a changed path.
+        @param relpath: The relative path.
+        @param mask: The events of path.
+        @return: True if the content of path was compared too, for a folder.
+        '''
+        srcPath = os.path.join(self.src, relpath)
+        tgtPath = os.path.join(self.tgt, relpath)
+        srcStat = _stat(srcPath)
+        tgtStat = _stat(tgtPath)
+        if action.isdir(srcStat) and action.isdir(tgtStat):
+            if mask & _CREATED:  # Its content was created before it was watched
+                analyzer = action.Analyzer(self.src, self.tgt, subfolder=relpath, **self.analyzerOptions)
+                analyzer.handler = self._submit
+                analyzer.run()
+                return True
+            return False
+        
+        a = self._comparer.compareObject(relpath, srcStat, tgtStat)
+        if a is not None:
+            self._submit(a)
+        return a is not None and action.isdir(srcStat or tgtStat)
+
+
+
+def _stat(path):
+    '''@return: The stat of object, None if it doesn't exist.'''
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''Pool of threads sharing a work queue.'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+
+logger = logging.getLogger('synchronyzer')  # TODO: 'workers'
+
+
+
+class WorkerPool:
+    '''
+    Threads executing the tasks of a shared queue.
+    A task can submit new tasks: join() waits for them too.
+    '''
+    
+    
+    def __init__(self, workers, name='Worker', initializer=None):
+        '''
+        Constructor.
+        @param workers: The number of threads.
+        @param name: The name of threads.
+        @param initializer: The function called by each thread, before its first task.
+        '''
+        self.initializer = initializer
+        self.errors = []
+        '''The exceptions raised by tasks.'''
+        self._queue = queue.Queue()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name='%s %d' % (name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+    
+    
+    def submit(self, function, *args):
+        '''
+        Add a task to execute.
+        @param function: The function to call.
+        @param args: The arguments of function.
+        '''
+        self._queue.put((function, args))
+    
+    
+    def join(self):
+        '''Wait until all submitted tasks are done.'''
+        self._queue.join()
+    
+    
+    def close(self):
+        '''Wait the end of submitted tasks, and terminate the threads.'''
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+    
+    
+    def _work(self):
+        '''Loop of a thread.'''
+        if self.initializer is not None:
+            try:
+                self.initializer()
+            except Exception:
+                logger.exception('Thread initialization failed')
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                function, args = task
+                function(*args)
+            except Exception as e:
+                logger.exception('Task failed')
+                self.errors.append(e)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark of the path resolution in deep trees: the analyze and the copy of a tree 20+ levels deep,
+with full paths, then relative to the descriptors of folders (dirfd):
+    python deeptree.py [--depth 24] [--chains 40] [--files 10] [--tmp FOLDER]
+The copy is faster by descriptors. The analyze time is mostly spent comparing in Python, so its difference is within the noise of runs,
+in one direction or the other depending on the system.
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import action
+import copyengine
+import dirfd
+import executor
+
+
+
+def makeTree(root, depth, chains, files):
+    '''
+    Write chains of folders, with files at each level.
+    @return: The number of components resolved per object by full path, in average.
+    '''
+    components = objects = 0
+    for chain in range(chains):
+        folder = os.path.join(root, 'chain%d' % chain)
+        for level in range(depth):
+            folder = os.path.join(folder, 'level%d' % level)
+            os.makedirs(folder)
+            for i in range(files):
+                with open(os.path.join(folder, 'file%d' % i), 'wb') as f:
+                    f.write(b'x' * 100)
+            objects += files + 1
+            components += (files + 1) * len(os.path.abspath(folder).split(os.sep))
+    return float(components) / objects
+
+
+
+def analyze(src, tgt, dirFd):
+    '''
+    Compare two identical trees.
+    @return: The tuple (duration, number of actions).
+    '''
+    start = time.time()
+    found = []
+    analyzer = action.Analyzer(src, tgt, dirFd=dirFd)
+    analyzer.handler = found.append
+    analyzer.run()
+    return time.time() - start, len(found)
+
+
+
+def copy(src, tgt, engine):
+    '''
+    Copy the tree by its top folders.
+    @return: The tuple (duration, number of errors).
+    '''
+    os.makedirs(tgt)
+    if hasattr(os, 'sync'):
+        os.sync()  # The writes of previous run don't slow this one
+    actions = [action.CopyAction(name, os.path.join(src, name), os.path.join(tgt, name)) for name in os.listdir(src)]
+    for a in actions:
+        a.engine = engine
+    start = time.time()
+    results = executor.Executor(workers=4).run(actions)
+    duration = time.time() - start
+    shutil.rmtree(tgt)
+    return duration, len([result for result in results if result.error is not None])
+
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark of the access by descriptors of folders.')
+    p.add_argument('--depth', type=int, default=24)
+    p.add_argument('--chains', type=int, default=40)
+    p.add_argument('--files', type=int, default=10, help='files per folder')
+    p.add_argument('--cache', type=int, default=256, help='folders kept open')
+    p.add_argument('--repeat', type=int, default=3, help='runs of each mode, alternated: the best is kept')
+    p.add_argument('--tmp', help='folder where the trees are generated (tmpfs to measure only the path resolution)')
+    args = p.parse_args()
+    if not dirfd.supported():
+        p.error('dir_fd functions unsupported on this system')
+    logging.getLogger('synchronyzer').setLevel(logging.WARNING)
+    root = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        src = os.path.join(root, 'src')
+        components = makeTree(src, args.depth, args.chains, args.files)
+        tgt = os.path.join(root, 'tgt')
+        shutil.copytree(src, tgt)
+        print ('%d folders, %d files, %.1f components per path' % (args.depth * args.chains, args.depth * args.chains * args.files, components))
+        analyzes = {}
+        copies = {}
+        for _ in range(args.repeat):
+            for title, dirFd, engine in (('paths', 0, copyengine.CopyEngine()), ('dirfd', args.cache, dirfd.DirFdEngine(args.cache))):
+                analyzes.setdefault(title, []).append(analyze(src, tgt, dirFd))
+                copies.setdefault(title, []).append(copy(src, os.path.join(root, 'copy'), engine))
+        for title in ('paths', 'dirfd'):
+            print ('analyze, %s: %.3fs, %d actions' % ((title,) + min(analyzes[title])))
+        for title in ('paths', 'dirfd'):
+            print ('copy, %s: %.3fs, %d errors' % ((title,) + min(copies[title])))
+    finally:
+        shutil.rmtree(root)
+
+
+
+if __name__ == '__main__':
+    main()
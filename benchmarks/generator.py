@@ -0,0 +1,149 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''Deterministic generator of source and target trees, for benchmarks.'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import math
+import os
+import random
+
+
+
+FIXED = 'fixed'
+UNIFORM = 'uniform'
+LOGNORMAL = 'lognormal'
+
+_BLOCK_SIZE = 64 * 1024
+_MTIME = 1400000000
+
+
+
+def folders(depth, fanout):
+    '''
+    Get the relative paths of the folders of tree, parents first.
+    @param depth: The number of levels under root.
+    @param fanout: The number of sub-folders per folder.
+    @return: The list of relative paths, including root ('').
+    '''
+    result = ['']
+    level = ['']
+    for d in range(depth):
+        level = [os.path.join(parent, 'dir%d' % i) for parent in level for i in range(fanout)]
+        result.extend(level)
+    return result
+
+
+
+class TreeGenerator:
+    '''
+    Generate a pair of trees: the target is a previous state of the source.
+    For the same parameters, the same trees are generated.
+    '''
+    
+    
+    def __init__(self, files=1000, depth=3, fanout=4, sizeDistribution=LOGNORMAL, meanSize=16 * 1024,
+                 changed=0.05, added=0.05, removed=0.05, seed=62):
+        '''
+        Constructor.
+        @param files: The number of files of the common state.
+        @param depth: The number of folder levels.
+        @param fanout: The number of sub-folders per folder.
+        @param sizeDistribution: The distribution of file sizes: FIXED, UNIFORM (0 to 2 * mean) or LOGNORMAL.
+        @param meanSize: The mean size of files.
+        @param changed: The ratio of files whose content differs in source.
+        @param added: The ratio of files existing only in source (relative to files).
+        @param removed: The ratio of files existing only in target.
+        @param seed: The seed of random generator.
+        '''
+        self.files = files
+        self.depth = depth
+        self.fanout = fanout
+        self.sizeDistribution = sizeDistribution
+        self.meanSize = meanSize
+        self.changed = changed
+        self.added = added
+        self.removed = removed
+        self.seed = seed
+    
+    
+    def parameters(self):
+        '''@return: The dictionary of parameters.'''
+        return dict((name, getattr(self, name)) for name in ('files', 'depth', 'fanout', 'sizeDistribution', 'meanSize', 'changed', 'added', 'removed', 'seed'))
+    
+    
+    def _size(self, rand):
+        if self.sizeDistribution == FIXED:
+            return self.meanSize
+        elif self.sizeDistribution == UNIFORM:
+            return rand.randint(0, 2 * self.meanSize)
+        else:
+            sigma = 1.0
+            return int(rand.lognormvariate(math.log(max(self.meanSize, 1)) - sigma ** 2 / 2, sigma))
+    
+    
+    def _write(self, path, size, variant, mtime):
+        '''Write a file: a header specific to file, then the random block repeated.'''
+        header = ('%s:%d\n' % (path, variant)).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(header[:size])
+            remaining = size - min(len(header), size)
+            offset = variant % _BLOCK_SIZE
+            while remaining > 0:
+                chunk = self._block[offset:offset + remaining]
+                f.write(chunk)
+                remaining -= len(chunk)
+                offset = 0
+        os.utime(path, (mtime, mtime))
+    
+    
+    def generate(self, root):
+        '''
+        Create the trees.
+        @param root: The folder where "src" and "tgt" are created.
+        @return: The dictionary of generated counts: files, changed, added, removed, bytes.
+        '''
+        rand = random.Random(self.seed)
+        self._block = bytearray(rand.getrandbits(8) for i in range(_BLOCK_SIZE)) * 2
+        src = os.path.join(root, 'src')
+        tgt = os.path.join(root, 'tgt')
+        paths = folders(self.depth, self.fanout)
+        for folder in paths:
+            os.makedirs(os.path.join(src, folder))
+            os.makedirs(os.path.join(tgt, folder))
+        
+        stats = {'files': 0, 'changed': 0, 'added': 0, 'removed': 0, 'bytes': 0}
+        total = self.files + int(self.files * self.added)
+        for i in range(total):
+            relpath = os.path.join(paths[i % len(paths)], 'file%d' % i)
+            size = self._size(rand)
+            draw = rand.random()
+            if i >= self.files:
+                self._write(os.path.join(src, relpath), size, i, _MTIME)
+                stats['added'] += 1
+            elif draw < self.removed:
+                self._write(os.path.join(tgt, relpath), size, i, _MTIME)
+                stats['removed'] += 1
+            elif draw < self.removed + self.changed:
+                # The target is seen as changed by the analyze: different content and more recent
+                self._write(os.path.join(src, relpath), size, i + 1, _MTIME)
+                self._write(os.path.join(tgt, relpath), size, i, _MTIME + 60)
+                stats['changed'] += 1
+            else:
+                self._write(os.path.join(src, relpath), size, i, _MTIME)
+                self._write(os.path.join(tgt, relpath), size, i, _MTIME)
+            stats['files'] += 1
+            stats['bytes'] += size
+        return stats
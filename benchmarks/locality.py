@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark of the copy order on a seek-bound tree: many small files, written in random order across folders,
+so the order of paths is scattered on disk. The copies are executed in order of paths, then in order of location,
+with the page cache of source files dropped before each run:
+    python locality.py [FILES] [FILE SIZE KB] [--tmp FOLDER ON THE ROTATING DISK]
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import action
+import executor
+import ordering
+
+
+
+def makeTree(root, files, size, folders=32, seed=62):
+    '''
+    Write the files in random order across folders, and create the empty target folders.
+    @return: The tuple (source, target).
+    '''
+    src = os.path.join(root, 'src')
+    tgt = os.path.join(root, 'tgt')
+    for i in range(folders):
+        os.makedirs(os.path.join(src, 'folder%d' % i))
+        os.makedirs(os.path.join(tgt, 'folder%d' % i))
+    rand = random.Random(seed)
+    paths = [os.path.join(src, 'folder%d' % (i % folders), 'file%d' % i) for i in range(files)]
+    rand.shuffle(paths)
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+    os.system('sync')
+    return src, tgt
+
+
+
+def dropCache(actions):
+    '''Remove the source files from page cache, so they are read from disk.'''
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    for a in actions:
+        fd = os.open(a.srcPath, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+
+def measure(title, actions, tgt):
+    '''Execute the copies in order, and print the throughput.'''
+    dropped = dropCache(actions)
+    start = time.time()
+    results = executor.Executor(workers=1).run(actions, sort=False)
+    duration = time.time() - start
+    size = sum(a.getSize() for a in actions)
+    distance = ordering.seekDistance([a.srcPath for a in actions])
+    print ('%s: %d files, %.3fs, %.1f MB/s, %d errors%s' % (title, len(actions), duration, size / duration / 1e6,
+                                                           len([result for result in results if result.error is not None]),
+                                                           '' if dropped else ' (cache not dropped)'))
+    if distance is not None:
+        print ('    seek distance %.1f MB' % (distance / 1e6))
+    for folder in os.listdir(tgt):
+        for name in os.listdir(os.path.join(tgt, folder)):
+            os.remove(os.path.join(tgt, folder, name))
+
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark of locality ordering.')
+    p.add_argument('files', type=int, nargs='?', default=2000)
+    p.add_argument('size', type=int, nargs='?', default=64, help='size of files in KB')
+    p.add_argument('--tmp', help='folder where the tree is generated, on the measured disk')
+    args = p.parse_args()
+    logging.getLogger('synchronyzer').setLevel(logging.WARNING)
+    root = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        src, tgt = makeTree(root, args.files, args.size * 1024)
+        found = []
+        analyzer = action.Analyzer(src, tgt)
+        analyzer.handler = found.append
+        analyzer.run()
+        measure('path order', sorted(found, key=executor.sortKey), tgt)
+        measure('inode order', ordering.order(found, ordering.INODE), tgt)
+        measure('location order', ordering.order(found, ordering.FIEMAP), tgt)
+    finally:
+        shutil.rmtree(root)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark of the memory used by a plan: list of Action objects against CompactPlan:
+    python plan_memory.py [ACTIONS]
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import action
+import plan
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+
+_SRC = os.path.join(os.sep, 'data', 'archives', 'source')
+_TGT = os.path.join(os.sep, 'backup', 'archives', 'target')
+_KINDS = (action.CopyAction, action.UpdateAction, action.RemoveAction)
+
+
+
+def actions(count, perFolder=50):
+    '''
+    Generate synthetic actions, as found by an analyze.
+    @param count: The number of actions.
+    @param perFolder: The number of actions per folder.
+    '''
+    for i in range(count):
+        relpath = os.path.join('.', 'projects', 'project%d' % (i // 5000), 'folder%d' % (i // perFolder), 'file%d.dat' % i)
+        a = _KINDS[i % 3](relpath, os.path.join(_SRC, relpath), os.path.join(_TGT, relpath))
+        a.size = i * 7
+        a.files = 1
+        yield a
+
+
+
+def measure(build):
+    '''
+    Measure the memory allocated by a function.
+    @param build: The function, returning the object to keep.
+    @return: The tuple (object, allocated bytes, duration).
+    '''
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    result = build()
+    duration = time.time() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, duration
+
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark of the memory used by a plan.')
+    p.add_argument('count', type=int, nargs='?', default=1000000, help='actions in plan')
+    count = p.parse_args().count
+    if tracemalloc is None:
+        p.error('tracemalloc is required (Python 3)')
+    
+    objects, objectsSize, objectsDuration = measure(lambda: list(actions(count)))
+    print ('list of Action: %10d bytes, %6.1f bytes/action, %.2fs' % (objectsSize, float(objectsSize) / count, objectsDuration))
+    del objects
+    
+    def build():
+        compact = plan.CompactPlan(_SRC, _TGT)
+        for a in actions(count):
+            compact.append(a)
+        return compact
+    compact, compactSize, compactDuration = measure(build)
+    print ('CompactPlan:    %10d bytes, %6.1f bytes/action, %.2fs' % (compactSize, float(compactSize) / count, compactDuration))
+    print ('ratio:          %10.1fx' % (float(objectsSize) / compactSize))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark of the copy of a big file: sequential (copy_file_range, buffered), then by ranges with several threads,
+with the page cache of source dropped before each run:
+    python ranges.py [SIZE MB] [--tmp FOLDER ON THE MEASURED DISK]
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import copyengine
+
+
+
+def dropCache(path):
+    '''Remove the file from page cache, so it is read from disk.'''
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+
+def measure(title, engine, src, dst):
+    '''Copy the file, and print the throughput.'''
+    dropped = dropCache(src)
+    start = time.time()
+    engine.copy(src, dst)
+    fd = os.open(dst, os.O_RDONLY)
+    try:
+        os.fsync(fd)  # The written data are counted
+    finally:
+        os.close(fd)
+    duration = time.time() - start
+    print ('%s: %.3fs, %.1f MB/s, methods %s%s' % (title, duration, os.path.getsize(src) / duration / 1e6, engine.counts,
+                                                  '' if dropped else ' (cache not dropped)'))
+    os.remove(dst)
+
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark of the copy by ranges.')
+    p.add_argument('size', type=int, nargs='?', default=1024, help='size of file in MB')
+    p.add_argument('--tmp', help='folder where the file is generated, on the measured disk')
+    args = p.parse_args()
+    logging.getLogger('synchronyzer').setLevel(logging.WARNING)
+    root = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        src = os.path.join(root, 'src')
+        with open(src, 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size):
+                f.write(block)
+        dst = os.path.join(root, 'dst')
+        for method in (copyengine.COPY_FILE_RANGE, copyengine.BUFFERED):
+            measure(method, copyengine.CopyEngine(methods=(method, copyengine.BUFFERED)), src, dst)
+        for workers in (2, 4, 8):
+            engine = copyengine.CopyEngine(methods=(copyengine.PARALLEL, copyengine.BUFFERED), chunkThreshold=1, chunkWorkers=workers)
+            measure('%s, %d threads' % (copyengine.PARALLEL, workers), engine, src, dst)
+    finally:
+        shutil.rmtree(root)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark of the round trips to a remote target, with a server running locally.
+The analyze is compared with a target mounted by network (one stat per object), and the execution with unbatched writes:
+    python remote.py [FOLDERS] [FILES PER FOLDER] [LATENCY MS]
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import action
+import backend
+import executor
+from syscalls import makeTrees
+
+
+
+class SlowServer(backend.Server):
+    '''Server answering after a delay, like through a network.'''
+    
+    latency = 0.0
+    '''The seconds added to each request.'''
+    
+    
+    def call(self, request, data):
+        time.sleep(self.latency)
+        return backend.Server.call(self, request, data)
+
+
+
+class MountBackend(backend.RemoteBackend):
+    '''Target mounted by network: the names of folder are listed, then each object is stated.'''
+    
+    
+    def listdir(self, relpath):
+        return dict((name, self.stat(os.path.join(relpath, name))) for name in backend.RemoteBackend.listdir(self, relpath))
+
+
+
+def measure(title, backendClass, src, server, batchSize):
+    '''
+    Run the analyze and the execution to the server, and print the round trips.
+    @param title: The title of measure.
+    @param backendClass: The class of RemoteBackend.
+    @param src: The source folder.
+    @param server: The started SlowServer, whose folder is restored after.
+    @param batchSize: The number of operations sent at once.
+    '''
+    url = server.url()
+    remote = backendClass(server.server_address[:2])
+    found = []
+    analyzer = action.Analyzer(src, url, backend=remote)
+    analyzer.handler = found.append
+    start = time.time()
+    analyzer.run()
+    analyzeDuration = time.time() - start
+    analyzeTrips = remote.roundTrips
+    
+    engine = backend.BackendEngine(remote, url, batchSize=batchSize)
+    for a in found:
+        a.engine = engine
+    start = time.time()
+    errors = len([result for result in executor.Executor(workers=1).run(found) if result.error is not None])
+    executeDuration = time.time() - start
+    remote.close()
+    print ('%s: %d actions, %d errors' % (title, len(found), errors))
+    print ('    analyze    %6d round trips %8.3fs' % (analyzeTrips, analyzeDuration))
+    print ('    execute    %6d round trips %8.3fs' % (remote.roundTrips - analyzeTrips, executeDuration))
+
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark of the round trips to a remote target.')
+    p.add_argument('folders', type=int, nargs='?', default=20)
+    p.add_argument('files', type=int, nargs='?', default=50, help='files per folder')
+    p.add_argument('latency', type=float, nargs='?', default=1.0, help='delay of each round trip, in ms')
+    args = p.parse_args()
+    SlowServer.latency = args.latency / 1000
+    logging.getLogger('synchronyzer').setLevel(logging.WARNING)
+    root = tempfile.mkdtemp()
+    try:
+        src, tgt, objects = makeTrees(root, args.folders, args.files)
+        saved = os.path.join(root, 'saved')
+        shutil.copytree(tgt, saved, symlinks=True)
+        print ('%d objects, %.1fms per round trip' % (objects, SlowServer.latency * 1000))
+        for title, backendClass, batchSize in (('mount (stat per object, unbatched writes)', MountBackend, 1),
+                                               ('remote (listing with stats, batched writes)', backend.RemoteBackend, 256)):
+            server = SlowServer(tgt)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            try:
+                measure(title, backendClass, src, server, batchSize)
+            finally:
+                server.shutdown()
+                server.server_close()
+            shutil.rmtree(tgt)
+            shutil.copytree(saved, tgt, symlinks=True)
+    finally:
+        shutil.rmtree(root)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark suite of analyze and execution, on generated trees.
+The results are written as JSON, with the commit, to be compared between runs:
+    python suite.py --files 100000 --output results.json
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import action
+import executor
+import plan
+from generator import TreeGenerator, FIXED, UNIFORM, LOGNORMAL
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+
+def commit():
+    '''@return: The current git commit, None if unknown.'''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__))).decode('ascii').strip()
+    except Exception:
+        return None
+
+
+
+def maxRss():
+    '''@return: The peak resident memory of process, in bytes. None if unknown.'''
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+
+class Measure:
+    '''Measure the duration and the peak of memory allocated by Python of a step.'''
+    
+    traceMemory = tracemalloc is not None
+    '''Trace the allocations, who slow down the steps.'''
+    
+    
+    def __enter__(self):
+        if self.traceMemory:
+            tracemalloc.start()
+        self._start = time.time()
+        return self
+    
+    
+    def __exit__(self, *exc):
+        self.duration = time.time() - self._start
+        self.peakMemory = None
+        if self.traceMemory:
+            self.peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    
+    
+    def result(self, **values):
+        values['duration'] = round(self.duration, 4)
+        values['peakMemory'] = self.peakMemory
+        return values
+
+
+
+def analyze(src, tgt, **options):
+    '''
+    Run an analyze, keeping the actions in a CompactPlan.
+    @return: The tuple (result dictionary, plan).
+    '''
+    compact = plan.CompactPlan(src, tgt)
+    analyzer = action.Analyzer(src, tgt, **options)
+    analyzer.handler = compact.append
+    with Measure() as measure:
+        analyzer.run()
+    return measure.result(step='analyze', options=options, actions=len(compact), planBytes=compact.nbytes(), planSize=compact.totalSize()), compact
+
+
+
+def execute(compact, jobs):
+    '''
+    Execute a plan.
+    @return: The result dictionary.
+    '''
+    with Measure() as measure:
+        results = executor.Executor(workers=jobs).run(list(compact))
+    errors = len([result for result in results if result.error is not None])
+    return measure.result(step='execute', options={'jobs': jobs}, actions=len(results), errors=errors, bytes=compact.totalSize())
+
+
+
+def run(generator, workers, jobs, root):
+    '''
+    Run the benchmarks on generated trees.
+    @param generator: The TreeGenerator.
+    @param workers: The list of analyze threads to measure.
+    @param jobs: The number of execution threads.
+    @param root: The temporary folder.
+    @return: The list of results.
+    '''
+    results = []
+    start = time.time()
+    generated = generator.generate(root)
+    results.append({'step': 'generate', 'duration': round(time.time() - start, 4), 'generated': generated})
+    src = os.path.join(root, 'src')
+    tgt = os.path.join(root, 'tgt')
+    
+    compact = None
+    for count in workers:
+        result, compact = analyze(src, tgt, workers=count)
+        results.append(result)
+    results.append(execute(compact, jobs))
+    result, compact = analyze(src, tgt)
+    result['step'] = 'check'
+    results.append(result)
+    return results
+
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='Benchmark of Synchronizer.')
+    p.add_argument('--files', type=int, default=10000)
+    p.add_argument('--depth', type=int, default=3)
+    p.add_argument('--fanout', type=int, default=4)
+    p.add_argument('--size-distribution', choices=(FIXED, UNIFORM, LOGNORMAL), default=LOGNORMAL)
+    p.add_argument('--mean-size', type=int, default=16 * 1024)
+    p.add_argument('--changed', type=float, default=0.05)
+    p.add_argument('--added', type=float, default=0.05)
+    p.add_argument('--removed', type=float, default=0.05)
+    p.add_argument('--seed', type=int, default=62)
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='analyze threads, one run per value')
+    p.add_argument('--jobs', type=int, default=4, help='execution threads')
+    p.add_argument('--no-memory', action='store_true', help="don't trace the memory allocations, for more accurate durations")
+    p.add_argument('--tmp', help='folder where trees are generated')
+    p.add_argument('--output', help='JSON file of results (default: stdout)')
+    args = p.parse_args(argv)
+    logging.getLogger('synchronyzer').setLevel(logging.WARNING)
+    if args.no_memory:
+        Measure.traceMemory = False
+    
+    generator = TreeGenerator(files=args.files, depth=args.depth, fanout=args.fanout,
+                              sizeDistribution=args.size_distribution, meanSize=args.mean_size,
+                              changed=args.changed, added=args.added, removed=args.removed, seed=args.seed)
+    root = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        results = run(generator, args.workers, args.jobs, root)
+    finally:
+        shutil.rmtree(root)
+    
+    report = {'commit': commit(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'parameters': generator.parameters(),
+              'results': results,
+              'maxRss': maxRss()}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print (text)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+'''
+Benchmark of the number of filesystem calls done per object by the analyze:
+    python syscalls.py [FOLDERS] [FILES PER FOLDER]
+'''
+
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Synchronizer'))
+import action
+import backend
+
+
+
+class LegacyAnalyzer(action.Analyzer):
+    '''The analyze before scandir: listdir on both sides, and stats for each test.'''
+    
+    
+    def _execute(self, subfolder):
+        srcFolder = os.path.join(self.src, subfolder)
+        tgtFolder = os.path.join(self.tgt, subfolder)
+        for obj in set(os.listdir(srcFolder) + os.listdir(tgtFolder)):
+            relpath = os.path.join(subfolder, obj)
+            srcPath = os.path.join(self.src, relpath)
+            tgtPath = os.path.join(self.tgt, relpath)
+            
+            if not os.path.exists(srcPath):
+                if os.path.exists(tgtPath):
+                    self._callHandler(action.RemoveAction(relpath, srcPath, tgtPath))
+            elif os.path.isfile(srcPath):
+                if not os.path.exists(tgtPath):
+                    self._callHandler(action.CopyAction(relpath, srcPath, tgtPath))
+                elif os.path.isfile(tgtPath):
+                    if os.path.getmtime(tgtPath) > os.path.getmtime(srcPath) + 0.0001:
+                        self._callHandler(action.UpdateAction(relpath, srcPath, tgtPath))
+                elif os.path.isdir(tgtPath):
+                    self._callHandler(action.UpdateAction(relpath, srcPath, tgtPath))
+            elif os.path.isdir(srcPath):
+                if not os.path.exists(tgtPath):
+                    self._callHandler(action.CopyAction(relpath, srcPath, tgtPath))
+                elif os.path.isfile(tgtPath):
+                    self._callHandler(action.UpdateAction(relpath, srcPath, tgtPath))
+                elif os.path.isdir(tgtPath):
+                    self._execute(relpath)
+
+
+
+class CallCounter:
+    '''Count the calls to the filesystem functions used by the analyze.'''
+    
+    
+    def __init__(self):
+        self.calls = {}
+        '''Dictionary: function name -> number of calls.'''
+        self._originals = {}
+    
+    
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+    
+    
+    def _wrap(self, owner, name):
+        original = getattr(owner, name)
+        self._originals[(owner, name)] = original
+        def wrapper(*args, **kwargs):
+            self._count(name)
+            return original(*args, **kwargs)
+        setattr(owner, name, wrapper)
+    
+    
+    def _wrapScandir(self):
+        original = backend._scandir
+        self._originals[(backend, '_scandir')] = original
+        counter = self
+        class Entry:
+            def __init__(self, entry):
+                self.name = entry.name
+                self._entry = entry
+            def stat(self):
+                counter._count('DirEntry.stat')
+                return self._entry.stat()
+        def wrapper(path):
+            self._count('scandir')
+            return [Entry(entry) for entry in original(path)]
+        backend._scandir = wrapper
+    
+    
+    def __enter__(self):
+        for name in ('stat', 'lstat', 'listdir'):
+            self._wrap(os, name)
+        if backend._scandir is not None:
+            self._wrapScandir()
+        return self
+    
+    
+    def __exit__(self, *exc):
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+    
+    
+    def total(self):
+        return sum(self.calls.values())
+
+
+
+def makeTrees(root, folders, files):
+    '''
+    Generate a source and target folder, with the same content except few differences.
+    @param root: The folder where create trees.
+    @param folders: The number of sub-folders.
+    @param files: The number of files per sub-folder.
+    @return: The tuple (source, target, number of objects).
+    '''
+    src = os.path.join(root, 'src')
+    tgt = os.path.join(root, 'tgt')
+    objects = 0
+    for i in range(folders):
+        for side in (src, tgt):
+            os.makedirs(os.path.join(side, 'folder%d' % i))
+        objects += 1
+        for j in range(files):
+            name = 'file%d' % j
+            if j % 10 != 1:
+                open(os.path.join(src, 'folder%d' % i, name), 'w').close()
+            if j % 10 != 2:
+                open(os.path.join(tgt, 'folder%d' % i, name), 'w').close()
+            objects += 1
+    return src, tgt, objects
+
+
+
+def measure(cls, src, tgt):
+    '''
+    Run the analyze and count the filesystem calls.
+    @param cls: The analyzer class.
+    @return: The tuple (calls counter, number of actions, duration).
+    '''
+    actions = []
+    analyzer = cls(src, tgt)
+    analyzer.handler = actions.append
+    with CallCounter() as counter:
+        start = time.time()
+        analyzer.run()
+        duration = time.time() - start
+    return counter, len(actions), duration
+
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark of the filesystem calls of analyze.')
+    p.add_argument('folders', type=int, nargs='?', default=100)
+    p.add_argument('files', type=int, nargs='?', default=100, help='files per folder')
+    args = p.parse_args()
+    root = tempfile.mkdtemp()
+    try:
+        src, tgt, objects = makeTrees(root, args.folders, args.files)
+        for title, cls in (('before (listdir + os.path)', LegacyAnalyzer), ('after (scandir)', action.Analyzer)):
+            counter, actions, duration = measure(cls, src, tgt)
+            print ('%s: %d objects, %d actions, %.3fs' % (title, objects, actions, duration))
+            for name in sorted(counter.calls):
+                print ('    %-14s %8d' % (name, counter.calls[name]))
+            print ('    %-14s %8.2f' % ('per object', float(counter.total()) / objects))
+    finally:
+        shutil.rmtree(root)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the analyze of folders.'''
+
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import action
+import backend
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+def write(path, content='content', mtime=None):
+    '''
+    Create a file, and its parent folders.
+    @param path: The path to file.
+    @param content: The content of file.
+    @param mtime: The modification time to set.
+    '''
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+class _FailingBackend(backend.LocalBackend):
+    '''Target whose folder can't be listed.'''
+    
+    def __init__(self, root, failed):
+        backend.LocalBackend.__init__(self, root)
+        self.failed = failed
+    
+    def listdir(self, relpath):
+        if os.path.normpath(relpath) == self.failed:
+            raise OSError(errno.EACCES, os.strerror(errno.EACCES))
+        return backend.LocalBackend.listdir(self, relpath)
+
+
+class TestAnalyzer(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        now = time.time()
+        write(os.path.join(self.src, 'same'), mtime=now)
+        write(os.path.join(self.tgt, 'same'), mtime=now)
+        write(os.path.join(self.src, 'add file'))
+        write(os.path.join(self.src, 'add folder', 'sub', 'file'))
+        write(os.path.join(self.tgt, 'remove file'))
+        write(os.path.join(self.src, 'update', 'file'), mtime=now - 100)
+        write(os.path.join(self.tgt, 'update', 'file'), mtime=now)
+        write(os.path.join(self.src, 'file by folder', 'file'))
+        write(os.path.join(self.tgt, 'file by folder'))
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def _analyze(self, analyzer):
+        actions = []
+        analyzer.handler = actions.append
+        analyzer.run()
+        return dict((os.path.normpath(action.relpath), action) for action in actions)
+    
+    def test_scan(self):
+        stats = action.scan(self.src)
+        self.assertEqual(set(['same', 'add file', 'add folder', 'update', 'file by folder']), set(stats))
+        self.assertTrue(action.isdir(stats['add folder']))
+        self.assertTrue(action.isfile(stats['add file']))
+        self.assertEqual(len('content'), stats['add file'].st_size)
+    
+    def test_actions(self):
+        actions = self._analyze(action.Analyzer(self.src, self.tgt))
+        self.assertEqual(5, len(actions))
+        self.assertIsInstance(actions['add file'], action.CopyAction)
+        self.assertIsInstance(actions['add folder'], action.CopyAction)
+        self.assertIsInstance(actions['remove file'], action.RemoveAction)
+        self.assertIsInstance(actions[os.path.join('update', 'file')], action.UpdateAction)
+        self.assertIsInstance(actions['file by folder'], action.UpdateAction)
+    
+    def test_statCarried(self):
+        actions = self._analyze(action.Analyzer(self.src, self.tgt))
+        self.assertEqual(os.stat(actions['add file'].srcPath).st_ino, actions['add file'].srcStat.st_ino)
+        self.assertIsNone(actions['add file'].tgtStat)
+        self.assertEqual(os.stat(actions['remove file'].tgtPath).st_ino, actions['remove file'].tgtStat.st_ino)
+        self.assertEqual(len('content'), actions['add file'].getSize())
+    
+    def test_rollup(self):
+        write(os.path.join(self.src, 'add folder', 'other'), 'other content')
+        write(os.path.join(self.tgt, 'remove folder', 'a', 'b'), 'b')
+        write(os.path.join(self.tgt, 'remove folder', 'c'), 'cc')
+        actions = self._analyze(action.Analyzer(self.src, self.tgt))
+        self.assertEqual((len('content') + len('other content'), 2), (actions['add folder'].size, actions['add folder'].files))
+        self.assertEqual((3, 2), (actions['remove folder'].size, actions['remove folder'].files))
+        self.assertEqual((len('content'), 1), (actions['file by folder'].size, actions['file by folder'].files))
+        shutil.rmtree(self.src)
+        self.assertEqual(len('content') + len('other content'), actions['add folder'].getSize())
+
+    
+    def test_parallel(self):
+        sequential = self._analyze(action.Analyzer(self.src, self.tgt))
+        parallel = self._analyze(action.Analyzer(self.src, self.tgt, workers=4))
+        self.assertEqual(set(sequential), set(parallel))
+        for relpath in sequential:
+            self.assertIs(sequential[relpath].__class__, parallel[relpath].__class__)
+    
+    def test_unreadable(self):
+        # The folder not listed fails the analyze, with one or several threads
+        folder = os.path.join(self.tgt, 'update')
+        os.chmod(folder, 0)
+        try:
+            if os.access(folder, os.R_OK):
+                self.skipTest('folders readable by this user')
+            for workers in (1, 4):
+                self.assertRaises(OSError, self._analyze, action.Analyzer(self.src, self.tgt, workers=workers))
+        finally:
+            os.chmod(folder, 0o755)
+    
+    def test_parallelErrors(self):
+        # The errors of threads are raised after the other folders
+        found = []
+        analyzer = action.Analyzer(self.src, self.tgt, workers=4, backend=_FailingBackend(self.tgt, 'update'))
+        analyzer.handler = found.append
+        self.assertRaises(OSError, analyzer.run)
+        self.assertTrue('add file' in [os.path.basename(a.relpath) for a in found])
+    
+    def test_ordered(self):
+        orders = []
+        for workers in (1, 4, 4):
+            actions = []
+            analyzer = action.Analyzer(self.src, self.tgt, workers=workers, ordered=True)
+            analyzer.handler = actions.append
+            analyzer.run()
+            orders.append([a.relpath for a in actions])
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0], orders[2])
+        self.assertEqual(sorted(orders[0], key=lambda relpath: relpath.split(os.sep)), orders[0])
+
+    
+    def test_index(self):
+        past = time.time() - 100
+        for root in (self.src, self.tgt):
+            for folder, dirs, files in os.walk(root):
+                os.utime(folder, (past, past))
+        indexPath = os.path.join(self.root, 'index')
+        
+        first = action.Analyzer(self.src, self.tgt, index=indexPath)
+        self.assertEqual(5, len(self._analyze(first)))
+        self.assertEqual(0, first.srcIndex.hits)
+        
+        second = action.Analyzer(self.src, self.tgt, index=indexPath)
+        self.assertEqual(5, len(self._analyze(second)))
+        self.assertEqual(0, second.srcIndex.misses)
+        self.assertEqual(0, second.tgtIndex.misses)
+        
+        write(os.path.join(self.src, 'update', 'new file'))
+        third = action.Analyzer(self.src, self.tgt, index=indexPath)
+        actions = self._analyze(third)
+        self.assertEqual(6, len(actions))
+        self.assertIsInstance(actions[os.path.join('update', 'new file')], action.CopyAction)
+        self.assertEqual(1, third.srcIndex.misses)
+
+    
+    def test_content(self):
+        now = time.time()
+        write(os.path.join(self.src, 'same mtime'), 'old', mtime=now)
+        write(os.path.join(self.tgt, 'same mtime'), 'new', mtime=now)
+        write(os.path.join(self.src, 'same content'), 'same', mtime=now - 100)
+        write(os.path.join(self.tgt, 'same content'), 'same', mtime=now)
+        self.assertNotIn('same mtime', self._analyze(action.Analyzer(self.src, self.tgt)))
+        
+        cachePath = os.path.join(self.root, 'hashes')
+        analyzer = action.Analyzer(self.src, self.tgt, compare=action.Analyzer.CONTENT, hashCache=cachePath)
+        actions = self._analyze(analyzer)
+        self.assertIsInstance(actions['same mtime'], action.UpdateAction)
+        self.assertNotIn('same content', actions)
+        self.assertNotIn(os.path.join('update', 'file'), actions)
+        self.assertEqual(8, analyzer._hashes.misses)
+        
+        analyzer = action.Analyzer(self.src, self.tgt, compare=action.Analyzer.CONTENT, hashCache=cachePath)
+        self.assertEqual(set(actions), set(self._analyze(analyzer)))
+        self.assertEqual(0, analyzer._hashes.misses)
+
+    
+    def test_iterate(self):
+        actions = list(action.Analyzer(self.src, self.tgt).iterate(maxsize=1))
+        self.assertEqual(5, len(actions))
+        
+        stream = action.Analyzer(self.src, self.tgt).iterate(maxsize=1)
+        next(stream)
+        stream.close()
+        self.assertFalse(stream._thread.is_alive())
+    
+    @unittest.skipIf(sys.version_info < (3, 5), 'async for')
+    def test_asyncIterate(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            stream = action.Analyzer(self.src, self.tgt).__aiter__()
+            actions = []
+            while True:
+                try:
+                    actions.append(loop.run_until_complete(stream.__anext__()))
+                except StopAsyncIteration:
+                    break
+            self.assertEqual(5, len(actions))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
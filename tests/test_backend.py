@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the backends of target folder, and the remote target served through a socket.'''
+
+
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+import action
+import backend
+import executor
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestBackend(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        old = time.time() - 3600
+        write(os.path.join(self.src, 'same'), 'same', mtime=old)
+        write(os.path.join(self.tgt, 'same'), 'same', mtime=old)
+        write(os.path.join(self.src, 'updated'), 'new content', mtime=old)
+        write(os.path.join(self.tgt, 'updated'), 'old')
+        write(os.path.join(self.src, 'folder', 'sub', 'file'), 'x' * 3000)
+        write(os.path.join(self.src, 'folder', 'empty'), '')
+        write(os.path.join(self.tgt, 'removed', 'file'), 'removed!')
+        self.server = backend.Server(self.tgt)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = self.server.url()
+        self.remote = backend.connect(self.url)
+    
+    def tearDown(self):
+        self.remote.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+    
+    def test_list(self):
+        local = backend.LocalBackend(self.tgt)
+        listed = self.remote.listdir('.')
+        self.assertEqual(sorted(local.listdir('.')), sorted(listed))
+        self.assertEqual(4, listed['same'].st_size)
+        self.assertTrue(action.isdir(listed['removed']))
+        self.assertEqual(1, self.remote.roundTrips)
+        self.assertEqual((8, 1), self.remote.measure('removed')[:2])
+        self.assertRaises(OSError, self.remote.stat, 'missing')
+        self.assertRaises(backend.BackendError, self.remote.listdir, os.path.join('..', 'src'))
+    
+    def test_sync(self):
+        analyzer = action.Analyzer(self.src, self.url, backend=self.remote, ordered=True)
+        found = []
+        analyzer.handler = found.append
+        analyzer.run()
+        self.assertEqual(['CopyAction', 'RemoveAction', 'UpdateAction'], [a.__class__.__name__ for a in found])
+        self.assertEqual(8, found[1].size)  # Measured by server
+        self.assertEqual(2, self.remote.roundTrips)  # Target listed at once, and removed folder measured
+        
+        engine = backend.BackendEngine(backend.connect(self.url), self.url)
+        for a in found:
+            a.engine = engine
+        results = executor.Executor().run(found)
+        self.assertEqual([None] * 3, [result.error for result in results])
+        self.assertTrue(1 <= engine.batches <= 3)  # Each action sends the operations queued until its end
+        self.assertEqual(2 + engine.batches, self.server.requests)  # Listing, measure of removed folder, and batches
+        with open(os.path.join(self.tgt, 'folder', 'sub', 'file')) as f:
+            self.assertEqual('x' * 3000, f.read())
+        self.assertFalse(os.path.exists(os.path.join(self.tgt, 'removed')))
+        
+        analyzer = action.Analyzer(self.src, self.url, backend=self.remote)
+        analyzer.handler = found.append
+        del found[:]
+        analyzer.run()
+        self.assertEqual([], found)
+        engine.backend.close()
+    
+    def test_parts(self):
+        engine = backend.BackendEngine(self.remote, self.url, batchSize=2, bufferSize=1024)
+        engine.copy(os.path.join(self.src, 'folder'), os.path.join(self.url, 'folder'))
+        engine.flush()
+        self.assertEqual(3, engine.batches)  # 6 operations: 2 folders, empty file, 3 parts of file
+        with open(os.path.join(self.tgt, 'folder', 'sub', 'file')) as f:
+            self.assertEqual('x' * 3000, f.read())
+        self.assertAlmostEqual(os.path.getmtime(os.path.join(self.src, 'folder', 'sub', 'file')), os.path.getmtime(os.path.join(self.tgt, 'folder', 'sub', 'file')), delta=0.0001)
+        
+        
+        # The failed operation is raised by its action, after its batch
+        self.assertRaises(backend.BackendError, engine.remove, os.path.join(self.url, 'missing'))
+        self.assertEqual(4, engine.batches)
+        engine.flush()
+    
+    def test_errors(self):
+        # The actions sharing a batch get their own errors
+        engine = backend.BackendEngine(self.remote, self.url)
+        removed = action.RemoveAction('missing', os.path.join(self.src, 'missing'), os.path.join(self.url, 'missing'))
+        copied = action.CopyAction('folder', os.path.join(self.src, 'folder'), os.path.join(self.url, 'folder'))
+        for a in (removed, copied):
+            a.engine = engine
+        results = executor.Executor(workers=2).run([removed, copied])
+        errors = dict((result.action.relpath, result.error) for result in results)
+        self.assertTrue(isinstance(errors['missing'], backend.BackendError))
+        self.assertEqual(None, errors['folder'])
+        self.assertTrue(os.path.isfile(os.path.join(self.tgt, 'folder', 'sub', 'file')))
+
+    
+    def test_garbledReply(self):
+        # The first reply announces a shorter message than sent: its end stays in the connection
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(2)
+        connections = []
+        def serve():
+            for reply in (b'{"res', b'{"result": [1, 2]}'):
+                sock = listener.accept()[0]
+                connections.append(sock)
+                backend._receive(sock)
+                sock.sendall(struct.pack('!II', len(reply), 0) + reply + b'ult": "stale"}')
+                sock.close()
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        remote = backend.RemoteBackend(listener.getsockname())
+        try:
+            self.assertRaises(ValueError, remote.measure, '.')
+            self.assertEqual((1, 2), remote.measure('.'))  # On a new connection
+            self.assertEqual(2, len(connections))
+        finally:
+            remote.close()
+            listener.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
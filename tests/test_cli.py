@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the command line.'''
+
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import cli
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class Lines:
+    '''Stream keeping the written JSON objects.'''
+    
+    def __init__(self):
+        self.text = ''
+    
+    def write(self, text):
+        self.text += text
+    
+    def flush(self):
+        pass
+    
+    def objects(self):
+        return [json.loads(line) for line in self.text.splitlines()]
+
+
+class TestCli(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        os.makedirs(os.path.join(self.src, 'folder'))
+        os.makedirs(self.tgt)
+        for path in (os.path.join(self.src, 'folder', 'file'), os.path.join(self.src, 'file'), os.path.join(self.tgt, 'old')):
+            with open(path, 'w') as f:
+                f.write('content')
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def _run(self, *argv):
+        args = cli.parser().parse_args(argv)
+        output = cli.Output(Lines())
+        getattr(cli, args.command)(args, output)
+        output.writeSummary()
+        return output.stream.objects()
+    
+    def test_analyzeExecute(self):
+        lines = self._run('analyze', self.src, self.tgt, '--ordered')
+        self.assertEqual(['CopyAction', 'CopyAction', 'RemoveAction'], [line['type'] for line in lines[:-1]])
+        self.assertEqual({'actions': 3, 'byType': {'Add': 2, 'Remove': 1}, 'bytes': 21, 'files': 3, 'errors': 0}, dict((k, v) for k, v in lines[-1]['summary'].items() if k not in ('elapsed', 'allocated')))
+        
+        plan = os.path.join(self.root, 'plan')
+        with open(plan, 'w') as f:
+            f.write('\n\n'.join(json.dumps(line) for line in lines) + '\n \n')  # Blank lines skipped
+        lines = self._run('execute', plan, '--staged')
+        self.assertEqual(['ok'] * 3, [line['status'] for line in lines[:-1]])
+        self.assertEqual(['file', 'folder'], sorted(os.listdir(self.tgt)))
+        
+        lines = self._run('sync', self.src, self.tgt)
+        self.assertEqual(0, lines[-1]['summary']['actions'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the copy engine.'''
+
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+import action
+import copyengine
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class _OrderedDurability(copyengine.Durability):
+    '''Durability recording each synchronized path, with the type of target at that time.'''
+    
+    def __init__(self, dst):
+        copyengine.Durability.__init__(self)
+        self.dst = dst
+        self.synced = []
+    
+    def _sync(self, path):
+        copyengine.Durability._sync(self, path)
+        state = None
+        if os.path.lexists(self.dst):
+            state = 'folder' if os.path.isdir(self.dst) else 'file'
+        self.synced.append((path, state))
+
+
+class _FailingEngine(copyengine.CopyEngine):
+    '''Engine whose reflink fails with an error, counting its attempts.'''
+    
+    def __init__(self, code):
+        copyengine.CopyEngine.__init__(self, methods=(copyengine.REFLINK, copyengine.BUFFERED))
+        self.code = code
+        self.attempts = 0
+    
+    def _reflink(self, srcFd, dstFd, size, devices):
+        self.attempts += 1
+        raise OSError(self.code, os.strerror(self.code))
+
+
+class TestCopyEngine(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.content = os.urandom(3 * 1024 * 1024 + 17)
+        with open(self.src, 'wb') as f:
+            f.write(self.content)
+        os.utime(self.src, (1000000000, 1000000000))
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def _checkCopy(self, dst):
+        with open(dst, 'rb') as f:
+            self.assertEqual(self.content, f.read())
+        self.assertEqual(1000000000, int(os.stat(dst).st_mtime))
+    
+    def test_methods(self):
+        for method in (copyengine.REFLINK, copyengine.COPY_FILE_RANGE, copyengine.SENDFILE, copyengine.BUFFERED):
+            engine = copyengine.CopyEngine(methods=(method, copyengine.BUFFERED))
+            dst = os.path.join(self.root, method)
+            engine.copy(self.src, dst)
+            self._checkCopy(dst)
+            self.assertEqual(1, sum(engine.counts.values()))
+    
+    def test_overwrite(self):
+        dst = os.path.join(self.root, 'dst')
+        with open(dst, 'wb') as f:
+            f.write(b'x' * (4 * 1024 * 1024))
+        copyengine.CopyEngine().copy(self.src, dst)
+        self._checkCopy(dst)
+    
+    def test_copyTree(self):
+        folder = os.path.join(self.root, 'folder')
+        os.makedirs(os.path.join(folder, 'sub'))
+        shutil.copy2(self.src, os.path.join(folder, 'sub', 'file'))
+        copyengine.CopyEngine().copy(folder, os.path.join(self.root, 'copy'))
+        self._checkCopy(os.path.join(self.root, 'copy', 'sub', 'file'))
+    
+    
+    def test_staged(self):
+        engine = copyengine.CopyEngine(staged=True)
+        folder = os.path.join(self.root, 'folder')
+        os.makedirs(folder)
+        shutil.copy2(self.src, os.path.join(folder, 'file'))
+        dst = os.path.join(self.root, 'dst')
+        
+        engine.copy(self.src, dst)
+        self._checkCopy(dst)
+        with open(dst, 'wb') as f:
+            f.write(b'old')
+        engine.replace(self.src, dst)
+        self._checkCopy(dst)
+        engine.replace(folder, dst)
+        self._checkCopy(os.path.join(dst, 'file'))
+        engine.replace(self.src, dst)
+        self._checkCopy(dst)
+        self.assertEqual(set(['src', 'dst', 'folder']), set(os.listdir(self.root)))
+    
+    def test_stagedDurability(self):
+        folder = os.path.join(self.root, 'folder')
+        os.makedirs(folder)
+        shutil.copy2(self.src, os.path.join(folder, 'file'))
+        dst = os.path.join(self.root, 'dst')
+        durability = _OrderedDurability(dst)
+        engine = copyengine.CopyEngine(staged=True, durability=durability)
+        
+        # The staged file is synchronized, renamed, then its parent folder is synchronized
+        engine.copy(self.src, dst)
+        self.assertFalse(os.path.exists(dst))
+        engine.flush()
+        self._checkCopy(dst)
+        self.assertEqual([None, 'file'], [state for _, state in durability.synced])
+        self.assertEqual(self.root, durability.synced[-1][0])
+        
+        # The content of staged folder is synchronized before it replaces the target
+        del durability.synced[:]
+        engine.replace(folder, dst)
+        self.assertTrue(os.path.isfile(dst))
+        engine.flush()
+        self._checkCopy(os.path.join(dst, 'file'))
+        self.assertEqual(['file', 'file', 'folder'], [state for _, state in durability.synced])
+        stagedFile, stagedFolder, parent = [path for path, _ in durability.synced]
+        self.assertEqual((stagedFolder, 'file'), os.path.split(stagedFile))
+        self.assertEqual(self.root, parent)
+        
+        # A staged object not renamed yet is renamed before its target is removed
+        engine.replace(self.src, dst)
+        engine.remove(dst)
+        self.assertEqual(set(['src', 'folder']), set(os.listdir(self.root)))
+        self.assertEqual(3, durability.commits)
+    
+    def test_sparse(self):
+        sparse = os.path.join(self.root, 'sparse')
+        with open(sparse, 'wb') as f:
+            f.seek(10 * 1024 * 1024)
+            f.write(b'data')
+            f.write(b'\0' * (1024 * 1024))  # Written zeros become a hole
+            f.write(b'end')
+            f.truncate(30 * 1024 * 1024)
+        if action.allocated(os.stat(sparse)) >= 2 * 1024 * 1024:
+            self.skipTest('Filesystem without holes')
+        self.assertEqual(30 * 1024 * 1024, action.rollup(sparse)[0])
+        
+        engine = copyengine.CopyEngine(methods=(copyengine.SPARSE, copyengine.BUFFERED))
+        dst = os.path.join(self.root, 'dst')
+        engine.copy(sparse, dst)
+        self.assertEqual({copyengine.SPARSE: 1}, engine.counts)
+        with open(sparse, 'rb') as f, open(dst, 'rb') as g:
+            self.assertTrue(f.read() == g.read())
+        size, files, allocated = action.rollup(dst)
+        self.assertEqual((30 * 1024 * 1024, 1), (size, files))
+        self.assertTrue(allocated < 1024 * 1024)
+        
+        # Not sparse: copied by another method
+        engine.copy(self.src, os.path.join(self.root, 'full'))
+        self.assertEqual({copyengine.SPARSE: 1, copyengine.BUFFERED: 1}, engine.counts)
+    
+    @unittest.skipUnless(hasattr(os, 'pread'), 'positional reads and writes')
+    def test_parallel(self):
+        engine = copyengine.CopyEngine(methods=(copyengine.PARALLEL, copyengine.BUFFERED), chunkThreshold=1024 * 1024, chunkSize=1024 * 1024 + 5)
+        engine.copy(self.src, os.path.join(self.root, 'ranges'))
+        self._checkCopy(os.path.join(self.root, 'ranges'))
+        self.assertEqual({copyengine.PARALLEL: 1}, engine.counts)
+        
+        # Positional reads and writes, without copy_file_range
+        devices = (os.stat(self.src).st_dev, os.stat(self.root).st_dev)
+        engine._unsupported.add((copyengine.COPY_FILE_RANGE, devices))
+        engine.bufferSize = 100000
+        engine.copy(self.src, os.path.join(self.root, 'pread'))
+        self._checkCopy(os.path.join(self.root, 'pread'))
+        
+        # Under the threshold: copied by another method
+        engine.chunkThreshold = len(self.content) + 1
+        engine.copy(self.src, os.path.join(self.root, 'small'))
+        self.assertEqual({copyengine.PARALLEL: 2, copyengine.BUFFERED: 1}, engine.counts)
+    
+    def test_fallback(self):
+        # Unsupported between these filesystems: not tried again
+        engine = _FailingEngine(errno.EXDEV)
+        for name in ('a', 'b'):
+            engine.copy(self.src, os.path.join(self.root, name))
+            self._checkCopy(os.path.join(self.root, name))
+        self.assertEqual(1, engine.attempts)
+        
+        # Failed for this file only: tried for the next one
+        engine = _FailingEngine(errno.EINVAL)
+        for name in ('c', 'd'):
+            engine.copy(self.src, os.path.join(self.root, name))
+            self._checkCopy(os.path.join(self.root, name))
+        self.assertEqual(2, engine.attempts)
+        self.assertEqual({copyengine.BUFFERED: 2}, engine.counts)
+    
+    def test_preallocate(self):
+        engine = copyengine.CopyEngine(preallocate=True)
+        fd = os.open(os.path.join(self.root, 'allocated'), os.O_WRONLY | os.O_CREAT)
+        try:
+            engine._allocate(fd, len(self.content))
+            st = os.fstat(fd)
+        finally:
+            os.close(fd)
+        # Blocks reserved by the filesystem, or nothing written
+        self.assertTrue(st.st_size == 0 or st.st_blocks * 512 >= len(self.content))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the deduplication of copied files.'''
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import copyengine
+import dedup
+import executor
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestDedup(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        self.old = time.time() - 3600
+        for path in ('a', 'b', os.path.join('folder', 'c'), os.path.join('folder', 'sub', 'd')):
+            write(os.path.join(self.src, path), 'x' * 8192, mtime=self.old)
+        write(os.path.join(self.src, 'other'), 'y' * 8192)
+        write(os.path.join(self.src, 'small'), 'x')
+        os.makedirs(self.tgt)
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def plan(self, method):
+        found = []
+        analyzer = action.Analyzer(self.src, self.tgt)
+        analyzer.handler = found.append
+        analyzer.run()
+        return dedup.plan(found, method=method)
+    
+    def assertCopied(self, sub='.'):
+        for root, folders, files in os.walk(os.path.join(self.src, sub)):
+            for name in files:
+                path = os.path.join(root, name)
+                with open(path) as f, open(os.path.join(self.tgt, os.path.relpath(path, self.src))) as g:
+                    self.assertEqual(f.read(), g.read())
+    
+    def test_hardlink(self):
+        actions, saved = self.plan(copyengine.HARDLINK)
+        self.assertEqual(3 * 8192, saved)
+        self.assertEqual([('CopyAction', 'a'), ('LinkAction', 'b'), ('CopyAction', 'folder'), ('CopyAction', 'other'), ('CopyAction', 'small')],
+                         [(a.__class__.__name__, os.path.relpath(a.relpath)) for a in actions])
+        self.assertEqual(0, actions[2].size)
+        self.assertEqual([os.path.join('.', 'a')] * 2, actions[2].requires)
+        
+        results = executor.Executor(workers=4).run(actions)
+        self.assertEqual([None] * 5, [result.error for result in results])
+        self.assertCopied()
+        inode = os.stat(os.path.join(self.tgt, 'a')).st_ino
+        for path in ('b', os.path.join('folder', 'c'), os.path.join('folder', 'sub', 'd')):
+            self.assertEqual(inode, os.stat(os.path.join(self.tgt, path)).st_ino)
+        self.assertNotEqual(inode, os.stat(os.path.join(self.tgt, 'other')).st_ino)
+    
+    def test_hardlinkTimes(self):
+        # A file with other times is copied: the next sync doesn't update it, breaking the links
+        os.utime(os.path.join(self.src, 'b'), (self.old - 60, self.old - 60))
+        actions, saved = self.plan(copyengine.HARDLINK)
+        self.assertEqual(2 * 8192, saved)
+        executor.Executor(workers=4).run(actions)
+        self.assertCopied()
+        self.assertEqual(3, os.stat(os.path.join(self.tgt, 'a')).st_nlink)
+        self.assertEqual(1, os.stat(os.path.join(self.tgt, 'b')).st_nlink)
+        
+        actions, saved = self.plan(copyengine.HARDLINK)
+        self.assertEqual([], actions)
+        self.assertEqual(3, os.stat(os.path.join(self.tgt, 'a')).st_nlink)
+    
+    def test_reflink(self):
+        # Copied if the filesystem doesn't support reflinks
+        actions, saved = self.plan(copyengine.REFLINK)
+        self.assertEqual(3 * 8192, saved)
+        executor.Executor(workers=4).run(actions)
+        self.assertCopied()
+    
+    def test_sameFolder(self):
+        shutil.rmtree(os.path.join(self.src, 'folder', 'sub'))
+        write(os.path.join(self.src, 'folder', 'b'), 'x' * 8192, mtime=self.old)
+        write(os.path.join(self.src, 'folder', 'a'), 'x' * 8192, mtime=self.old)
+        os.remove(os.path.join(self.src, 'a'))
+        os.remove(os.path.join(self.src, 'b'))
+        actions, saved = self.plan(copyengine.HARDLINK)
+        self.assertEqual(2 * 8192, saved)
+        copy = [a for a in actions if a.relpath == os.path.join('.', 'folder')][0]
+        self.assertEqual([], copy.requires)
+        copy.engine = copyengine.CopyEngine(staged=True)
+        copy.execute()
+        self.assertCopied('folder')
+        self.assertEqual(3, os.stat(os.path.join(self.tgt, 'folder', 'a')).st_nlink)
+
+
+if __name__ == '__main__':
+    unittest.main()
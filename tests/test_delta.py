@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the delta transfer of files.'''
+
+
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import delta
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class _Interruption:
+    '''Throttle failing after the first write.'''
+    
+    def operation(self):
+        pass
+    
+    def transfer(self, amount):
+        raise IOError('Interrupted')
+
+
+class TestDelta(unittest.TestCase):
+    _BLOCK_SIZE = 1024
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        rand = random.Random(62)
+        self.old = bytearray(rand.getrandbits(8) for i in range(100 * TestDelta._BLOCK_SIZE + 10))
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def _patch(self, new):
+        with open(self.tgt, 'wb') as f:
+            f.write(self.old)
+        with open(self.src, 'wb') as f:
+            f.write(new)
+        stats = delta.patch(self.src, self.tgt, TestDelta._BLOCK_SIZE)
+        with open(self.tgt, 'rb') as f:
+            self.assertEqual(bytes(new), f.read())
+        self.assertEqual(len(new), stats.reused + stats.literal)
+        return stats
+    
+    def test_roll(self):
+        data = bytearray(self.old[:3 * TestDelta._BLOCK_SIZE])
+        checksum = delta.weakChecksum(data[:TestDelta._BLOCK_SIZE])
+        for i in range(2 * TestDelta._BLOCK_SIZE):
+            checksum = delta.roll(checksum, data[i], data[i + TestDelta._BLOCK_SIZE], TestDelta._BLOCK_SIZE)
+            self.assertEqual(delta.weakChecksum(data[i + 1:i + 1 + TestDelta._BLOCK_SIZE]), checksum)
+    
+    def test_unchanged(self):
+        stats = self._patch(self.old)
+        self.assertEqual(0, stats.written)
+    
+    def test_insertion(self):
+        # In place, the blocks moved forward are overwritten before they are reached: they are literal
+        new = self.old[:50 * TestDelta._BLOCK_SIZE + 7] + bytearray(b'inserted') + self.old[50 * TestDelta._BLOCK_SIZE + 7:]
+        stats = self._patch(new)
+        self.assertEqual(len(new) - 50 * TestDelta._BLOCK_SIZE, stats.written)
+    
+    def test_deletion(self):
+        new = self.old[:50 * TestDelta._BLOCK_SIZE + 7] + self.old[50 * TestDelta._BLOCK_SIZE + 15:]
+        stats = self._patch(new)
+        self.assertTrue(stats.literal <= TestDelta._BLOCK_SIZE)
+        self.assertEqual(len(new) - 50 * TestDelta._BLOCK_SIZE, stats.written)
+    
+    def test_modification(self):
+        new = bytearray(self.old)
+        new[10] ^= 0xff
+        new[-1] ^= 0xff
+        stats = self._patch(new + bytearray(b'appended'))
+        self.assertEqual(99 * TestDelta._BLOCK_SIZE, stats.reused)
+        self.assertEqual(TestDelta._BLOCK_SIZE + 10 + len(b'appended'), stats.written)  # The blocks at the same offset are not written
+        self.assertEqual(stats.literal, stats.written)
+    
+    def test_updateAction(self):
+        new = self.old[:-100]
+        self._patch(self.old)
+        with open(self.src, 'wb') as f:
+            f.write(new)
+        update = action.UpdateAction('tgt', self.src, self.tgt)
+        update.delta = True
+        update.deltaThreshold = 0
+        update.execute()
+        with open(self.tgt, 'rb') as f:
+            self.assertEqual(bytes(new), f.read())
+        self.assertEqual(len(new) - len(new) % delta.BLOCK_SIZE, update.deltaStats.reused)
+
+    
+    def test_interrupted(self):
+        # The source time in the future: the writes alone leave the target older than source
+        now = time.time()
+        new = bytearray(self.old)
+        new[10] ^= 0xff
+        with open(self.tgt, 'wb') as f:
+            f.write(self.old)
+        with open(self.src, 'wb') as f:
+            f.write(new)
+        os.utime(self.src, (now + 1000, now + 1000))
+        os.utime(self.tgt, (now + 2000, now + 2000))
+        self.assertRaises(IOError, delta.patch, self.src, self.tgt, TestDelta._BLOCK_SIZE, _Interruption())
+        compared = action.Analyzer(self.root, self.root).compareObject('tgt', os.stat(self.src), os.stat(self.tgt))
+        self.assertIsInstance(compared, action.UpdateAction)
+
+
+if __name__ == '__main__':
+    unittest.main()
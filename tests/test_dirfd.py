@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the access to deep trees by descriptors of folders.'''
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import backend
+import dirfd
+import executor
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+DEPTH = 25
+
+
+def content(root):
+    '''@return: The dictionary: relative path -> content of file, None for a folder.'''
+    found = {}
+    for folder, folders, names in os.walk(root):
+        for name in folders:
+            found[os.path.relpath(os.path.join(folder, name), root)] = None
+        for name in names:
+            with open(os.path.join(folder, name)) as f:
+                found[os.path.relpath(os.path.join(folder, name), root)] = f.read()
+    return found
+
+
+@unittest.skipUnless(dirfd.supported(), 'dir_fd functions')
+class TestDirFd(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        old = time.time() - 3600
+        deep = os.path.join(*['level%d' % i for i in range(DEPTH)])
+        write(os.path.join(self.src, deep, 'new', 'file'), 'new')
+        write(os.path.join(self.src, deep, 'same'), 'same', mtime=old)
+        write(os.path.join(self.tgt, deep, 'same'), 'same', mtime=old)
+        write(os.path.join(self.src, deep, 'updated'), 'new content', mtime=old)
+        write(os.path.join(self.tgt, deep, 'updated'), 'old')
+        write(os.path.join(self.tgt, deep, 'removed', 'file'), 'removed!')
+        os.chmod(os.path.join(self.src, deep, 'new', 'file'), 0o640)
+        self.deep = deep
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def test_cache(self):
+        folders = dirfd.FolderCache(size=3)
+        with folders.open(os.path.join(self.src, self.deep)) as fd:
+            self.assertEqual(DEPTH + len(self.src.split(os.sep)), folders.opened)  # Each folder relative to its parent
+            self.assertEqual(3, len(folders))
+            with folders.open(self.tgt):  # The least recent folders are closed, not the one in use
+                self.assertEqual(3, len(folders))
+            self.assertEqual(['new', 'same', 'updated'], sorted(dirfd.scanAt(fd)))
+        opened = folders.opened
+        with folders.open(os.path.join(self.src, self.deep, 'new')):
+            pass
+        self.assertEqual(opened + 1, folders.opened)  # Relative to its parent in cache
+        
+        with folders.open(self.src) as fd:
+            folders.forget(self.src)  # Closed when no more used
+            os.fstat(fd)
+        opened = folders.opened
+        with folders.open(os.path.join(self.src, self.deep)):
+            pass
+        self.assertEqual(opened + DEPTH + 1, folders.opened)  # The folder and its sub-folders opened again, relative to the parent of folder
+        folders.close()
+    
+    def test_backend(self):
+        local = backend.LocalBackend(self.tgt)
+        storage = dirfd.DirFdBackend(self.tgt, cacheSize=4)
+        self.assertEqual(sorted(local.listdir(self.deep)), sorted(storage.listdir(self.deep)))
+        self.assertEqual(local.stat(self.deep).st_ino, storage.stat(self.deep).st_ino)
+        self.assertEqual(local.measure('.'), storage.measure('.'))
+        self.assertRaises(OSError, storage.stat, 'missing')
+        storage.close()
+    
+    def test_sync(self):
+        found = []
+        analyzer = action.Analyzer(self.src, self.tgt, ordered=True, dirFd=4)
+        analyzer.handler = found.append
+        analyzer.run()
+        self.assertEqual(['CopyAction', 'RemoveAction', 'UpdateAction'], [a.__class__.__name__ for a in found])
+        
+        engine = dirfd.DirFdEngine(cacheSize=4)
+        for a in found:
+            a.engine = engine
+        results = executor.Executor().run(found)
+        self.assertEqual([None] * 3, [result.error for result in results])
+        self.assertEqual(content(self.src), content(self.tgt))
+        for name in ('new', os.path.join('new', 'file'), 'updated'):
+            srcStat = os.stat(os.path.join(self.src, self.deep, name))
+            tgtStat = os.stat(os.path.join(self.tgt, self.deep, name))
+            self.assertEqual((srcStat.st_mode, int(srcStat.st_mtime)), (tgtStat.st_mode, int(tgtStat.st_mtime)))
+        
+        # Moved and removed folders are forgotten by the cache
+        moved = os.path.join(self.tgt, self.deep, 'moved')
+        engine.rename(os.path.join(self.tgt, self.deep, 'new'), moved)
+        engine.copyFile(os.path.join(self.src, self.deep, 'same'), os.path.join(moved, 'copy'))
+        self.assertTrue(os.path.isfile(os.path.join(moved, 'copy')))
+        engine.remove(moved)
+        engine.remove(os.path.join(self.tgt, self.deep, 'same'))
+        self.assertEqual(['updated'], os.listdir(os.path.join(self.tgt, self.deep)))
+        engine.folders.close()
+    
+    def test_staged(self):
+        # The staged folders are forgotten when renamed over their target
+        engine = dirfd.DirFdEngine(cacheSize=64, staged=True)
+        src = os.path.join(self.src, 'level0')
+        dst = os.path.join(self.root, 'copy')
+        engine.copy(src, dst)
+        engine.replace(src, dst)
+        self.assertEqual(content(src), content(dst))
+        self.assertEqual(['copy', 'src', 'tgt'], sorted(os.listdir(self.root)))
+        engine.folders.forget(self.src)
+        self.assertTrue(len(engine.folders) <= len(self.root.split(os.sep)))  # Only the source folders and the parents of copy were kept open
+        engine.folders.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the parallel execution of actions.'''
+
+
+import errno
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import copyengine
+import executor
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class FakeAction(action.Action):
+    '''Action who records its execution.'''
+    
+    def __init__(self, relpath, events, fail=False):
+        action.Action.__init__(self, relpath, None, None)
+        self.events = events
+        self.fail = fail
+    
+    def execute(self):
+        self.events.append(('start', self.relpath))
+        time.sleep(0.01)
+        self.events.append(('end', self.relpath))
+        if self.fail:
+            raise IOError('Failure')
+
+
+class _FailingCommitEngine(copyengine.CopyEngine):
+    '''Staged engine whose rename over the target named bad fails.'''
+    
+    def _commit(self, stagedPath, dst, replace):
+        if os.path.basename(dst) == 'bad':
+            copyengine.delete(stagedPath)
+            raise OSError(errno.EACCES, 'Rename refused')
+        copyengine.CopyEngine._commit(self, stagedPath, dst, replace)
+
+
+class TestExecutor(unittest.TestCase):
+    
+    def test_order(self):
+        events = []
+        actions = [FakeAction(os.path.join('a', 'b', 'c'), events),
+                   FakeAction(os.path.join('a', 'b'), events),
+                   FakeAction(os.path.join('a', 'x'), events),
+                   FakeAction('a', events),
+                   FakeAction('other', events)]
+        results = executor.Executor(workers=4).run(actions)
+        self.assertEqual(5, len(results))
+        self.assertTrue(all(result.error is None for result in results))
+        position = lambda event: events.index(event)
+        self.assertTrue(position(('end', 'a')) < position(('start', os.path.join('a', 'b'))))
+        self.assertTrue(position(('end', 'a')) < position(('start', os.path.join('a', 'x'))))
+        self.assertTrue(position(('end', os.path.join('a', 'b'))) < position(('start', os.path.join('a', 'b', 'c'))))
+        self.assertTrue(position(('start', 'other')) < position(('end', 'a')))
+    
+    def test_failure(self):
+        events = []
+        failed = {}
+        execution = executor.Executor(workers=2)
+        execution.handler = lambda action, error: failed.__setitem__(action.relpath, error)
+        execution.run([FakeAction('a', events, fail=True), FakeAction(os.path.join('a', 'b'), events), FakeAction('c', events)])
+        self.assertIsInstance(failed['a'], IOError)
+        self.assertIsInstance(failed[os.path.join('a', 'b')], executor.ExecutionError)
+        self.assertIsNone(failed['c'])
+        self.assertNotIn(('start', os.path.join('a', 'b')), events)
+    
+    def test_replace(self):
+        root = tempfile.mkdtemp()
+        try:
+            src = os.path.join(root, 'src')
+            tgt = os.path.join(root, 'tgt')
+            os.makedirs(os.path.join(src, 'object'))
+            open(os.path.join(src, 'object', 'file'), 'w').close()
+            os.makedirs(tgt)
+            open(os.path.join(tgt, 'object'), 'w').close()
+            paths = ('object', os.path.join(src, 'object'), os.path.join(tgt, 'object'))
+            results = executor.Executor(workers=4).run([action.CopyAction(*paths), action.RemoveAction(*paths)])
+            self.assertTrue(all(result.error is None for result in results))
+            self.assertTrue(os.path.isfile(os.path.join(tgt, 'object', 'file')))
+        finally:
+            shutil.rmtree(root)
+
+    
+    def test_stagedFailure(self):
+        root = tempfile.mkdtemp()
+        try:
+            engine = _FailingCommitEngine(staged=True, durability=copyengine.Durability(every=3))
+            actions = []
+            for name in ('a', 'b', 'bad', 'c', 'd', 'e'):
+                open(os.path.join(root, 'src-' + name), 'w').close()
+                a = action.CopyAction(name, os.path.join(root, 'src-' + name), os.path.join(root, name))
+                a.engine = engine
+                actions.append(a)
+            failed = {}
+            execution = executor.Executor(workers=2)
+            execution.handler = lambda a, error: failed.__setitem__(a.relpath, error)
+            results = execution.run(actions)  # The batches renamed during the other actions, and at the end
+            self.assertEqual(6, len(results))
+            self.assertEqual(['bad'], [result.action.relpath for result in results if result.error is not None])
+            self.assertEqual(errno.EACCES, failed.pop('bad').errno)
+            self.assertEqual([None] * 5, list(failed.values()))
+            self.assertEqual(['a', 'b', 'c', 'd', 'e'], sorted(name for name in os.listdir(root) if not name.startswith('src-')))
+        finally:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
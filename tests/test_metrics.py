@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the metrics of analyze and execution.'''
+
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import executor
+import metrics
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestRegistry(unittest.TestCase):
+    
+    def test_prometheus(self):
+        registry = metrics.Registry()
+        registry.counter('requests_total', 'Requests.').inc(2, path='a"b')
+        registry.gauge('ratio', function=lambda: 0.5)
+        histogram = registry.histogram('latency_seconds', buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        text = registry.toPrometheus()
+        self.assertIn('# TYPE requests_total counter\n', text)
+        self.assertIn('requests_total{path="a\\"b"} 2\n', text)
+        self.assertIn('ratio 0.5\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('latency_seconds_count 3\n', text)
+        self.assertIn('latency_seconds_sum 5.55\n', text)
+    
+    def test_json(self):
+        registry = metrics.Registry()
+        registry.counter('requests_total').inc()
+        path = os.path.join(tempfile.mkdtemp(), 'metrics.json')
+        try:
+            registry.writeJson(path)
+            with open(path) as f:
+                obj = json.load(f)
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+        self.assertEqual([{'labels': {}, 'value': 1}], obj['metrics']['requests_total']['values'])
+
+
+class TestRecord(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        now = time.time()
+        write(os.path.join(self.src, 'same'), 'same', mtime=now)
+        write(os.path.join(self.tgt, 'same'), 'same', mtime=now)
+        write(os.path.join(self.src, 'folder', 'add'), 'added')
+        write(os.path.join(self.tgt, 'folder', 'remove'), 'removed!')
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def test_analyzeAndExecute(self):
+        registry = metrics.Registry()
+        analyzer = action.Analyzer(self.src, self.tgt, metrics=registry)
+        found = []
+        analyzer.handler = found.append
+        analyzer.run()
+        self.assertEqual(4, registry.counter('synchronizer_entries_scanned_total').get())
+        self.assertEqual(4, registry.counter('synchronizer_folders_listed_total').get())
+        self.assertEqual(1, registry.counter('synchronizer_actions_total').get(type='CopyAction'))
+        self.assertEqual(4, registry.counter('synchronizer_bytes_total').get(operation='skipped'))
+        self.assertTrue(registry.gauge('synchronizer_entries_scanned_per_second').get() > 0)
+        
+        executor.Executor(metrics=registry).run(found)
+        self.assertEqual(5, registry.counter('synchronizer_bytes_total').get(operation='copied'))
+        self.assertEqual(8, registry.counter('synchronizer_bytes_total').get(operation='deleted'))
+        self.assertEqual(1, registry.histogram('synchronizer_action_seconds').count(type='RemoveAction'))
+        self.assertEqual(2, sum(value['value'] for value in registry.snapshot()['synchronizer_actions_executed_total']['values']))
+
+    
+    def test_ordered(self):
+        registry = metrics.Registry()
+        analyzer = action.Analyzer(self.src, self.tgt, ordered=True, workers=2, metrics=registry)
+        found = []
+        analyzer.handler = found.append
+        analyzer.run()
+        self.assertEqual(2, len(found))
+        self.assertEqual(len(found), sum(value['value'] for value in registry.snapshot()['synchronizer_actions_total']['values']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the detection of moved objects.'''
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import executor
+import moves
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+def analyze(src, tgt, index=None):
+    found = []
+    analyzer = action.Analyzer(src, tgt, ordered=True, index=index)
+    analyzer.handler = found.append
+    analyzer.run()
+    return analyzer, found
+
+
+class TestMoves(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        old = time.time() - 100
+        for folder in (self.src, self.tgt):
+            write(os.path.join(folder, 'folder', 'big'), 'x' * 100000, mtime=old)
+            write(os.path.join(folder, 'folder', 'small'), 'small', mtime=old)
+            write(os.path.join(folder, 'file'), 'content' * 10000, mtime=old)
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def assertSynchronized(self):
+        for root, folders, files in os.walk(self.src):
+            for name in files:
+                path = os.path.join(root, name)
+                with open(path) as f, open(os.path.join(self.tgt, os.path.relpath(path, self.src))) as g:
+                    self.assertEqual(f.read(), g.read())
+        self.assertEqual(sorted(os.path.relpath(os.path.join(root, name), self.src) for root, folders, files in os.walk(self.src) for name in folders + files),
+                         sorted(os.path.relpath(os.path.join(root, name), self.tgt) for root, folders, files in os.walk(self.tgt) for name in folders + files))
+    
+    def test_digest(self):
+        os.rename(os.path.join(self.src, 'file'), os.path.join(self.src, 'folder', 'renamed'))
+        found = moves.detect(analyze(self.src, self.tgt)[1])
+        self.assertEqual([('RenameAction', os.path.join('.', 'folder', 'renamed'), os.path.join('.', 'file'))],
+                         [(a.__class__.__name__, a.relpath, a.fromRelpath) for a in found])
+        executor.Executor().run(found)
+        self.assertSynchronized()
+    
+    def test_folder(self):
+        # Paired by listing, without index
+        os.rename(os.path.join(self.src, 'folder'), os.path.join(self.src, 'moved'))
+        found = moves.detect(analyze(self.src, self.tgt)[1])
+        self.assertEqual([('RenameAction', os.path.join('.', 'moved'), os.path.join('.', 'folder'))],
+                         [(a.__class__.__name__, a.relpath, a.fromRelpath) for a in found])
+        executor.Executor().run(found)
+        self.assertSynchronized()
+    
+    def test_small(self):
+        # Copied again: cheaper than reading both files
+        os.rename(os.path.join(self.src, 'folder', 'small'), os.path.join(self.src, 'folder', 'renamed'))
+        found = moves.detect(analyze(self.src, self.tgt)[1])
+        self.assertEqual(['CopyAction', 'RemoveAction'], [a.__class__.__name__ for a in found])
+    
+    def test_inode(self):
+        index = os.path.join(self.root, 'index')
+        for folder in (self.src, self.tgt, os.path.join(self.src, 'folder'), os.path.join(self.tgt, 'folder')):
+            os.utime(folder, (time.time() - 100, time.time() - 100))
+        analyze(self.src, self.tgt, index)
+        
+        os.rename(os.path.join(self.src, 'folder'), os.path.join(self.src, 'moved'))
+        write(os.path.join(self.src, 'moved', 'new'), 'new')
+        analyzer, found = analyze(self.src, self.tgt, index)
+        found = moves.detect(found, analyzer.srcIndex, minSize=10 ** 9)
+        self.assertEqual([('RenameAction', os.path.join('.', 'moved')), ('CopyAction', os.path.join('.', 'moved', 'new'))],
+                         [(a.__class__.__name__, a.relpath) for a in found])
+        self.assertEqual(100005, found[0].size)
+        executor.Executor().run(found)
+        self.assertSynchronized()
+    
+    def test_compareContent(self):
+        # The moved folder is compared like the analyze
+        index = os.path.join(self.root, 'index')
+        analyze(self.src, self.tgt, index)
+        os.rename(os.path.join(self.src, 'folder'), os.path.join(self.src, 'moved'))
+        small = os.path.join(self.src, 'moved', 'small')
+        mtime = os.path.getmtime(small)
+        write(small, 'SMALL', mtime=mtime)
+        analyzer, found = analyze(self.src, self.tgt, index)
+        found = moves.detect(found, analyzer.srcIndex, minSize=10 ** 9, compare=action.Analyzer.CONTENT)
+        self.assertEqual([('RenameAction', os.path.join('.', 'moved')), ('UpdateAction', os.path.join('.', 'moved', 'small'))],
+                         [(a.__class__.__name__, a.relpath) for a in found])
+
+
+if __name__ == '__main__':
+    unittest.main()
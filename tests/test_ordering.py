@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the ordering of actions by physical locality.'''
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import action
+import copyengine
+import executor
+import ordering
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+def fiemap():
+    '''@return: True if the temporary folder gives the extents of files.'''
+    path = tempfile.mktemp()
+    write(path, 'x' * 8192)
+    try:
+        ordering.firstExtent(path)
+        return True
+    except (IOError, OSError):
+        return False
+    finally:
+        os.remove(path)
+
+
+class TestOrdering(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        for name in ('c', os.path.join('b', 'file'), 'a', 'd'):
+            write(os.path.join(self.src, name), name * 8192)
+        write(os.path.join(self.tgt, 'removed', 'file'))
+        write(os.path.join(self.tgt, 'old'))
+        os.makedirs(os.path.join(self.tgt, 'b'))
+        found = []
+        analyzer = action.Analyzer(self.src, self.tgt)
+        analyzer.handler = found.append
+        analyzer.run()
+        self.actions = found
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def _names(self, actions):
+        return [os.path.normpath(a.relpath) for a in actions]
+    
+    def _check(self, method, location):
+        ordered = ordering.order(self.actions, method)
+        self.assertEqual(['old', 'removed'], self._names(ordered[:2]))
+        reads = ordered[2:]
+        self.assertEqual(4, len(reads))
+        # Grouped by folder of target, in order of their first file, then by location
+        folders = [os.path.dirname(os.path.normpath(a.tgtPath)) for a in reads]
+        starts = [i for i in range(len(reads)) if i == 0 or folders[i - 1] != folders[i]]
+        self.assertEqual(len(set(folders)), len(starts))
+        self.assertEqual(sorted(starts, key=lambda i: location(reads[i].srcPath)), starts)
+        for start, end in zip(starts, starts[1:] + [len(reads)]):
+            self.assertEqual(sorted(reads[start:end], key=lambda a: location(a.srcPath)), reads[start:end])
+        return ordered
+    
+    def test_inode(self):
+        self._check(ordering.INODE, lambda path: os.stat(path).st_ino)
+    
+    @unittest.skipUnless(fiemap(), 'FIEMAP unsupported')
+    def test_fiemap(self):
+        ordered = self._check(ordering.FIEMAP, ordering.firstExtent)
+        self.assertTrue(ordering.seekDistance([a.srcPath for a in ordered[2:]]) <= ordering.seekDistance([a.srcPath for a in reversed(ordered[2:])]))
+    
+    def test_links(self):
+        first = [a for a in self.actions if os.path.normpath(a.relpath) == 'a'][0]
+        copy = [a for a in self.actions if os.path.normpath(a.relpath) == 'd'][0]
+        link = action.LinkAction(copy.relpath, copy.srcPath, copy.tgtPath, copy.srcStat, None, first.tgtPath, first.relpath, copyengine.HARDLINK)
+        actions = [link if a is copy else a for a in self.actions]
+        ordered = ordering.order(actions)
+        self.assertTrue(ordered[-1] is link)  # After its original
+        
+        results = executor.Executor(workers=2).run(ordered, sort=False)
+        self.assertEqual([None] * len(ordered), [result.error for result in results])
+        self.assertEqual(os.stat(first.tgtPath).st_ino, os.stat(link.tgtPath).st_ino)
+
+
+if __name__ == '__main__':
+    unittest.main()
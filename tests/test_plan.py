@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the compact plan.'''
+
+
+import os
+import unittest
+
+import action
+import copyengine
+import plan
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestCompactPlan(unittest.TestCase):
+    
+    def test_roundTrip(self):
+        src = os.path.join('root', 'src')
+        tgt = os.path.join('root', 'tgt')
+        actions = []
+        for i, cls in enumerate((action.CopyAction, action.UpdateAction, action.RemoveAction) * 10):
+            relpath = os.path.join('.', 'folder%d' % (i % 4), 'n\xe4me %d' % i)
+            a = cls(relpath, os.path.join(src, relpath), os.path.join(tgt, relpath))
+            a.size = i * 1000 if i % 5 else None
+            a.files = 1
+            actions.append(a)
+        compact = plan.CompactPlan(src, tgt)
+        for a in actions:
+            compact.append(a)
+        
+        self.assertEqual(30, len(compact))
+        self.assertEqual(sum(a.size for a in actions if a.size), compact.totalSize())
+        for a, copy in zip(actions, compact):
+            self.assertIs(a.__class__, copy.__class__)
+            self.assertEqual((a.relpath, a.srcPath, a.tgtPath, a.size, a.files), (copy.relpath, copy.srcPath, copy.tgtPath, copy.size, copy.files))
+        self.assertEqual(actions[-1].relpath, compact[-1].relpath)
+        self.assertRaises(IndexError, lambda: compact[30])
+    
+    def test_moveAndLinks(self):
+        src = os.path.join('root', 'src')
+        tgt = os.path.join('root', 'tgt')
+        path = lambda root, relpath: os.path.join(root, relpath)
+        rename = action.RenameAction('./new', path(src, './new'), path(tgt, './new'), fromRelpath='./old', fromPath=path(tgt, './old'))
+        link = action.LinkAction('./b', path(src, './b'), path(tgt, './b'), original=path(tgt, './a'), originalRelpath='./a', method=copyengine.HARDLINK)
+        copy = action.CopyAction('./folder', path(src, './folder'), path(tgt, './folder'))
+        copy.links = {path(src, './folder/c'): path(tgt, './a')}
+        copy.linkMethod = copyengine.HARDLINK
+        copy.requires = ['./a']
+        compact = plan.CompactPlan(src, tgt)
+        for a in (rename, link, copy):
+            a.size, a.files, a.allocated = 8192, 1, 12288
+            compact.append(a)
+        
+        rename2, link2, copy2 = compact
+        self.assertEqual(('./old', path(tgt, './old')), (rename2.fromRelpath, rename2.fromPath))
+        self.assertEqual((path(tgt, './a'), copyengine.HARDLINK, ['./a']), (link2.original, link2.method, link2.requires))
+        self.assertEqual((copy.links, copyengine.HARDLINK, ['./a']), (copy2.links, copy2.linkMethod, copy2.requires))
+        self.assertEqual([12288] * 3, [a.allocated for a in compact])
+        self.assertRaises(ValueError, compact.append, action.Action('./x', path(src, './x'), path(tgt, './x')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the model of the list of actions.'''
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import action
+import store
+import throttle
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestActionStore(unittest.TestCase):
+    
+    def setUp(self):
+        self.store = store.ActionStore()
+        self.actions = [action.CopyAction('file%d' % i, None, None) for i in range(3000)]
+        for a in self.actions:
+            self.store.add(a)
+    
+    def test_flush(self):
+        self.assertEqual(0, len(self.store))
+        self.assertTrue(self.store.flush())
+        self.assertFalse(self.store.flush())
+        self.assertEqual(3000, len(self.store))
+        self.assertIs(self.actions[42], self.store[42])
+        self.assertRaises(IndexError, lambda: self.store[3000])
+    
+    def test_popFront(self):
+        self.store.flush()
+        for a in self.actions[:2000]:
+            self.assertIs(a, self.store.popFront())
+        self.assertEqual(1000, len(self.store))
+        self.assertIs(self.actions[2000], self.store[0])
+        self.assertEqual(self.actions[2000:], list(self.store))
+    
+    def test_discard(self):
+        self.store.flush()
+        for a in self.actions[:10] + self.actions[20:30]:
+            self.store.discard(a)
+        self.assertEqual(3000, len(self.store))
+        self.assertTrue(self.store.flush())
+        self.assertEqual(self.actions[10:20] + self.actions[30:], list(self.store))
+    
+    def test_removeRows(self):
+        self.store.flush()
+        self.store.removeRows([0, 2, 2999])
+        self.assertEqual(2997, len(self.store))
+        self.assertEqual([self.actions[1]] + self.actions[3:2999], list(self.store))
+
+    
+    def test_execute(self):
+        root = tempfile.mkdtemp()
+        engineThrottle = action.Action.engine.throttle
+        try:
+            actions = [action.CopyAction(name, os.path.join(root, 'src', name), os.path.join(root, 'tgt', name)) for name in ('a', 'b', 'c')]
+            for a in actions:
+                write(a.srcPath, a.relpath)
+                self.store.add(a)
+            self.store.flush()
+            os.makedirs(os.path.join(root, 'tgt'))
+            limits = throttle.Throttle()
+            progress = []
+            done = self.store.execute(actions, limits, progress=progress.append, stopped=lambda: len(progress) == 2)
+            self.assertEqual(2, done)
+            self.assertEqual([1, 2], progress)
+            self.assertIs(limits, action.Action.engine.throttle)
+            self.assertEqual(['a', 'b'], sorted(os.listdir(os.path.join(root, 'tgt'))))
+            self.store.flush()
+            self.assertEqual(self.actions + actions[2:], list(self.store))
+        finally:
+            action.Action.engine.throttle = engineThrottle
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the limits of execution.'''
+
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import copyengine
+import executor
+import throttle
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestThrottle(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def test_bucket(self):
+        bucket = throttle.TokenBucket(1000, 100)
+        self.assertTrue(bucket.take(100) < 0.05)  # Burst
+        self.assertTrue(bucket.take(100) > 0.05)
+        self.assertTrue(bucket.take(300) > 0.05)  # Bigger than burst: a debt
+        start = time.time()
+        bucket.take(1)
+        self.assertTrue(time.time() - start > 0.15)
+        
+        bucket.setRate(None)
+        self.assertTrue(bucket.take(10 ** 9) < 0.01)
+    
+    def test_setRate(self):
+        bucket = throttle.TokenBucket(1, 1)
+        bucket.take(1)
+        waiting = threading.Thread(target=bucket.take, args=(1,))
+        start = time.time()
+        waiting.start()
+        time.sleep(0.05)
+        bucket.setRate(None)  # Wakes the waiting thread
+        waiting.join()
+        self.assertTrue(time.time() - start < 0.5)
+    
+    def test_engine(self):
+        src = os.path.join(self.root, 'src')
+        write(os.path.join(src, 'a'), 'x' * 150000)
+        write(os.path.join(src, 'b'), 'x' * 150000)
+        limits = throttle.Throttle(bytesPerSecond=200000)
+        engine = copyengine.CopyEngine(bufferSize=10000, throttle=limits)
+        self.assertEqual(10000, engine._chunk(150000))  # Copied by buffers in kernel, to wait between them
+        start = time.time()
+        engine.copy(src, os.path.join(self.root, 'dst'))  # 200000 bytes at once, then 100000 bytes limited
+        self.assertTrue(time.time() - start > 0.3)
+        self.assertTrue(limits.waited() > 0.3)
+        with open(os.path.join(self.root, 'dst', 'a')) as f:
+            self.assertEqual(150000, len(f.read()))
+        
+        limits.setLimits(bytesPerSecond=None, operationsPerSecond=1)
+        self.assertEqual(150000, engine._chunk(150000))  # The bytes unlimited: the whole file at once
+        start = time.time()
+        engine.copy(src, os.path.join(self.root, 'dst2'))  # 3 operations
+        self.assertTrue(time.time() - start > 1.5)
+    
+    @unittest.skipUnless(sys.platform.startswith('linux') and hasattr(os, 'getpriority'), 'thread priority of Linux')
+    def test_lowerPriority(self):
+        priorities = []
+        class Probe:
+            relpath = 'probe'
+            size = None
+            def execute(self):
+                priorities.append(os.getpriority(os.PRIO_PROCESS, 0))  # The calling thread, on Linux
+        executor.Executor(workers=1).run([Probe()])
+        executor.Executor(workers=1, lowPriority=True).run([Probe()])
+        self.assertEqual(min(priorities[0] + 10, 19), priorities[1])
+        self.assertEqual(priorities[0], os.getpriority(os.PRIO_PROCESS, 0))  # Other threads unchanged
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the instrumentation of a run.'''
+
+
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+import action
+import executor
+import tracing
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+class TestTracing(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        write(os.path.join(self.src, 'folder', 'file'), 'content')
+        os.makedirs(os.path.join(self.tgt, 'folder'))
+    
+    def tearDown(self):
+        shutil.rmtree(self.root)
+    
+    def test_spans(self):
+        tracer = tracing.Tracer()
+        analyzer = action.Analyzer(self.src, self.tgt, tracer=tracer)
+        found = []
+        analyzer.handler = found.append
+        analyzer.run()
+        executor.Executor(tracer=tracer).run(found)
+        
+        path = os.path.join(self.root, 'trace.json')
+        tracer.write(path)
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        spans = [event for event in events if event['ph'] == 'X']
+        folders = [event['args'] for event in spans if event['name'] == 'folder']
+        self.assertEqual([{'directory': '.', 'entries': 1, 'actions': 0}, {'directory': os.path.join('.', 'folder'), 'entries': 1, 'actions': 1}],
+                         sorted(folders, key=lambda args: args['directory']))
+        self.assertEqual(4, len([event for event in spans if event['name'] == 'scan']))
+        copy, = [event for event in spans if event['cat'] == 'execute']
+        self.assertEqual({'relpath': os.path.join('.', 'folder', 'file'), 'bytes': 7}, copy['args'])
+        self.assertIn('MainThread', [event['args']['name'] for event in events if event['ph'] == 'M'])
+    
+    def test_disabled(self):
+        with tracing.span(None, 'folder', 'analyze') as span:
+            span.args['entries'] = 1
+        self.assertEqual({}, span.args)
+    
+    def test_profile(self):
+        path = os.path.join(self.root, 'profile')
+        with tracing.Profile(path):
+            analyzer = action.Analyzer(self.src, self.tgt, workers=2)
+            analyzer.run()
+        functions = [function for _, _, function in pstats.Stats(path).stats]
+        self.assertIn('_analyzeFolder', functions)
+    
+    @unittest.skipIf(tracing.tracemalloc is None, 'tracemalloc not available')
+    def test_memory(self):
+        path = os.path.join(self.root, 'memory')
+        with tracing.MemoryTrace(path):
+            data = [bytearray(1000) for _ in range(100)]
+        with open(path) as f:
+            self.assertTrue(f.readline().startswith('Current: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
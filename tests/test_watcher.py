@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+'''Test for the continuous synchronization.'''
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import action
+import executor
+import watcher
+from test_analyzer import write
+
+
+__author__ = __maintainer__ = 'Pinguet62'
+__date__ = '2014/08/01'
+__email__ = 'pinguet62@gmail.com'
+__license__ = 'Creative Commons, Attribution NonCommercial ShareAlike, 4.0'
+__status__ = 'Develpment'
+__version__ = '2.0'
+
+
+def waitFor(condition, timeout=10):
+    '''Wait until condition is true, or timeout.'''
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.05)
+    return condition()
+
+
+def read(path):
+    '''@return: The content of file, None if it doesn't exist (replaced).'''
+    try:
+        with open(path) as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+@unittest.skipIf(not watcher.available(), 'inotify not available')
+class TestWatcher(unittest.TestCase):
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'src')
+        self.tgt = os.path.join(self.root, 'tgt')
+        write(os.path.join(self.src, 'folder', 'old'), 'old')
+        os.makedirs(self.tgt)
+        self.executor = executor.Executor(workers=2)
+        self.watcher = watcher.Watcher(self.src, self.tgt, self.executor, delay=0.1, reconcile=None)
+        self.actions = []
+        self.watcher.handler = self.submit
+        self.watcher.start()
+        self.assertTrue(waitFor(lambda: os.path.exists(os.path.join(self.tgt, 'folder', 'old'))))
+    
+    def submit(self, a):
+        self.actions.append(a)
+        self.executor.submit(a)
+    
+    def tearDown(self):
+        self.watcher.stop()
+        self.watcher.join()
+        self.executor.close()
+        shutil.rmtree(self.root)
+    
+    def test_changes(self):
+        write(os.path.join(self.src, 'folder', 'new'), 'new')
+        self.assertTrue(waitFor(lambda: os.path.exists(os.path.join(self.tgt, 'folder', 'new'))))
+        
+        # Compared like the analyze: updated when the target is newer than the source
+        write(os.path.join(self.src, 'folder', 'new'), 'changed', mtime=time.time() - 100)
+        self.assertTrue(waitFor(lambda: read(os.path.join(self.tgt, 'folder', 'new')) == 'changed'))
+        
+        os.remove(os.path.join(self.src, 'folder', 'old'))
+        self.assertTrue(waitFor(lambda: not os.path.exists(os.path.join(self.tgt, 'folder', 'old'))))
+        self.assertEqual(1, self.watcher.reconciliations)
+    
+    def test_content(self):
+        # The options of analyze are used by the comparison of changed paths
+        self.watcher.stop()
+        self.watcher.join()
+        self.watcher = watcher.Watcher(self.src, self.tgt, self.executor, delay=0.1, reconcile=None, compare=action.Analyzer.CONTENT)
+        self.watcher.handler = self.submit
+        self.watcher.start()
+        time.sleep(0.3)
+        path = os.path.join(self.src, 'folder', 'old')
+        write(path, 'new', mtime=os.path.getmtime(path))  # Same size and time
+        self.assertTrue(waitFor(lambda: read(os.path.join(self.tgt, 'folder', 'old')) == 'new'))
+    
+    def test_newFolder(self):
+        # The content written in a burst is coalesced: the new folder is copied once
+        os.makedirs(os.path.join(self.src, 'a', 'b'))
+        for i in range(20):
+            write(os.path.join(self.src, 'a', 'b', 'file%d' % i))
+        self.assertTrue(waitFor(lambda: len(os.listdir(os.path.join(self.tgt, 'a', 'b'))) == 20 if os.path.isdir(os.path.join(self.tgt, 'a', 'b')) else False))
+        time.sleep(0.3)
+        self.assertEqual([os.path.join('.', 'a')], [a.relpath for a in self.actions[1:]])
+        
+        shutil.rmtree(os.path.join(self.src, 'a'))
+        self.assertTrue(waitFor(lambda: not os.path.exists(os.path.join(self.tgt, 'a'))))
+
+
+if __name__ == '__main__':
+    unittest.main()